@@ -1,10 +1,26 @@
 import os
 import sys
 import json
+import argparse
+import math
+import signal
+import subprocess
 import logging
 import asyncio
+import codecs
+import contextlib
+import hashlib
+import random
+import re
+import time
+import unicodedata
+from datetime import datetime, timezone
+from collections import Counter, OrderedDict, defaultdict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import aiohttp
 import discord
-import requests
+from aiohttp import web
 
 # n8n message processing webhook
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
@@ -16,16 +32,146 @@ DISCORD_BOT_SYNC_SECRET = os.getenv("DISCORD_BOT_SYNC_SECRET")
 # Correct Supabase usage increment endpoint
 SERVER_USAGE_INCREMENT_URL = os.getenv("SERVER_USAGE_INCREMENT_URL")  # should be discord-message-usage
 
+# Shared outbound HTTP pool (n8n + Supabase)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "50"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+N8N_TIMEOUT_SECONDS = float(os.getenv("N8N_TIMEOUT_SECONDS", "30"))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+
+# Resilience for the n8n webhook: retries, circuit breaker, optional hedging
+N8N_RETRIES = int(os.getenv("N8N_RETRIES", "2"))
+N8N_RETRY_BASE_SECONDS = float(os.getenv("N8N_RETRY_BASE_SECONDS", "0.5"))
+N8N_RETRY_MAX_SECONDS = float(os.getenv("N8N_RETRY_MAX_SECONDS", "5"))
+N8N_BREAKER_FAILURES = int(os.getenv("N8N_BREAKER_FAILURES", "5"))
+N8N_BREAKER_RESET_SECONDS = float(os.getenv("N8N_BREAKER_RESET_SECONDS", "30"))
+N8N_UNAVAILABLE_MESSAGE = os.getenv(
+    "N8N_UNAVAILABLE_MESSAGE", "Deploying fix... my brain is restarting, please ask again in a minute."
+)
+N8N_WEBHOOK_URL_SECONDARY = os.getenv("N8N_WEBHOOK_URL_SECONDARY")
+N8N_HEDGE_PERCENTILE = float(os.getenv("N8N_HEDGE_PERCENTILE", "0.95"))
+N8N_HEDGE_MIN_SECONDS = float(os.getenv("N8N_HEDGE_MIN_SECONDS", "2"))
+
+# Streaming replies from n8n (chunked text or n8n's JSON-lines stream)
+N8N_STREAMING = os.getenv("N8N_STREAMING", "0") == "1"
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.0"))
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Guild sync backfill
+GUILD_MESSAGE_LIMIT = 3000
+GUILD_SYNC_CONCURRENCY = int(os.getenv("GUILD_SYNC_CONCURRENCY", "5"))
+GUILD_SYNC_STATE_PATH = os.getenv("GUILD_SYNC_STATE_PATH", "guild_sync_state.json")
+
+# Local quota enforcement. Off until Supabase exposes a usage/quota read
+# endpoint (SERVER_QUOTA_URL); the guild sync response does not report usage.
+QUOTA_ENFORCEMENT = os.getenv("QUOTA_ENFORCEMENT", "0") == "1"
+SERVER_QUOTA_URL = os.getenv("SERVER_QUOTA_URL")
+QUOTA_REFRESH_SECONDS = float(os.getenv("QUOTA_REFRESH_SECONDS", "300"))
+QUOTA_NOTICE_INTERVAL_SECONDS = float(os.getenv("QUOTA_NOTICE_INTERVAL_SECONDS", "3600"))
+QUOTA_EXCEEDED_MESSAGE = os.getenv(
+    "QUOTA_EXCEEDED_MESSAGE",
+    "This server has used up its Gravilo messages for now. An admin can check the plan on the dashboard.",
+)
+
+# Live knowledge ingest: new, edited and deleted messages go to the Discord
+# ingest workflow in small batches instead of waiting for an indexer run
+LIVE_INGEST = os.getenv("LIVE_INGEST", "0") == "1"
+N8N_INGEST_WEBHOOK_URL = os.getenv("N8N_INGEST_WEBHOOK_URL")
+LIVE_INGEST_FLUSH_SECONDS = float(os.getenv("LIVE_INGEST_FLUSH_SECONDS", "5"))
+LIVE_INGEST_MAX_EVENTS = int(os.getenv("LIVE_INGEST_MAX_EVENTS", "200"))
+
+# Usage accounting is coalesced per guild and flushed as amount=N
+USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "30"))
+USAGE_FLUSH_MAX_PENDING = int(os.getenv("USAGE_FLUSH_MAX_PENDING", "500"))
+USAGE_SPOOL_PATH = os.getenv("USAGE_SPOOL_PATH", "usage_spool.json")
+
+
+def _env_id_set(name: str) -> Set[str]:
+    return {part.strip() for part in os.getenv(name, "").split(",") if part.strip()}
+
+
+# Local pre-filter in front of the Gatekeeper workflow
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "1") == "1"
+PREFILTER_MIN_LENGTH = int(os.getenv("PREFILTER_MIN_LENGTH", "8"))
+PREFILTER_ALLOW_CHANNELS = _env_id_set("PREFILTER_ALLOW_CHANNELS")
+PREFILTER_DENY_CHANNELS = _env_id_set("PREFILTER_DENY_CHANNELS")
+
+# Admission control between Discord events and n8n dispatch
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+SCHEDULER_GUILD_CONCURRENCY = int(os.getenv("SCHEDULER_GUILD_CONCURRENCY", "4"))
+SCHEDULER_GUILD_QUEUE = int(os.getenv("SCHEDULER_GUILD_QUEUE", "50"))
+SCHEDULER_CHANNEL_QUEUE = int(os.getenv("SCHEDULER_CHANNEL_QUEUE", "20"))
+SCHEDULER_SHED_POLICY = os.getenv("SCHEDULER_SHED_POLICY", "drop_oldest")  # or "busy"
+SCHEDULER_BUSY_MESSAGE = os.getenv(
+    "SCHEDULER_BUSY_MESSAGE", "I'm a bit swamped right now — please try again in a moment."
+)
+SCHEDULER_BUSY_NOTICE_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_BUSY_NOTICE_INTERVAL_SECONDS", "60"))
+
+# Per-author debounce: merge quick consecutive messages into one dispatch
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "0"))
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", "8"))
+
+# Answer cache for repeated questions
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MIN_LENGTH = int(os.getenv("ANSWER_CACHE_MIN_LENGTH", "15"))
+
+# Internal HTTP endpoint (metrics, cache invalidation)
+BRIDGE_HTTP_HOST = os.getenv("BRIDGE_HTTP_HOST", "0.0.0.0")
+BRIDGE_HTTP_PORT = int(os.getenv("BRIDGE_HTTP_PORT", "8080"))
+# Set by the launcher: the other workers' HTTP ports, so a cache invalidation
+# sent to any one worker reaches every worker's cache.
+BRIDGE_PEER_PORTS = [int(p) for p in os.getenv("BRIDGE_PEER_PORTS", "").split(",") if p.strip()]
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+
+def parse_shard_ids(value: str) -> Optional[List[int]]:
+    """Parse "0,1,2" or "0-3" (or a mix) into a list of shard IDs."""
+    if not value.strip():
+        return None
+    ids: List[int] = []
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            ids.append(int(part))
+    return ids
+
+
+# Gateway sharding. SHARD_COUNT / SHARD_IDS are normally set per worker by the
+# launcher (python bridge.py --workers N); BRIDGE_SHARDED=1 alone lets
+# discord.py pick the recommended shard count for a single process.
+BRIDGE_SHARDED = os.getenv("BRIDGE_SHARDED", "0") == "1"
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+BRIDGE_WORKER = os.getenv("BRIDGE_WORKER", "")
+WORKER_RESTART_SECONDS = float(os.getenv("WORKER_RESTART_SECONDS", "5"))
 
 # Basic config
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
-client = discord.Client(intents=intents)
+
+
+def build_client() -> discord.Client:
+    if BRIDGE_SHARDED or SHARD_COUNT or SHARD_IDS:
+        if SHARD_IDS:
+            return discord.AutoShardedClient(
+                intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS
+            )
+        return discord.AutoShardedClient(intents=intents, shard_count=SHARD_COUNT)
+    return discord.Client(intents=intents)
+
+
+client = build_client()
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    format=f"%(asctime)s %(levelname)s %(name)s{'[w' + BRIDGE_WORKER + ']' if BRIDGE_WORKER else ''} %(message)s",
     stream=sys.stdout,
 )
 logger = logging.getLogger("bridge")
@@ -43,48 +189,495 @@ def _build_guild_icon_url(guild: discord.Guild):
     return icon_url
 
 
-def guild_sync_request(guild: discord.Guild):
-    if not DISCORD_GUILD_SYNC_URL or not DISCORD_BOT_SYNC_SECRET:
-        logger.warning("[Guild Sync] Missing guild sync config — skipping")
-        return
+# --- Metrics ----------------------------------------------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
 
-    payload = {
+
+class Histogram:
+    """Cumulative latency histogram rendered in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.stage_latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.requests: Counter = Counter()  # (stage, status) -> count
+        self.in_flight: Counter = Counter()  # stage -> gauge
+        self.loop_lag = 0.0
+
+    def observe(self, stage: str, seconds: float):
+        self.stage_latency[stage].observe(seconds)
+
+    @contextlib.contextmanager
+    def track(self, stage: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    @contextlib.contextmanager
+    def track_request(self, stage: str):
+        """Time an outbound request. The block yields a dict; set ``status``."""
+        result: Dict[str, object] = {"status": "error"}
+        self.in_flight[stage] += 1
+        start = time.monotonic()
+        try:
+            yield result
+        finally:
+            self.in_flight[stage] -= 1
+            self.observe(stage, time.monotonic() - start)
+            self.requests[(stage, str(result["status"]))] += 1
+
+
+metrics = Metrics()
+
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Return the process-wide aiohttp session, creating it on first use."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector)
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+async def post_json(url, payload, headers=None, timeout=SUPABASE_TIMEOUT_SECONDS,
+                    stage="http") -> Tuple[int, str]:
+    """POST a JSON payload on the shared session and return (status, body)."""
+    session = await get_http_session()
+    with metrics.track_request(stage) as result:
+        async with session.post(
+            url,
+            json=payload,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as resp:
+            result["status"] = resp.status
+            return resp.status, await resp.text()
+
+
+def build_guild_sync_payload(guild: discord.Guild) -> Dict[str, object]:
+    return {
         "discord_guild_id": str(guild.id),
         "discord_owner_id": str(getattr(guild, "owner_id", "")),
         "name": guild.name,
         "icon_url": _build_guild_icon_url(guild),
-        "message_limit": 3000,
+        "message_limit": GUILD_MESSAGE_LIMIT,
     }
 
+
+class N8nStatusError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"n8n returned {status}")
+        self.status = status
+        self.body = body
+
+
+def _parse_stream_line(line: str) -> str:
+    """Extract text from one line of n8n's JSON-lines stream."""
+    line = line.strip()
+    if not line:
+        return ""
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return line
+    if isinstance(event, dict):
+        if event.get("type") in (None, "item"):
+            return str(event.get("content") or event.get("output") or "")
+        return ""
+    return str(event)
+
+
+async def stream_n8n(url, payload) -> AsyncIterator[str]:
+    """Yield the n8n reply as text chunks as they arrive.
+
+    Plain chunked bodies are passed through unchanged. A body that starts with
+    ``{`` is treated as n8n's streaming format (one JSON event per line, text
+    in ``content`` of ``item`` events).
+    """
+    session = await get_http_session()
+    with metrics.track_request("n8n") as result:
+        async with session.post(
+            url,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=N8N_TIMEOUT_SECONDS),
+        ) as resp:
+            result["status"] = resp.status
+            if resp.status != 200:
+                raise N8nStatusError(resp.status, await resp.text())
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            json_lines: Optional[bool] = None
+            buffer = ""
+            async for raw in resp.content.iter_any():
+                text = decoder.decode(raw)
+                if json_lines is None:
+                    if not text.strip():
+                        buffer += text
+                        continue
+                    json_lines = (buffer + text).lstrip().startswith("{")
+                if not json_lines:
+                    yield buffer + text
+                    buffer = ""
+                    continue
+                buffer += text
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    chunk = _parse_stream_line(line)
+                    if chunk:
+                        yield chunk
+            buffer += decoder.decode(b"", final=True)
+            if buffer:
+                chunk = _parse_stream_line(buffer) if json_lines else buffer
+                if chunk:
+                    yield chunk
+
+
+def split_message(text: str, limit=DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Split text into Discord-sized parts, preferring line then word breaks."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text.strip():
+        parts.append(text)
+    return parts
+
+
+async def send_answer(channel, text: str):
+    for part in split_message(text):
+        with metrics.track("discord_send"):
+            await channel.send(part)
+
+
+class StreamingReply:
+    """Renders a growing answer into Discord messages.
+
+    The first chunk is posted immediately; later chunks edit the last message
+    at most every ``edit_interval`` seconds. Text past Discord's length limit
+    continues in follow-up messages.
+    """
+
+    def __init__(self, channel, edit_interval=STREAM_EDIT_INTERVAL_SECONDS):
+        self.channel = channel
+        self.edit_interval = edit_interval
+        self.text = ""
+        self.messages: List[discord.Message] = []
+        self._rendered: List[str] = []
+        self._last_render = 0.0
+
+    async def feed(self, chunk: str):
+        self.text += chunk
+        if not self.messages or time.monotonic() - self._last_render >= self.edit_interval:
+            await self._render()
+
+    async def finish(self) -> str:
+        await self._render()
+        return self.text.strip()
+
+    async def _render(self):
+        parts = split_message(self.text.strip())
+        for i, part in enumerate(parts):
+            if i < len(self.messages):
+                if self._rendered[i] != part:
+                    with metrics.track("discord_send"):
+                        await self.messages[i].edit(content=part)
+                    self._rendered[i] = part
+            else:
+                with metrics.track("discord_send"):
+                    self.messages.append(await self.channel.send(part))
+                self._rendered.append(part)
+        self._last_render = time.monotonic()
+
+
+# --- n8n resilience ---------------------------------------------------------
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failed attempts in a row the breaker opens and
+    calls fail fast. Once ``reset_timeout`` has passed one trial call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=N8N_BREAKER_FAILURES, reset_timeout=N8N_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning("[n8n] Circuit breaker opened after %d failure(s)", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+n8n_breaker = CircuitBreaker()
+n8n_latency_samples: Deque[float] = deque(maxlen=500)
+n8n_events: Counter = Counter()  # retries, hedges, hedge wins
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, N8nStatusError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+def _retry_delay(attempt: int) -> float:
+    """Full-jitter exponential back-off."""
+    cap = min(N8N_RETRY_MAX_SECONDS, N8N_RETRY_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _hedge_delay() -> float:
+    if not n8n_latency_samples:
+        return max(N8N_HEDGE_MIN_SECONDS, N8N_TIMEOUT_SECONDS / 2)
+    ordered = sorted(n8n_latency_samples)
+    index = min(len(ordered) - 1, int(N8N_HEDGE_PERCENTILE * len(ordered)))
+    return max(N8N_HEDGE_MIN_SECONDS, ordered[index])
+
+
+async def _post_n8n_once(url, payload) -> str:
+    start = time.monotonic()
+    status, body = await post_json(url, payload, timeout=N8N_TIMEOUT_SECONDS, stage="n8n")
+    if status != 200:
+        raise N8nStatusError(status, body)
+    if url == N8N_WEBHOOK_URL:
+        n8n_latency_samples.append(time.monotonic() - start)
+    return body
+
+
+async def _post_n8n_hedged(payload) -> str:
+    """POST to the primary webhook; if it is slower than usual, race the secondary."""
+    if not N8N_WEBHOOK_URL_SECONDARY:
+        return await _post_n8n_once(N8N_WEBHOOK_URL, payload)
+
+    primary = asyncio.ensure_future(_post_n8n_once(N8N_WEBHOOK_URL, payload))
+    done, _ = await asyncio.wait({primary}, timeout=_hedge_delay())
+    if done:
+        return primary.result()
+
+    n8n_events["hedges"] += 1
+    secondary = asyncio.ensure_future(_post_n8n_once(N8N_WEBHOOK_URL_SECONDARY, payload))
+    pending = {primary, secondary}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is secondary:
+                        n8n_events["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_n8n(payload) -> str:
+    """POST a message to n8n with retries, circuit breaking and optional hedging.
+
+    Returns the response body. Raises CircuitOpenError while the breaker is
+    open, N8nStatusError for error statuses, or the last transport error.
+    """
+    if not n8n_breaker.allow():
+        raise CircuitOpenError()
+
+    for attempt in range(N8N_RETRIES + 1):
+        try:
+            body = await _post_n8n_hedged(payload)
+        except Exception as e:
+            if not _is_transient(e):
+                if isinstance(e, N8nStatusError):
+                    # n8n answered, it just rejected this request
+                    n8n_breaker.record_success()
+                else:
+                    n8n_breaker.record_failure()
+                raise
+            n8n_breaker.record_failure()
+            if attempt >= N8N_RETRIES or n8n_breaker.state == CircuitBreaker.OPEN:
+                raise
+            n8n_events["retries"] += 1
+            delay = _retry_delay(attempt)
+            logger.warning("[n8n] Transient error (%s); retry %d in %.2fs", e, attempt + 1, delay)
+            await asyncio.sleep(delay)
+        else:
+            n8n_breaker.record_success()
+            return body
+    raise AssertionError("unreachable")
+
+
+async def guild_sync_request(guild: discord.Guild, payload=None) -> bool:
+    if not DISCORD_GUILD_SYNC_URL or not DISCORD_BOT_SYNC_SECRET:
+        logger.warning("[Guild Sync] Missing guild sync config — skipping")
+        return False
+
+    if payload is None:
+        payload = build_guild_sync_payload(guild)
+
     headers = {
         "Content-Type": "application/json",
         "x-bot-secret": DISCORD_BOT_SYNC_SECRET,
     }
 
     try:
-        resp = requests.post(
-            DISCORD_GUILD_SYNC_URL, headers=headers, data=json.dumps(payload), timeout=10
+        status, body = await post_json(
+            DISCORD_GUILD_SYNC_URL, payload, headers=headers, stage="guild_sync"
         )
-        if resp.status_code < 300:
+        if status < 300:
             logger.info("[Guild Sync] Synced guild %s (%s)", guild.name, guild.id)
-        else:
-            logger.warning(
-                "[Guild Sync] FAILED: status %s body=%s", resp.status_code, resp.text
-            )
+            return True
+        logger.warning("[Guild Sync] FAILED: status %s body=%s", status, body)
     except Exception as e:
         logger.error("[Guild Sync] Exception: %s", e)
+    return False
 
 
-async def guild_sync(guild: discord.Guild):
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, guild_sync_request, guild)
+def _load_guild_sync_state() -> Dict[str, str]:
+    if not GUILD_SYNC_STATE_PATH or not os.path.exists(GUILD_SYNC_STATE_PATH):
+        return {}
+    try:
+        with open(GUILD_SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            return {str(k): str(v) for k, v in json.load(f).items()}
+    except Exception as e:
+        logger.error("[Guild Sync] Could not read state %s: %s", GUILD_SYNC_STATE_PATH, e)
+        return {}
 
 
-async def increment_usage(server_id, amount=1):
-    """Call Supabase usage tracking function."""
-    if not SERVER_USAGE_INCREMENT_URL or not DISCORD_BOT_SYNC_SECRET:
-        logger.warning("[Usage] Missing SERVER_USAGE_INCREMENT_URL or DISCORD_BOT_SYNC_SECRET")
+def _save_guild_sync_state():
+    if not GUILD_SYNC_STATE_PATH:
         return
+    try:
+        tmp_path = GUILD_SYNC_STATE_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(guild_sync_state, f)
+        os.replace(tmp_path, GUILD_SYNC_STATE_PATH)
+    except Exception as e:
+        logger.error("[Guild Sync] Could not write state %s: %s", GUILD_SYNC_STATE_PATH, e)
+
+
+def guild_payload_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# guild_id -> hash of the last payload the sync endpoint accepted
+guild_sync_state: Dict[str, str] = _load_guild_sync_state()
+_guild_sync_semaphore = asyncio.Semaphore(GUILD_SYNC_CONCURRENCY)
+
+
+async def guild_sync(guild: discord.Guild, force=False) -> bool:
+    """Sync one guild, skipping it if nothing changed since the last sync."""
+    payload = build_guild_sync_payload(guild)
+    digest = guild_payload_hash(payload)
+    guild_id = str(guild.id)
+    if not force and guild_sync_state.get(guild_id) == digest:
+        logger.debug("[Guild Sync] Guild %s unchanged; skipping", guild_id)
+        return False
+
+    async with _guild_sync_semaphore:
+        ok = await guild_sync_request(guild, payload)
+    if ok:
+        guild_sync_state[guild_id] = digest
+        _save_guild_sync_state()
+    return ok
+
+
+async def backfill_guilds(guilds):
+    results = await asyncio.gather(*(guild_sync(guild) for guild in guilds))
+    logger.info(
+        "[Guild Sync] Backfill done: %d synced, %d unchanged or failed",
+        sum(results), len(results) - sum(results),
+    )
+
+
+# Outcomes of a usage increment
+USAGE_ACCEPTED = "accepted"
+USAGE_RETRY = "retry"
+USAGE_REJECTED = "rejected"
+
+_usage_config_warned = False
+
+
+async def increment_usage(server_id, amount=1) -> str:
+    """Call Supabase usage tracking function.
+
+    Returns USAGE_ACCEPTED, USAGE_RETRY for transient failures (timeouts,
+    5xx, 408/429) or USAGE_REJECTED when retrying cannot help (missing
+    configuration, other 4xx).
+    """
+    global _usage_config_warned
+    if not SERVER_USAGE_INCREMENT_URL or not DISCORD_BOT_SYNC_SECRET:
+        if not _usage_config_warned:
+            logger.warning("[Usage] Missing SERVER_USAGE_INCREMENT_URL or DISCORD_BOT_SYNC_SECRET; counts are dropped")
+            _usage_config_warned = True
+        return USAGE_REJECTED
 
     payload = {
         "discord_guild_id": str(server_id),
@@ -97,10 +690,1073 @@ async def increment_usage(server_id, amount=1):
     }
 
     try:
-        resp = requests.post(SERVER_USAGE_INCREMENT_URL, json=payload, headers=headers, timeout=10)
-        logger.info("[Usage] Incremented guild %s by %s (status=%s)", server_id, amount, resp.status_code)
+        status, _ = await post_json(
+            SERVER_USAGE_INCREMENT_URL, payload, headers=headers, stage="usage"
+        )
+        logger.info("[Usage] Incremented guild %s by %s (status=%s)", server_id, amount, status)
+        if status < 300:
+            return USAGE_ACCEPTED
+        if 400 <= status < 500 and status not in (408, 429):
+            return USAGE_REJECTED
+        return USAGE_RETRY
     except Exception as e:
         logger.error("[Usage] Error: %s", e)
+        return USAGE_RETRY
+
+
+class UsageAggregator:
+    """Coalesces per-guild message counts and flushes them in batches.
+
+    Counts are flushed every ``flush_interval`` seconds, or sooner once
+    ``max_pending`` messages are waiting. Unsent counts are kept in a spool
+    file so they survive a crash or a Supabase outage, and are merged back in
+    on the next start. The spool is an append-only journal of ``<guild>
+    <count>`` lines: a background writer appends every increment off the
+    event loop, and each flush compacts it to one line per guild still
+    unsent. A crash loses at most the increments the writer has not reached
+    yet. Transient failures are retried on the next flush; rejected counts
+    are dropped.
+    """
+
+    def __init__(self, flush_interval=USAGE_FLUSH_INTERVAL_SECONDS,
+                 max_pending=USAGE_FLUSH_MAX_PENDING, spool_path=USAGE_SPOOL_PATH):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_path = spool_path
+        self.pending: Dict[str, int] = defaultdict(int)
+        self._in_flight: Dict[str, int] = {}
+        self._journal: List[str] = []
+        self._lock = asyncio.Lock()
+        self._io_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._journal_task: Optional[asyncio.Task] = None
+        self._load_spool()
+
+    @property
+    def pending_total(self) -> int:
+        return sum(self.pending.values())
+
+    def add(self, server_id, amount=1):
+        self.pending[str(server_id)] += int(amount)
+        if self.spool_path:
+            self._journal.append(f"{server_id} {int(amount)}\n")
+            if self._journal_task is None or self._journal_task.done():
+                self._journal_task = asyncio.create_task(self._drain_journal())
+        if self.pending_total >= self.max_pending and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            self._in_flight = dict(self.pending)
+            self.pending.clear()
+            await self._save_spool()
+            guild_ids = list(self._in_flight)
+            results = await asyncio.gather(
+                *(increment_usage(gid, self._in_flight[gid]) for gid in guild_ids)
+            )
+            rejected = 0
+            for gid, outcome in zip(guild_ids, results):
+                if outcome == USAGE_RETRY:
+                    self.pending[gid] += self._in_flight[gid]
+                elif outcome == USAGE_REJECTED:
+                    rejected += self._in_flight[gid]
+            if rejected:
+                logger.error("[Usage] Dropped %d rejected message count(s)", rejected)
+            self._in_flight = {}
+            await self._save_spool()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._journal_task is not None:
+            await self._journal_task
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("[Usage] Flush failed: %s", e)
+
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            if text.lstrip().startswith("{"):  # JSON snapshot from older versions
+                for gid, count in json.loads(text).items():
+                    self.pending[str(gid)] += int(count)
+            else:
+                for line in text.splitlines(keepends=True):
+                    parts = line.split()
+                    # A crash can leave the last line half written
+                    if line.endswith("\n") and len(parts) == 2 and parts[1].isdigit():
+                        self.pending[parts[0]] += int(parts[1])
+            logger.info("[Usage] Recovered %d spooled message(s)", self.pending_total)
+        except Exception as e:
+            logger.error("[Usage] Could not read spool %s: %s", self.spool_path, e)
+
+    async def _drain_journal(self):
+        while self._journal:
+            async with self._io_lock:
+                lines, self._journal = self._journal, []
+                if not lines:
+                    continue
+                try:
+                    await asyncio.to_thread(self._append_journal, lines)
+                except Exception as e:
+                    logger.error("[Usage] Could not append to spool %s: %s", self.spool_path, e)
+
+    def _append_journal(self, lines: List[str]):
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    async def _save_spool(self):
+        if not self.spool_path:
+            return
+        async with self._io_lock:
+            # The snapshot covers every increment so far, journaled or not
+            snapshot: Dict[str, int] = defaultdict(int)
+            for source in (self.pending, self._in_flight):
+                for gid, count in source.items():
+                    snapshot[gid] += count
+            self._journal = []
+            try:
+                await asyncio.to_thread(self._write_spool, snapshot)
+            except Exception as e:
+                logger.error("[Usage] Could not write spool %s: %s", self.spool_path, e)
+
+    def _write_spool(self, snapshot: Dict[str, int]):
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{gid} {count}\n" for gid, count in snapshot.items() if count)
+        os.replace(tmp_path, self.spool_path)
+
+
+usage_aggregator = UsageAggregator()
+
+
+# --- Quota cache ------------------------------------------------------------
+_QUOTA_USED_KEYS = ("messages_used", "message_count", "messages_this_period", "usage")
+
+
+def parse_quota(body: str) -> Optional[Tuple[int, int]]:
+    """Read (limit, used) from a SERVER_QUOTA_URL response, if it reports usage.
+
+    Accepts the fields at the top level or nested under ``server``/``data``.
+    """
+    try:
+        data = json.loads(body)
+    except (TypeError, ValueError):
+        return None
+    candidates = [data]
+    if isinstance(data, dict):
+        candidates += [data.get("server"), data.get("data")]
+    for item in candidates:
+        if not isinstance(item, dict) or "message_limit" not in item:
+            continue
+        for key in _QUOTA_USED_KEYS:
+            if item.get(key) is not None:
+                return int(item["message_limit"]), int(item[key])
+    return None
+
+
+class QuotaCache:
+    """Per-guild message quota known locally, so over-limit guilds never reach n8n.
+
+    Each guild's limit and usage are read from SERVER_QUOTA_URL; answers
+    counted locally since the last refresh are added on top. Guilds the
+    endpoint has never reported usage for are not enforced. Guilds that saw
+    traffic are re-read every ``refresh_interval`` seconds.
+    """
+
+    def __init__(self, refresh_interval=QUOTA_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.limits: Dict[str, int] = {}
+        self.remote_used: Dict[str, int] = {}
+        self.local_used: Dict[str, int] = defaultdict(int)
+        self.rejected: Counter = Counter()
+        self._active: Set[str] = set()
+        self._last_notice: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, server_id, body: str):
+        quota = parse_quota(body)
+        if quota is None:
+            return
+        server_id = str(server_id)
+        self.limits[server_id], self.remote_used[server_id] = quota
+        # Counts still waiting in the usage aggregator are not in remote_used yet
+        self.local_used[server_id] = usage_aggregator.pending.get(server_id, 0)
+
+    def record(self, server_id, amount=1):
+        server_id = str(server_id)
+        self.local_used[server_id] += amount
+        self._active.add(server_id)
+
+    def used(self, server_id) -> int:
+        server_id = str(server_id)
+        return self.remote_used.get(server_id, 0) + self.local_used.get(server_id, 0)
+
+    def allow(self, server_id) -> bool:
+        server_id = str(server_id)
+        self._active.add(server_id)
+        limit = self.limits.get(server_id)
+        if limit is None or self.used(server_id) < limit:
+            return True
+        self.rejected[server_id] += 1
+        return False
+
+    def should_notify(self, server_id) -> bool:
+        """True at most once per QUOTA_NOTICE_INTERVAL_SECONDS per guild."""
+        server_id = str(server_id)
+        now = time.monotonic()
+        last = self._last_notice.get(server_id)
+        if last is not None and now - last < QUOTA_NOTICE_INTERVAL_SECONDS:
+            return False
+        self._last_notice[server_id] = now
+        return True
+
+    def over_quota(self) -> List[str]:
+        return [gid for gid, limit in self.limits.items() if self.used(gid) >= limit]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def fetch(self, server_id):
+        headers = {
+            "Content-Type": "application/json",
+            "x-bot-secret": DISCORD_BOT_SYNC_SECRET or "",
+        }
+        try:
+            status, body = await post_json(
+                SERVER_QUOTA_URL, {"discord_guild_id": str(server_id)}, headers=headers, stage="quota"
+            )
+        except Exception as e:
+            logger.error("[Quota] Error reading guild %s: %s", server_id, e)
+            return
+        if status < 300:
+            self.update(server_id, body)
+        else:
+            logger.warning("[Quota] Read for guild %s failed: status %s body=%s", server_id, status, body)
+
+    async def refresh(self):
+        active, self._active = self._active, set()
+        await asyncio.gather(*(self.fetch(gid) for gid in active))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("[Quota] Refresh failed: %s", e)
+
+
+quota_cache = QuotaCache()
+
+
+def record_answer(server_id):
+    """Count one answered message for usage reporting and local quota."""
+    usage_aggregator.add(server_id)
+    quota_cache.record(server_id)
+
+
+# --- Live ingest ------------------------------------------------------------
+def build_ingest_document(message) -> Dict[str, object]:
+    """A single-message document in the shape indexer.py sends to the ingest workflow."""
+    url = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
+    digest = hashlib.sha256(message.content.encode("utf-8"))
+    digest.update(str(message.id).encode("ascii"))
+    channel = message.channel
+    metadata: Dict[str, object] = {
+        "source": "discord",
+        "author": message.author.name,
+        "author_id": str(message.author.id),
+        "authors": [message.author.name],
+        "channel": getattr(channel, "name", ""),
+        "channel_id": str(channel.id),
+        "server_id": str(message.guild.id),
+        "message_id": str(message.id),
+        "message_ids": [str(message.id)],
+        "timestamp": message.created_at.isoformat(),
+        "end_timestamp": message.created_at.isoformat(),
+        "url": url,
+        "urls": [url],
+        "content_hash": digest.hexdigest(),
+        "index_run": "live",
+        # Lets an indexer rebuild that started earlier keep this document
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+    }
+    parent = getattr(channel, "parent", None)
+    if isinstance(channel, discord.Thread) and parent is not None:
+        metadata["parent_channel"] = parent.name
+        metadata["parent_channel_id"] = str(parent.id)
+    return {"content": message.content, "metadata": metadata}
+
+
+def is_ingestable(message) -> bool:
+    return bool(message.guild and not message.author.bot and (message.content or "").strip())
+
+
+class LiveIngest:
+    """Micro-batches message upserts and deletes for the ingest webhook.
+
+    Events are keyed by message id per guild, so repeated edits of a message
+    within one batch send only the latest text, and a delete replaces any
+    pending upsert. A batch goes out every ``flush_interval`` seconds, or
+    sooner once ``max_events`` are waiting. Failed guild batches are merged
+    back in (newer events win) and retried on the next flush.
+
+    The workflow replaces single-message documents directly. Indexer
+    conversation windows holding an edited or deleted message are rebuilt
+    from their stored lines, so the rest of the window is kept. Once a batch
+    with edits or deletes is accepted, the guild's cached answers are dropped
+    because they may quote the old text.
+    """
+
+    def __init__(self, url=None, flush_interval=LIVE_INGEST_FLUSH_SECONDS,
+                 max_events=LIVE_INGEST_MAX_EVENTS):
+        self.url = url if url is not None else N8N_INGEST_WEBHOOK_URL
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        # server_id -> message_id -> document to upsert, or None to delete
+        self.pending: Dict[str, Dict[str, Optional[Dict[str, object]]]] = defaultdict(dict)
+        self.events: Counter = Counter()
+        # Guilds with pending edits or deletes, whose cached answers go stale
+        self.stale_guilds: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_total(self) -> int:
+        return sum(len(events) for events in self.pending.values())
+
+    def upsert(self, message, edited=False):
+        self.pending[str(message.guild.id)][str(message.id)] = build_ingest_document(message)
+        self.events["upsert"] += 1
+        if edited:
+            self.stale_guilds.add(str(message.guild.id))
+        self._maybe_flush()
+
+    def delete(self, guild_id, message_ids):
+        for message_id in message_ids:
+            self.pending[str(guild_id)][str(message_id)] = None
+            self.events["delete"] += 1
+        self.stale_guilds.add(str(guild_id))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.pending_total >= self.max_events and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self.pending:
+                return
+            batch = dict(self.pending)
+            stale = self.stale_guilds
+            self.pending = defaultdict(dict)
+            self.stale_guilds = set()
+            server_ids = list(batch)
+            results = await asyncio.gather(*(self._send(gid, batch[gid]) for gid in server_ids))
+            for gid, ok in zip(server_ids, results):
+                if not ok:
+                    for message_id, doc in batch[gid].items():
+                        self.pending[gid].setdefault(message_id, doc)
+                    if gid in stale:
+                        self.stale_guilds.add(gid)
+                elif gid in stale:
+                    dropped = answer_cache.invalidate_guild(gid)
+                    logger.debug("[Ingest] Invalidated %d cached answer(s) for guild %s", dropped, gid)
+
+    async def _send(self, server_id, events) -> bool:
+        payload = {
+            "server_id": server_id,
+            "mode": "live",
+            "run_id": "live",
+            "messages": [doc for doc in events.values() if doc is not None],
+            "deleted_ids": [message_id for message_id, doc in events.items() if doc is None],
+        }
+        try:
+            status, body = await post_json(
+                self.url, payload, timeout=N8N_TIMEOUT_SECONDS, stage="ingest"
+            )
+        except Exception as e:
+            logger.error("[Ingest] Error sending %d event(s) for guild %s: %s", len(events), server_id, e)
+            self.events["failed"] += 1
+            return False
+        if status >= 300:
+            logger.warning("[Ingest] Ingest webhook returned %s for guild %s: %s", status, server_id, body[:200])
+            self.events["failed"] += 1
+            return False
+        logger.debug("[Ingest] Sent %d event(s) for guild %s", len(events), server_id)
+        return True
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("[Ingest] Flush failed: %s", e)
+
+
+live_ingest = LiveIngest()
+
+
+# --- Scheduler ------------------------------------------------------------
+class _Job:
+    __slots__ = ("run", "future", "enqueued_at")
+
+    def __init__(self, run: Callable[[], Awaitable], future: asyncio.Future):
+        self.run = run
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _GuildQueue:
+    def __init__(self):
+        self.channels: Dict[str, Deque[_Job]] = {}
+        self.ring: Deque[str] = deque()
+        self.size = 0
+        self.active = 0
+
+    def push(self, channel_key: str, job: _Job):
+        if channel_key not in self.channels:
+            self.channels[channel_key] = deque()
+            self.ring.append(channel_key)
+        self.channels[channel_key].append(job)
+        self.size += 1
+
+    def pop_next(self) -> Optional[_Job]:
+        """Pop the oldest job of the next channel in round-robin order."""
+        while self.ring:
+            channel_key = self.ring[0]
+            self.ring.rotate(-1)
+            queue = self.channels[channel_key]
+            if queue:
+                self.size -= 1
+                job = queue.popleft()
+                if not queue:
+                    del self.channels[channel_key]
+                    self.ring.remove(channel_key)
+                return job
+        return None
+
+    def pop_oldest(self, channel_key: Optional[str] = None) -> Optional[_Job]:
+        """Evict the oldest job, from ``channel_key`` or else the longest channel."""
+        if channel_key not in self.channels:
+            if not self.channels:
+                return None
+            channel_key = max(self.channels, key=lambda k: len(self.channels[k]))
+        queue = self.channels[channel_key]
+        job = queue.popleft()
+        self.size -= 1
+        if not queue:
+            del self.channels[channel_key]
+            self.ring.remove(channel_key)
+        return job
+
+
+class DispatchScheduler:
+    """Bounded, fair admission control for n8n dispatches.
+
+    Jobs are queued per guild and per channel. Guilds are served round-robin
+    under a global and a per-guild concurrency cap, so one busy guild cannot
+    starve the rest. When a queue is full the job is shed according to
+    ``shed_policy``: ``drop_oldest`` evicts the oldest queued job, ``busy``
+    rejects the new one so the caller can tell the user to retry.
+    """
+
+    def __init__(self, max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+                 guild_concurrency=SCHEDULER_GUILD_CONCURRENCY,
+                 guild_queue=SCHEDULER_GUILD_QUEUE, channel_queue=SCHEDULER_CHANNEL_QUEUE,
+                 shed_policy=SCHEDULER_SHED_POLICY):
+        self.max_concurrency = max_concurrency
+        self.guild_concurrency = guild_concurrency
+        self.guild_queue = guild_queue
+        self.channel_queue = channel_queue
+        self.shed_policy = shed_policy
+        self.active = 0
+        self.shed: Counter = Counter()
+        self.wait_samples: Deque[float] = deque(maxlen=1000)
+        self._guilds: Dict[str, _GuildQueue] = {}
+        self._ring: Deque[str] = deque()
+        self._last_notice: Dict[str, float] = {}
+
+    def should_notify(self, channel_key: str) -> bool:
+        """True if the channel has not been told we are busy recently."""
+        now = time.monotonic()
+        last = self._last_notice.get(channel_key)
+        if last is not None and now - last < SCHEDULER_BUSY_NOTICE_INTERVAL_SECONDS:
+            return False
+        self._last_notice[channel_key] = now
+        return True
+
+    def submit(self, guild_key: str, channel_key: str,
+               run: Callable[[], Awaitable]) -> Optional[asyncio.Future]:
+        """Queue ``run``. Returns a future resolving to True once it ran, or
+        False if it was shed. Returns None if the job was rejected outright."""
+        guild = self._guilds.get(guild_key)
+        if guild is None:
+            guild = self._guilds[guild_key] = _GuildQueue()
+            self._ring.append(guild_key)
+
+        channel_full = len(guild.channels.get(channel_key, ())) >= self.channel_queue
+        if channel_full or guild.size >= self.guild_queue:
+            if self.shed_policy == "busy":
+                self.shed["busy"] += 1
+                return None
+            evicted = guild.pop_oldest(channel_key if channel_full else None)
+            if evicted is not None:
+                self.shed["drop_oldest"] += 1
+                evicted.future.set_result(False)
+
+        job = _Job(run, asyncio.get_running_loop().create_future())
+        guild.push(channel_key, job)
+        self._pump()
+        return job.future
+
+    def queue_depth(self) -> Dict[str, int]:
+        return {key: guild.size for key, guild in self._guilds.items() if guild.size}
+
+    def stats(self) -> Dict[str, object]:
+        waits = sorted(self.wait_samples)
+
+        def pct(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "active": self.active,
+            "queued": sum(g.size for g in self._guilds.values()),
+            "queue_depth": self.queue_depth(),
+            "shed": dict(self.shed),
+            "wait_p50": pct(0.50),
+            "wait_p99": pct(0.99),
+        }
+
+    def _next_job(self) -> Optional[Tuple[str, _Job]]:
+        for _ in range(len(self._ring)):
+            guild_key = self._ring[0]
+            self._ring.rotate(-1)
+            guild = self._guilds[guild_key]
+            if guild.size and guild.active < self.guild_concurrency:
+                job = guild.pop_next()
+                if job is not None:
+                    return guild_key, job
+        return None
+
+    def _pump(self):
+        while self.active < self.max_concurrency:
+            picked = self._next_job()
+            if picked is None:
+                break
+            guild_key, job = picked
+            self.active += 1
+            self._guilds[guild_key].active += 1
+            self.wait_samples.append(time.monotonic() - job.enqueued_at)
+            asyncio.create_task(self._run(guild_key, job))
+
+    async def _run(self, guild_key: str, job: _Job):
+        try:
+            await job.run()
+        except Exception as e:
+            logger.error("[Scheduler] Job failed: %s", e)
+        finally:
+            self.active -= 1
+            guild = self._guilds[guild_key]
+            guild.active -= 1
+            if not guild.size and not guild.active:
+                del self._guilds[guild_key]
+                self._ring.remove(guild_key)
+            if not job.future.done():
+                job.future.set_result(True)
+            self._pump()
+
+
+scheduler = DispatchScheduler()
+
+
+# --- Pre-filter -------------------------------------------------------------
+# Each rule looks at a message and returns FORWARD (send to n8n, stop
+# evaluating), DROP (never reaches n8n) or None (no opinion). Messages no rule
+# has an opinion on are forwarded, so the Gatekeeper still makes the final call.
+FORWARD = "forward"
+DROP = "drop"
+
+_QUESTION_RE = re.compile(
+    r"\?|^\s*(how|what|why|when|where|which|who|can|could|does|do|is|are|should|would|anyone|help)\b",
+    re.IGNORECASE,
+)
+_CUSTOM_EMOJI_RE = re.compile(r"<a?:\w+:\d+>")
+_EMOJI_CATEGORIES = {"So", "Sk", "Mn", "Me", "Cf"}
+
+
+def rule_channel_lists(message) -> Optional[str]:
+    channel_id = str(message.channel.id)
+    if channel_id in PREFILTER_DENY_CHANNELS:
+        return DROP
+    if PREFILTER_ALLOW_CHANNELS and channel_id not in PREFILTER_ALLOW_CHANNELS:
+        return DROP
+    return None
+
+
+def rule_bot_mention(message) -> Optional[str]:
+    if client.user is not None and client.user.mentioned_in(message):
+        return FORWARD
+    return None
+
+
+def rule_reply_to_bot(message) -> Optional[str]:
+    reference = getattr(message, "reference", None)
+    resolved = getattr(reference, "resolved", None)
+    author = getattr(resolved, "author", None)
+    if author is not None and client.user is not None and author.id == client.user.id:
+        return FORWARD
+    return None
+
+
+def rule_emoji_only(message) -> Optional[str]:
+    text = _CUSTOM_EMOJI_RE.sub("", message.content or "")
+    text = "".join(ch for ch in text if not ch.isspace())
+    if not (message.content or "").strip():
+        return None
+    if all(unicodedata.category(ch) in _EMOJI_CATEGORIES for ch in text):
+        return DROP
+    return None
+
+
+def rule_question(message) -> Optional[str]:
+    if _QUESTION_RE.search(message.content or ""):
+        return FORWARD
+    return None
+
+
+def rule_min_length(message) -> Optional[str]:
+    if len((message.content or "").strip()) < PREFILTER_MIN_LENGTH:
+        return DROP
+    return None
+
+
+PrefilterRule = Callable[[discord.Message], Optional[str]]
+
+PREFILTER_RULES: List[PrefilterRule] = [
+    rule_channel_lists,
+    rule_bot_mention,
+    rule_reply_to_bot,
+    rule_emoji_only,
+    rule_question,
+    rule_min_length,
+]
+
+prefilter_drops: Counter = Counter()
+prefilter_forwards: Counter = Counter()
+
+
+def prefilter(message) -> Tuple[bool, Optional[str]]:
+    """Run the pre-filter rules. Returns (forward, deciding_rule_name)."""
+    if not PREFILTER_ENABLED:
+        return True, None
+    for rule in PREFILTER_RULES:
+        verdict = rule(message)
+        if verdict == DROP:
+            prefilter_drops[rule.__name__] += 1
+            return False, rule.__name__
+        if verdict == FORWARD:
+            prefilter_forwards[rule.__name__] += 1
+            return True, rule.__name__
+    prefilter_forwards["default"] += 1
+    return True, None
+
+
+# --- Message coalescing -----------------------------------------------------
+class CoalescedMessage:
+    """Several fragments from one author in one channel, seen as one message.
+
+    Content is joined with newlines, mentions are merged, and every other
+    attribute comes from the latest fragment.
+    """
+
+    def __init__(self, fragments):
+        self.fragments = list(fragments)
+        self.content = "\n".join(m.content for m in self.fragments if m.content)
+        self.mentions = [user for m in self.fragments for user in m.mentions]
+        self.mention_everyone = any(m.mention_everyone for m in self.fragments)
+        self.reference = next(
+            (m.reference for m in self.fragments if getattr(m, "reference", None) is not None), None
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.fragments[-1], name)
+
+
+class MessageCoalescer:
+    """Debounces messages per (channel, author).
+
+    Each fragment restarts the ``window``; only the handler of the last
+    fragment gets the buffered list back, earlier handlers get None and stop.
+    A buffer is released early once it holds ``max_messages`` fragments.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW_SECONDS, max_messages=COALESCE_MAX_MESSAGES):
+        self.window = window
+        self.max_messages = max_messages
+        self.merged = 0
+        self._buffers: Dict[Tuple[str, str], List[discord.Message]] = {}
+        self._latest: Dict[Tuple[str, str], int] = {}
+        self._seq = 0
+
+    async def collect(self, message) -> Optional[List[discord.Message]]:
+        key = (str(message.channel.id), str(message.author.id))
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(message)
+        self._seq += 1
+        seq = self._latest[key] = self._seq
+
+        if len(buffer) < self.max_messages:
+            await asyncio.sleep(self.window)
+            if self._latest.get(key) != seq:
+                return None
+
+        del self._latest[key]
+        fragments = self._buffers.pop(key)
+        self.merged += len(fragments) - 1
+        return fragments
+
+
+coalescer = MessageCoalescer()
+
+
+# --- Answer cache -----------------------------------------------------------
+_MENTION_RE = re.compile(r"<(?:@[!&]?|#)\d+>")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_content(content: str) -> str:
+    text = _MENTION_RE.sub(" ", content or "").lower()
+    text = _PUNCT_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """LRU + TTL cache of n8n answers keyed by (server_id, normalized content).
+
+    Bounded both by entry count and by the approximate UTF-8 size of stored
+    keys and answers. Entries for one guild can be dropped with
+    ``invalidate_guild`` when new knowledge is ingested for it.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, max_bytes=ANSWER_CACHE_MAX_BYTES,
+                 ttl=ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, int]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, server_id, content) -> Optional[str]:
+        key = (str(server_id), normalize_content(content))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, server_id, content, answer: str):
+        key = (str(server_id), normalize_content(content))
+        if len(key[1]) < ANSWER_CACHE_MIN_LENGTH:
+            return
+        size = len(key[1].encode("utf-8")) + len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl, answer, size)
+        self.bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._evict(next(iter(self._entries)))
+
+    def invalidate_guild(self, server_id) -> int:
+        server_id = str(server_id)
+        stale = [key for key in self._entries if key[0] == server_id]
+        for key in stale:
+            self._evict(key)
+        return len(stale)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+    def _evict(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+
+answer_cache = AnswerCache()
+
+
+# --- Internal HTTP endpoint -------------------------------------------------
+async def _invalidate_peer(port: int, server_id: str) -> Optional[int]:
+    """Forward an invalidation to another worker; returns its count or None on failure."""
+    url = f"http://127.0.0.1:{port}/cache/invalidate/{server_id}"
+    headers = {"x-bot-secret": DISCORD_BOT_SYNC_SECRET or "", "x-gravilo-peer": "1"}
+    try:
+        status, body = await post_json(url, {}, headers=headers, timeout=5, stage="cache_peer")
+        if status == 200:
+            return int(json.loads(body)["invalidated"])
+        logger.error("[Cache] Worker on port %s refused invalidation: %s %s", port, status, body)
+    except Exception as e:
+        logger.error("[Cache] Could not reach worker on port %s: %s", port, e)
+    return None
+
+
+async def handle_cache_invalidate(request: web.Request) -> web.Response:
+    if not DISCORD_BOT_SYNC_SECRET or request.headers.get("x-bot-secret") != DISCORD_BOT_SYNC_SECRET:
+        return web.json_response({"error": "unauthorized"}, status=401)
+    server_id = request.match_info["server_id"]
+    dropped = answer_cache.invalidate_guild(server_id)
+    logger.info("[Cache] Invalidated %d answer(s) for guild %s", dropped, server_id)
+    if request.headers.get("x-gravilo-peer"):
+        return web.json_response({"server_id": server_id, "invalidated": dropped})
+
+    # Each launcher worker has its own cache: fan out to the others
+    results = await asyncio.gather(*(_invalidate_peer(port, server_id) for port in BRIDGE_PEER_PORTS))
+    failed = [port for port, count in zip(BRIDGE_PEER_PORTS, results) if count is None]
+    body = {
+        "server_id": server_id,
+        "invalidated": dropped + sum(count for count in results if count is not None),
+        "workers": 1 + len(BRIDGE_PEER_PORTS) - len(failed),
+        "failed_ports": failed,
+    }
+    return web.json_response(body, status=502 if failed else 200)
+
+
+def _fmt_labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_metrics() -> str:
+    lines = [
+        "# HELP gravilo_stage_latency_seconds Latency of each bridge stage.",
+        "# TYPE gravilo_stage_latency_seconds histogram",
+    ]
+    for stage, hist in sorted(metrics.stage_latency.items()):
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(
+                f"gravilo_stage_latency_seconds_bucket{{{_fmt_labels(stage=stage, le=bound)}}} {count}"
+            )
+        lines.append(f'gravilo_stage_latency_seconds_bucket{{{_fmt_labels(stage=stage, le="+Inf")}}} {hist.total}')
+        lines.append(f'gravilo_stage_latency_seconds_sum{{stage="{stage}"}} {hist.sum:.6f}')
+        lines.append(f'gravilo_stage_latency_seconds_count{{stage="{stage}"}} {hist.total}')
+
+    lines += [
+        "# HELP gravilo_http_requests_total Outbound requests by stage and status code.",
+        "# TYPE gravilo_http_requests_total counter",
+    ]
+    for (stage, status), count in sorted(metrics.requests.items()):
+        lines.append(f"gravilo_http_requests_total{{{_fmt_labels(stage=stage, status=status)}}} {count}")
+
+    lines += [
+        "# HELP gravilo_http_in_flight Outbound requests currently in flight.",
+        "# TYPE gravilo_http_in_flight gauge",
+    ]
+    for stage, count in sorted(metrics.in_flight.items()):
+        lines.append(f'gravilo_http_in_flight{{stage="{stage}"}} {count}')
+
+    sched = scheduler.stats()
+    cache = answer_cache.stats()
+    gauges = [
+        ("gravilo_event_loop_lag_seconds", "Most recent event loop lag.", metrics.loop_lag),
+        ("gravilo_scheduler_active", "Dispatch jobs running.", sched["active"]),
+        ("gravilo_scheduler_queued", "Dispatch jobs waiting.", sched["queued"]),
+        ("gravilo_scheduler_wait_p50_seconds", "Median queue wait.", sched["wait_p50"]),
+        ("gravilo_scheduler_wait_p99_seconds", "p99 queue wait.", sched["wait_p99"]),
+        ("gravilo_answer_cache_entries", "Cached answers.", cache["entries"]),
+        ("gravilo_answer_cache_bytes", "Approximate cache size.", cache["bytes"]),
+        ("gravilo_answer_cache_hit_ratio", "Answer cache hit ratio.", cache["hit_ratio"]),
+        ("gravilo_usage_pending", "Usage counts waiting to be flushed.", usage_aggregator.pending_total),
+        ("gravilo_live_ingest_pending", "Message events waiting for the ingest webhook.", live_ingest.pending_total),
+        ("gravilo_coalesced_messages", "Messages merged into a later fragment.", coalescer.merged),
+        ("gravilo_quota_guilds_over", "Guilds currently over their message quota.", len(quota_cache.over_quota())),
+        ("gravilo_quota_rejected", "Messages rejected locally for quota.", sum(quota_cache.rejected.values())),
+        ("gravilo_n8n_breaker_failures", "Consecutive failed n8n attempts.", n8n_breaker.failures),
+    ]
+    for name, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+    lines += [
+        "# HELP gravilo_shard_latency_seconds Gateway heartbeat latency per shard.",
+        "# TYPE gravilo_shard_latency_seconds gauge",
+    ]
+    health = shard_health()
+    for shard_id, info in sorted(health.items()):
+        if info["latency"] is not None:
+            lines.append(f'gravilo_shard_latency_seconds{{shard="{shard_id}"}} {info["latency"]}')
+    lines += [
+        "# HELP gravilo_shard_up 1 if the shard's gateway connection is open.",
+        "# TYPE gravilo_shard_up gauge",
+    ]
+    for shard_id, info in sorted(health.items()):
+        lines.append(f'gravilo_shard_up{{shard="{shard_id}"}} {int(not info["closed"])}')
+
+    counters = [
+        ("gravilo_prefilter_dropped_total", "Messages dropped by each pre-filter rule.", prefilter_drops),
+        ("gravilo_prefilter_forwarded_total", "Messages forwarded by each pre-filter rule.", prefilter_forwards),
+        ("gravilo_scheduler_shed_total", "Dispatch jobs shed by policy.", scheduler.shed),
+        ("gravilo_live_ingest_events_total", "Live ingest upserts, deletes and failed batches.", live_ingest.events),
+    ]
+    labels = {"gravilo_scheduler_shed_total": "policy", "gravilo_live_ingest_events_total": "event"}
+    for name, help_text, values in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        label = labels.get(name, "rule")
+        for key, count in sorted(values.items()):
+            lines.append(f'{name}{{{label}="{key}"}} {count}')
+
+    lines += [
+        "# HELP gravilo_n8n_breaker_state Current n8n circuit breaker state.",
+        "# TYPE gravilo_n8n_breaker_state gauge",
+    ]
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN):
+        lines.append(f'gravilo_n8n_breaker_state{{state="{state}"}} {int(n8n_breaker.state == state)}')
+    lines += [
+        "# HELP gravilo_n8n_breaker_opened_total Times the n8n circuit breaker opened.",
+        "# TYPE gravilo_n8n_breaker_opened_total counter",
+        f"gravilo_n8n_breaker_opened_total {n8n_breaker.times_opened}",
+        "# HELP gravilo_n8n_events_total Retries, hedged requests and hedge wins.",
+        "# TYPE gravilo_n8n_events_total counter",
+    ]
+    for event, count in sorted(n8n_events.items()):
+        lines.append(f'gravilo_n8n_events_total{{event="{event}"}} {count}')
+
+    lines += [
+        "# HELP gravilo_answer_cache_requests_total Answer cache lookups.",
+        "# TYPE gravilo_answer_cache_requests_total counter",
+        f'gravilo_answer_cache_requests_total{{result="hit"}} {cache["hits"]}',
+        f'gravilo_answer_cache_requests_total{{result="miss"}} {cache["misses"]}',
+    ]
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+
+def shard_health() -> Dict[str, Dict[str, object]]:
+    """Per-shard gateway latency and connection state."""
+    shards = getattr(client, "shards", None)
+    if shards:
+        return {
+            str(shard_id): {
+                "latency": None if math.isnan(info.latency) else info.latency,
+                "closed": info.is_closed(),
+                "ratelimited": info.is_ws_ratelimited(),
+            }
+            for shard_id, info in shards.items()
+        }
+    latency = client.latency
+    return {
+        str(client.shard_id or 0): {
+            "latency": None if math.isnan(latency) else latency,
+            "closed": client.is_closed(),
+            "ratelimited": client.is_ws_ratelimited() if client.is_ready() else False,
+        }
+    }
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "ready": client.is_ready(),
+        "worker": BRIDGE_WORKER or None,
+        "guilds": len(client.guilds),
+        "shards": shard_health(),
+    })
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL_SECONDS):
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.monotonic() - start - interval)
+        metrics.loop_lag = lag
+        metrics.observe("loop_lag", lag)
+
+
+def build_http_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_post("/cache/invalidate/{server_id}", handle_cache_invalidate)
+    return app
+
+
+async def start_http_server() -> Optional[web.AppRunner]:
+    if not BRIDGE_HTTP_PORT:
+        return None
+    runner = web.AppRunner(build_http_app())
+    await runner.setup()
+    await web.TCPSite(runner, BRIDGE_HTTP_HOST, BRIDGE_HTTP_PORT).start()
+    logger.info("[HTTP] Listening on %s:%s", BRIDGE_HTTP_HOST, BRIDGE_HTTP_PORT)
+    return runner
 
 
 @client.event
@@ -108,14 +1764,18 @@ async def on_ready():
     logger.info("Logged in as %s", client.user)
 
     logger.info("[Guild Sync] Backfilling %d guild(s)...", len(client.guilds))
-    for guild in client.guilds:
-        asyncio.create_task(guild_sync(guild))
+    asyncio.create_task(backfill_guilds(list(client.guilds)))
 
 
 @client.event
 async def on_guild_join(guild: discord.Guild):
     logger.info("[Discord] Joined guild %s (%s)", guild.name, guild.id)
-    asyncio.create_task(guild_sync(guild))
+    asyncio.create_task(guild_sync(guild, force=True))
+
+
+@client.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    asyncio.create_task(guild_sync(after))
 
 
 @client.event
@@ -123,20 +1783,97 @@ async def on_message(message):
     if message.author.bot:
         return
 
+    if LIVE_INGEST and is_ingestable(message):
+        live_ingest.upsert(message)
+
+    created_at = getattr(message, "created_at", None)
+    if isinstance(created_at, datetime):
+        metrics.observe("event", max(0.0, time.time() - created_at.timestamp()))
+
+    if COALESCE_WINDOW_SECONDS > 0:
+        fragments = await coalescer.collect(message)
+        if fragments is None:
+            return  # superseded by a later fragment from the same author
+        if len(fragments) > 1:
+            message = CoalescedMessage(fragments)
+
+    forward, prefilter_rule = prefilter(message)
+    if not forward:
+        logger.debug("[Prefilter] Dropped message %s (%s)", message.id, prefilter_rule)
+        return
+
     channel_name = getattr(message.channel, "name", "DM")
 
     logger.info(
-        "[bridge] Incoming message from %s in #%s (guild=%s): %r",
-        message.author,
+        "[bridge] Incoming message %s from %s in #%s (guild=%s, %d chars)",
+        message.id,
+        message.author.id,
         channel_name,
         getattr(message.guild, "id", None),
-        message.content,
+        len(message.content or ""),
     )
 
     if not N8N_WEBHOOK_URL:
         logger.warning("N8N_WEBHOOK_URL missing; skipping")
         return
 
+    if QUOTA_ENFORCEMENT and message.guild and not quota_cache.allow(message.guild.id):
+        logger.info("[Quota] Guild %s is over quota; dropping message %s", message.guild.id, message.id)
+        if prefilter_rule in ADDRESSED_RULES and quota_cache.should_notify(message.guild.id):
+            await send_answer(message.channel, QUOTA_EXCEEDED_MESSAGE)
+        return
+
+    guild_key = str(message.guild.id) if message.guild else "dm"
+
+    if ANSWER_CACHE_ENABLED and message.guild:
+        cached = answer_cache.get(message.guild.id, message.content)
+        if cached is not None:
+            await send_answer(message.channel, cached)
+            record_answer(message.guild.id)
+            return
+
+    done = scheduler.submit(
+        guild_key,
+        str(message.channel.id),
+        lambda: dispatch_message(message, channel_name, prefilter_rule),
+    )
+    if done is None:
+        logger.warning("[Scheduler] Guild %s is over capacity; rejected message %s", guild_key, message.id)
+        if prefilter_rule in ADDRESSED_RULES and scheduler.should_notify(str(message.channel.id)):
+            try:
+                await message.channel.send(SCHEDULER_BUSY_MESSAGE)
+            except Exception as e:
+                logger.error("[Scheduler] Could not send busy reply: %s", e)
+        return
+
+    if not await done:
+        logger.warning("[Scheduler] Shed message %s from guild %s", message.id, guild_key)
+
+
+@client.event
+async def on_message_edit(before, after):
+    # Embeds resolving also fire edits; only changed text needs re-embedding
+    if LIVE_INGEST and is_ingestable(after) and before.content != after.content:
+        live_ingest.upsert(after, edited=True)
+
+
+@client.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    # The raw event also covers messages that are no longer in the cache
+    if LIVE_INGEST and payload.guild_id:
+        live_ingest.delete(payload.guild_id, [payload.message_id])
+
+
+@client.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    if LIVE_INGEST and payload.guild_id:
+        live_ingest.delete(payload.guild_id, payload.message_ids)
+
+
+ADDRESSED_RULES = {"rule_bot_mention", "rule_reply_to_bot"}
+
+
+async def dispatch_message(message, channel_name, prefilter_rule):
     payload = {
         "content": message.content,
         "author": message.author.name,
@@ -144,30 +1881,200 @@ async def on_message(message):
         "channel_id": str(message.channel.id),
         "channel_name": channel_name,
         "server_id": str(message.guild.id) if message.guild else None,
+        "message_ids": [str(m.id) for m in getattr(message, "fragments", [message])],
+        "prefilter_rule": prefilter_rule,
     }
 
+    # Messages addressed to the bot show a typing indicator while n8n works and
+    # get an apology if n8n is down; for everything else the Gatekeeper may stay
+    # silent, so neither would make sense.
+    addressed = prefilter_rule in ADDRESSED_RULES
+    if addressed:
+        typing = message.channel.typing()
+    else:
+        typing = contextlib.nullcontext()
+
     try:
-        response = requests.post(N8N_WEBHOOK_URL, json=payload, timeout=30)
+        async with typing:
+            if N8N_STREAMING:
+                bot_answer = await stream_reply(message.channel, payload)
+            else:
+                bot_answer = (await call_n8n(payload)).strip()
+                if bot_answer:
+                    await send_answer(message.channel, bot_answer)
+
+        if bot_answer and ANSWER_CACHE_ENABLED and message.guild:
+            answer_cache.put(message.guild.id, message.content, bot_answer)
 
-        if response.status_code == 200:
-            bot_answer = response.text.strip()
+        if message.guild:
+            record_answer(message.guild.id)
 
-            if bot_answer:
-                await message.channel.send(bot_answer)
+    except CircuitOpenError:
+        logger.warning("[n8n] Circuit open; not dispatching message %s", message.id)
+        if addressed:
+            await send_answer(message.channel, N8N_UNAVAILABLE_MESSAGE)
+    except N8nStatusError as e:
+        logger.warning("n8n returned %s: %s", e.status, e.body)
+    except Exception as e:
+        logger.error("Failed to communicate with n8n: %s", e)
 
-            if message.guild:
-                await increment_usage(server_id=message.guild.id, amount=1)
 
-        else:
-            logger.warning("n8n returned %s: %s", response.status_code, response.text)
+async def stream_reply(channel, payload) -> str:
+    """Stream an n8n answer into the channel.
 
+    Goes through the circuit breaker like call_n8n, but is not retried or
+    hedged: once the first chunk is posted a retry would duplicate output.
+    """
+    if not n8n_breaker.allow():
+        raise CircuitOpenError()
+    reply = StreamingReply(channel)
+    try:
+        async for chunk in stream_n8n(N8N_WEBHOOK_URL, payload):
+            await reply.feed(chunk)
     except Exception as e:
-        logger.error("Failed to communicate with n8n: %s", e)
+        if _is_transient(e) or not isinstance(e, N8nStatusError):
+            n8n_breaker.record_failure()
+        else:
+            n8n_breaker.record_success()
+        raise
+    n8n_breaker.record_success()
+    return await reply.finish()
+
+
+async def main(token: str):
+    usage_aggregator.start()
+    if LIVE_INGEST:
+        if N8N_INGEST_WEBHOOK_URL:
+            live_ingest.start()
+        else:
+            logger.warning("[Ingest] LIVE_INGEST is on but N8N_INGEST_WEBHOOK_URL is missing")
+    if QUOTA_ENFORCEMENT:
+        if SERVER_QUOTA_URL:
+            quota_cache.start()
+        else:
+            logger.warning("[Quota] QUOTA_ENFORCEMENT is on but SERVER_QUOTA_URL is missing")
+    http_runner = await start_http_server()
+    lag_task = asyncio.create_task(monitor_loop_lag())
+    try:
+        async with client:
+            await client.start(token)
+    finally:
+        lag_task.cancel()
+        if http_runner is not None:
+            await http_runner.cleanup()
+        quota_cache.stop()
+        await usage_aggregator.close()
+        if LIVE_INGEST and N8N_INGEST_WEBHOOK_URL:
+            await live_ingest.close()
+        await close_http_session()
+
+
+# --- Multi-process launcher -------------------------------------------------
+async def fetch_recommended_shards(token: str) -> int:
+    session = await get_http_session()
+    try:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+            timeout=aiohttp.ClientTimeout(total=SUPABASE_TIMEOUT_SECONDS),
+        ) as resp:
+            resp.raise_for_status()
+            return int((await resp.json())["shards"])
+    finally:
+        await close_http_session()
+
+
+def shard_ranges(shard_count: int, workers: int) -> List[List[int]]:
+    """Spread shard IDs over workers in contiguous, near-equal ranges."""
+    workers = max(1, min(workers, shard_count))
+    base, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def _state_path_for_worker(path: str, worker: int) -> str:
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{worker}{ext}"
+
+
+def worker_env(worker: int, shard_ids: List[int], shard_count: int, workers: int = 1) -> Dict[str, str]:
+    """Environment for one worker: shared config plus its own shards, port and state files."""
+    env = dict(os.environ)
+    peers = [BRIDGE_HTTP_PORT + i for i in range(workers) if i != worker] if BRIDGE_HTTP_PORT else []
+    env.update({
+        "BRIDGE_WORKER": str(worker),
+        "SHARD_COUNT": str(shard_count),
+        "SHARD_IDS": ",".join(str(i) for i in shard_ids),
+        "BRIDGE_HTTP_PORT": str(BRIDGE_HTTP_PORT + worker) if BRIDGE_HTTP_PORT else "0",
+        "BRIDGE_PEER_PORTS": ",".join(str(port) for port in peers),
+        "USAGE_SPOOL_PATH": _state_path_for_worker(USAGE_SPOOL_PATH, worker),
+        "GUILD_SYNC_STATE_PATH": _state_path_for_worker(GUILD_SYNC_STATE_PATH, worker),
+    })
+    return env
+
+
+def run_workers(token: str, workers: int, shard_count: Optional[int]):
+    """Start one bridge process per shard range and restart any that die."""
+    if not shard_count:
+        shard_count = asyncio.run(fetch_recommended_shards(token))
+    ranges = shard_ranges(shard_count, workers)
+    logger.info("[Launcher] %d shard(s) across %d worker(s)", shard_count, len(ranges))
+
+    def spawn(i):
+        logger.info("[Launcher] Starting worker %d with shards %s", i, ranges[i])
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env=worker_env(i, ranges[i], shard_count, len(ranges)),
+        )
+
+    procs = {i: spawn(i) for i in range(len(ranges))}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in procs.values():
+            proc.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while procs:
+        for i, proc in list(procs.items()):
+            code = proc.poll()
+            if code is None:
+                continue
+            if stopping:
+                del procs[i]
+            else:
+                logger.warning("[Launcher] Worker %d exited with %s; restarting", i, code)
+                time.sleep(WORKER_RESTART_SECONDS)
+                procs[i] = spawn(i)
+        time.sleep(1)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gravilo Discord bridge")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run a sharded launcher with this many worker processes")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="total shard count (default: Discord's recommendation)")
+    args = parser.parse_args()
+
     token = os.getenv("DISCORD_TOKEN")
     if not token:
         logger.error("DISCORD_TOKEN is not set.")
         sys.exit(1)
-    client.run(token)
+    try:
+        if args.workers:
+            run_workers(token, args.workers, args.shards or SHARD_COUNT)
+        else:
+            asyncio.run(main(token))
+    except KeyboardInterrupt:
+        pass
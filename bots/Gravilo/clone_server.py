@@ -5,7 +5,10 @@ This script clones all roles, channels, categories, and permissions from a sourc
 Discord server to a target Discord server.
 
 Usage:
-    python clone_server.py <source_guild_id> <target_guild_id>
+    python clone_server.py <source_guild_id> <target_guild_id> [--resume]
+    python clone_server.py <source_guild_id> <target_guild_id> --sync [--dry-run]
+    python clone_server.py snapshot <source_guild_id> <snapshot_file>
+    python clone_server.py restore <snapshot_file> <target_guild_id> [<target_guild_id> ...] [--sync [--dry-run] | --resume]
 
 Requirements:
     - Bot must have Administrator permissions in both servers
@@ -17,14 +20,42 @@ The script will:
 2. Clone all categories
 3. Clone all channels (text, voice, announcement, forum)
 4. Clone channel-specific permission overwrites
+
+Full clones record each finished step and every created role, category
+and channel in a local SQLite journal (CLONE_JOURNAL_DB). If a clone dies
+halfway, re-run it with --resume to skip everything already done.
+
+With --sync, nothing is wiped: roles are matched by name, categories by
+name and channels by type, name and parent category. Only the differences
+are applied (creates, updates of permissions, overwrites, topic, slowmode
+and bitrate, and deletes), so channel IDs and history survive. --dry-run
+prints the plan without touching the target.
+
+Every clone reads the source into a snapshot first. `snapshot` writes it to
+a versioned JSON file (gzipped if the name ends in .gz), and `restore`
+applies a file to one or more target guilds concurrently, so the bot only
+needs to be in the target guilds. Each target gets its own CloneJob with
+its own ID maps.
+
+Independent API calls (deletes, creates) run concurrently, up to
+CLONE_CONCURRENCY at a time per target; discord.py queues each one on its
+route's rate-limit bucket. Role order and channel order are applied
+afterwards in one bulk call each instead of passing a position on every
+create.
 """
 
 import discord
 from discord.ext import commands
+import argparse
 import asyncio
+import gzip
+import json
+import sqlite3
 import sys
 import os
-from typing import Dict, List
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
 
 # Bot setup
 intents = discord.Intents.default()
@@ -32,250 +63,886 @@ intents.guilds = True
 intents.members = True  # Needed to see role assignments
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# Mapping to track old IDs -> new IDs
-role_map: Dict[int, int] = {}
-channel_map: Dict[int, int] = {}
-category_map: Dict[int, int] = {}
-
-
-async def clone_roles(source_guild: discord.Guild, target_guild: discord.Guild):
-    """Clone all roles from source to target, maintaining hierarchy."""
-    print(f"\n📋 Cloning roles from '{source_guild.name}' to '{target_guild.name}'...")
-    
-    # Get roles sorted by position (highest first, excluding @everyone)
-    source_roles = sorted(
-        [r for r in source_guild.roles if r.name != "@everyone"],
-        key=lambda r: r.position,
-        reverse=True
-    )
-    
-    # Clear existing roles in target (except @everyone and bot role)
-    bot_member = target_guild.get_member(bot.user.id)
-    bot_role_ids = {r.id for r in bot_member.roles if r.name != "@everyone"}
-    
-    for role in target_guild.roles:
-        if role.name != "@everyone" and role.id not in bot_role_ids:
-            try:
-                await role.delete(reason="Clearing for server clone")
-                print(f"  🗑️  Deleted existing role: {role.name}")
-            except Exception as e:
-                print(f"  ⚠️  Could not delete role {role.name}: {e}")
-    
-    # Create new roles
-    for source_role in source_roles:
+# Max API calls in flight at once, per target guild
+CLONE_CONCURRENCY = int(os.getenv("CLONE_CONCURRENCY", "8"))
+
+SNAPSHOT_VERSION = 1
+
+# Progress and ID maps of clone jobs, so an interrupted clone can --resume
+JOURNAL_DB = os.getenv("CLONE_JOURNAL_DB", "clone_journal.db")
+
+# Parsed command line, set by main()
+options: argparse.Namespace
+
+
+# --- Snapshots ---
+
+def channel_kind(channel) -> Optional[str]:
+    """Kind used to match channels; announcement channels are cloned as text."""
+    if isinstance(channel, discord.CategoryChannel):
+        return "category"
+    if isinstance(channel, discord.TextChannel):
+        return "text"
+    if isinstance(channel, discord.VoiceChannel):
+        return "voice"
+    if isinstance(channel, discord.ForumChannel):
+        return "forum"
+    return None
+
+
+def snapshot_overwrites(overwrites) -> List[List[int]]:
+    """Role overwrites as [role_id, allow, deny]; member overwrites are not cloned."""
+    rows = []
+    for target, perms in overwrites.items():
+        if isinstance(target, discord.Role):
+            allow, deny = perms.pair()
+            rows.append([target.id, allow.value, deny.value])
+    return rows
+
+
+def take_snapshot(guild: discord.Guild) -> Dict:
+    """Read a guild's roles, categories, channels and overwrites into plain data."""
+    roles = [
+        {
+            "id": r.id,
+            "name": r.name,
+            "position": r.position,
+            "default": r.is_default(),
+            "managed": r.managed,
+            "permissions": r.permissions.value,
+            "colour": r.colour.value,
+            "hoist": r.hoist,
+            "mentionable": r.mentionable,
+        }
+        for r in guild.roles
+    ]
+    categories = [
+        {"id": c.id, "name": c.name, "position": c.position, "overwrites": snapshot_overwrites(c.overwrites)}
+        for c in guild.categories
+    ]
+    channels = []
+    for c in guild.channels:
+        kind = channel_kind(c)
+        if kind == "category":
+            continue
+        if kind is None:
+            print(f"  ⚠️  Skipping unknown channel type: {c.name}")
+            continue
+        channel = {
+            "id": c.id,
+            "type": kind,
+            "name": c.name,
+            "position": c.position,
+            "category_id": c.category_id,
+            "overwrites": snapshot_overwrites(c.overwrites),
+        }
+        if kind in ("text", "forum"):
+            channel.update(topic=c.topic, nsfw=c.nsfw)
+        if kind == "text":
+            channel["slowmode_delay"] = c.slowmode_delay
+        if kind == "voice":
+            channel.update(bitrate=c.bitrate, user_limit=c.user_limit)
+        channels.append(channel)
+    return {
+        "version": SNAPSHOT_VERSION,
+        "guild": {"id": guild.id, "name": guild.name},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "roles": roles,
+        "categories": categories,
+        "channels": channels,
+    }
+
+
+def write_snapshot(snapshot: Dict, path: str):
+    data = json.dumps(snapshot, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if path.endswith(".gz"):
+        data = gzip.compress(data)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read_snapshot(path: str) -> Dict:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    snapshot = json.loads(data)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {snapshot.get('version')!r} in {path}")
+    return snapshot
+
+
+# --- Journal ---
+
+class CloneJournal:
+    """SQLite record of each target guild's clone: finished steps and created IDs.
+
+    Every successful operation is committed as it happens, so a crashed or
+    rate-limited clone can resume with only the remaining operations.
+    """
+
+    def __init__(self, path=JOURNAL_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """CREATE TABLE IF NOT EXISTS clone_jobs (
+                target_guild_id INTEGER PRIMARY KEY,
+                source_guild_id INTEGER NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS clone_steps (
+                target_guild_id INTEGER NOT NULL,
+                step TEXT NOT NULL,
+                PRIMARY KEY (target_guild_id, step)
+            );
+            CREATE TABLE IF NOT EXISTS clone_ids (
+                target_guild_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                source_id INTEGER NOT NULL,
+                target_id INTEGER NOT NULL,
+                PRIMARY KEY (target_guild_id, kind, source_id)
+            );"""
+        )
+        self.conn.commit()
+
+    def job(self, target_guild_id) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT source_guild_id, started_at, finished_at FROM clone_jobs WHERE target_guild_id = ?",
+            (target_guild_id,),
+        ).fetchone()
+        return dict(zip(("source_guild_id", "started_at", "finished_at"), row)) if row else None
+
+    def start(self, target_guild_id, source_guild_id):
+        """Forget any earlier clone into this guild and open a new one."""
+        for table in ("clone_jobs", "clone_steps", "clone_ids"):
+            self.conn.execute(f"DELETE FROM {table} WHERE target_guild_id = ?", (target_guild_id,))
+        self.conn.execute(
+            "INSERT INTO clone_jobs (target_guild_id, source_guild_id, started_at) VALUES (?, ?, ?)",
+            (target_guild_id, source_guild_id, datetime.now(timezone.utc).isoformat()),
+        )
+        self.conn.commit()
+
+    def steps(self, target_guild_id) -> set:
+        rows = self.conn.execute("SELECT step FROM clone_steps WHERE target_guild_id = ?", (target_guild_id,))
+        return {row[0] for row in rows}
+
+    def complete_step(self, target_guild_id, step):
+        self.conn.execute("INSERT OR IGNORE INTO clone_steps VALUES (?, ?)", (target_guild_id, step))
+        self.conn.commit()
+
+    def ids(self, target_guild_id, kind) -> Dict[int, int]:
+        rows = self.conn.execute(
+            "SELECT source_id, target_id FROM clone_ids WHERE target_guild_id = ? AND kind = ?",
+            (target_guild_id, kind),
+        )
+        return dict(rows.fetchall())
+
+    def record(self, target_guild_id, kind, source_id, target_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO clone_ids VALUES (?, ?, ?, ?)", (target_guild_id, kind, source_id, target_id)
+        )
+        self.conn.commit()
+
+    def finish(self, target_guild_id):
+        self.conn.execute(
+            "UPDATE clone_jobs SET finished_at = ? WHERE target_guild_id = ?",
+            (datetime.now(timezone.utc).isoformat(), target_guild_id),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# --- Clone jobs ---
+
+class SyncStep(NamedTuple):
+    action: str  # "create", "update" or "delete"
+    kind: str  # "role", "category", "text", "voice" or "forum"
+    name: str
+    source: Optional[Dict]  # snapshot record
+    target: object  # live role or channel
+    changes: List[str]  # field names to copy from source on update
+
+
+class SyncPlan:
+    """Minimal set of operations that brings the target in line with the source."""
+
+    def __init__(self):
+        self.roles: List[SyncStep] = []
+        self.channels: List[SyncStep] = []  # categories first, then channels
+        self.reorder_roles = False
+
+    def steps(self) -> List[SyncStep]:
+        return self.roles + self.channels
+
+    def count(self, action: str) -> int:
+        return sum(1 for step in self.steps() if step.action == action)
+
+
+SYNC_SYMBOLS = {"create": "➕", "update": "✏️ ", "delete": "➖"}
+
+
+def pair_by_key(sources: Iterable[Dict], targets: Iterable, key: Callable, target_key: Callable):
+    """Pair snapshot records with live objects whose keys match, in position order.
+
+    Returns (pairs, unmatched sources, unmatched targets); duplicates pair up
+    by their order among objects with the same key.
+    """
+    buckets: Dict[object, List] = {}
+    for target in sorted(targets, key=lambda o: o.position):
+        buckets.setdefault(target_key(target), []).append(target)
+    pairs, unmatched = [], []
+    for source in sorted(sources, key=lambda s: s["position"]):
+        bucket = buckets.get(key(source))
+        if bucket:
+            pairs.append((source, bucket.pop(0)))
+        else:
+            unmatched.append(source)
+    return pairs, unmatched, [t for bucket in buckets.values() for t in bucket]
+
+
+def role_settings(role: Dict) -> Dict:
+    if role["default"]:
+        return {"permissions": discord.Permissions(role["permissions"])}
+    return {
+        "permissions": discord.Permissions(role["permissions"]),
+        "colour": discord.Colour(role["colour"]),
+        "hoist": role["hoist"],
+        "mentionable": role["mentionable"],
+    }
+
+
+def channel_settings(channel: Dict, target_guild: discord.Guild) -> Dict:
+    """Settings copied for this kind of channel (overwrites and category are handled separately)."""
+    settings = {
+        field: channel[field]
+        for field in ("topic", "nsfw", "slowmode_delay", "user_limit")
+        if field in channel
+    }
+    if "bitrate" in channel:
+        # The target may not be boosted enough for the source's bitrate
+        settings["bitrate"] = min(channel["bitrate"], int(target_guild.bitrate_limit))
+    return settings
+
+
+def changed_fields(desired: Dict, target) -> List[str]:
+    # Discord reports an unset topic as either None or ""
+    return [field for field, value in desired.items() if (getattr(target, field) or None) != (value or None)]
+
+
+class CloneJob:
+    """Clones or syncs one snapshot into one target guild.
+
+    Holds this job's source ID -> created/matched object maps, so several
+    jobs can run side by side in one process.
+    """
+
+    def __init__(self, snapshot: Dict, target_guild: discord.Guild, concurrency: int = CLONE_CONCURRENCY,
+                 label: str = "", journal: Optional[CloneJournal] = None):
+        self.snapshot = snapshot
+        self.guild = target_guild
+        self.label = label
+        self.journal = journal
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.roles: Dict[int, discord.Role] = {}
+        self.categories: Dict[int, discord.CategoryChannel] = {}
+        self.channels: Dict[int, discord.abc.GuildChannel] = {}
+        # Target channel/category ID -> position to apply in the final bulk update
+        self.channel_positions: Dict[int, int] = {}
+        self.failures = 0
+        # Bot and integration roles come with their bot, so they are never created
+        self.source_roles = [r for r in snapshot["roles"] if not r["default"] and not r["managed"]]
+        self.source_default_role = next(r for r in snapshot["roles"] if r["default"])
+
+    def log(self, message: str):
+        print(f"{self.label}{message}")
+
+    async def run_concurrently(self, operations: Iterable[Callable[[], Awaitable]]) -> List:
+        """Run coroutine factories, at most `concurrency` in flight for this target."""
+        async def run(operation):
+            async with self.semaphore:
+                return await operation()
+
+        return await asyncio.gather(*(run(operation) for operation in operations))
+
+    def map_overwrites(self, overwrites: List[List[int]]) -> Dict:
+        """Translate snapshot overwrites to the target guild's roles."""
+        mapped = {}
+        for role_id, allow, deny in overwrites:
+            if role_id == self.source_default_role["id"]:
+                role = self.guild.default_role
+            elif role_id in self.roles:
+                role = self.roles[role_id]
+            else:
+                continue
+            mapped[role] = discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+        return mapped
+
+    def protected_role_ids(self) -> set:
+        """Roles the clone must never delete: the bot's own roles."""
+        return {r.id for r in self.guild.me.roles if not r.is_default()}
+
+    def record(self, kind: str, source_id: int, target):
+        if self.journal:
+            self.journal.record(self.guild.id, kind, source_id, target.id)
+
+    def complete_step(self, step: str):
+        if self.journal:
+            self.journal.complete_step(self.guild.id, step)
+
+    def open_journal(self, resume: bool) -> Optional[set]:
+        """Start this job's journal, or reload its ID maps to resume.
+
+        Returns the steps already finished, or None if there is nothing to do.
+        """
+        if not self.journal:
+            return set()
+        source_id = self.snapshot["guild"]["id"]
+        job = self.journal.job(self.guild.id)
+        if resume and job:
+            if job["source_guild_id"] != source_id:
+                self.log(f"❌ The unfinished clone into '{self.guild.name}' came from server {job['source_guild_id']}, not resuming")
+                return None
+            if job["finished_at"]:
+                self.log(f"✅ The clone into '{self.guild.name}' already finished at {job['finished_at']}")
+                return None
+            return self.load_journal()
+        if resume:
+            self.log(f"⚠️  No clone into '{self.guild.name}' to resume, starting from scratch")
+        elif job and not job["finished_at"]:
+            self.log("⚠️  Discarding an unfinished clone (use --resume to continue it)")
+        self.journal.start(self.guild.id, source_id)
+        return set()
+
+    def load_journal(self) -> set:
+        """Map source IDs to the objects an earlier run created, if they still exist."""
+        categories = {c["id"]: c for c in self.snapshot["categories"]}
+        channels = {c["id"]: c for c in self.snapshot["channels"]}
+        source_role_ids = {r["id"] for r in self.source_roles}
+        for source_id, target_id in self.journal.ids(self.guild.id, "role").items():
+            role = self.guild.get_role(target_id)
+            if role and source_id in source_role_ids:
+                self.roles[source_id] = role
+        for kind, sources, created in (("category", categories, self.categories), ("channel", channels, self.channels)):
+            for source_id, target_id in self.journal.ids(self.guild.id, kind).items():
+                channel = self.guild.get_channel(target_id)
+                if channel and source_id in sources:
+                    created[source_id] = channel
+                    self.channel_positions[channel.id] = sources[source_id]["position"]
+        self.log(
+            f"⏩ Resuming clone into '{self.guild.name}': {self.role_count()} roles, "
+            f"{len(self.categories)} categories and {len(self.channels)} channels already done"
+        )
+        return self.journal.steps(self.guild.id)
+
+    def role_count(self) -> int:
+        return sum(1 for r in self.source_roles if r["id"] in self.roles)
+
+    def match_managed_roles(self):
+        """Map source bot/integration roles to the target's by name, so their overwrites carry over."""
+        managed = {r.name: r for r in self.guild.roles if r.managed}
+        for role in self.snapshot["roles"]:
+            if role["managed"] and role["name"] in managed:
+                self.roles[role["id"]] = managed[role["name"]]
+
+    # Single operations
+
+    async def delete_role(self, role: discord.Role):
         try:
-            new_role = await target_guild.create_role(
-                name=source_role.name,
-                permissions=source_role.permissions,
-                color=source_role.color,
-                hoist=source_role.hoist,
-                mentionable=source_role.mentionable,
+            await role.delete(reason="Clearing for server clone")
+            self.log(f"  🗑️  Deleted existing role: {role.name}")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ⚠️  Could not delete role {role.name}: {e}")
+
+    async def create_role(self, source_role: Dict):
+        try:
+            settings = role_settings(source_role)
+            new_role = await self.guild.create_role(
+                name=source_role["name"],
+                permissions=settings["permissions"],
+                color=settings["colour"],
+                hoist=settings["hoist"],
+                mentionable=settings["mentionable"],
                 reason="Server clone"
             )
-            role_map[source_role.id] = new_role.id
-            print(f"  ✅ Created role: {source_role.name}")
+            self.roles[source_role["id"]] = new_role
+            self.record("role", source_role["id"], new_role)
+            self.log(f"  ✅ Created role: {source_role['name']}")
         except Exception as e:
-            print(f"  ❌ Failed to create role {source_role.name}: {e}")
-    
-    print(f"✅ Cloned {len(role_map)} roles")
-
-
-async def clone_categories(source_guild: discord.Guild, target_guild: discord.Guild):
-    """Clone all categories from source to target."""
-    print(f"\n📁 Cloning categories...")
-    
-    # Get categories sorted by position
-    source_categories = sorted(
-        source_guild.categories,
-        key=lambda c: c.position
-    )
-    
-    for source_cat in source_categories:
+            self.failures += 1
+            self.log(f"  ❌ Failed to create role {source_role['name']}: {e}")
+
+    async def update_role(self, step: SyncStep):
+        try:
+            settings = role_settings(step.source)
+            await step.target.edit(**{field: settings[field] for field in step.changes}, reason="Server sync")
+            self.log(f"  ✏️  Updated role {step.name}: {', '.join(step.changes)}")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ❌ Failed to update role {step.name}: {e}")
+
+    async def apply_role_positions(self):
+        """Mirror the source hierarchy: lowest source role at 1, each higher one above it."""
+        positions = {
+            self.roles[r["id"]]: index
+            for index, r in enumerate(sorted(self.source_roles, key=lambda r: r["position"]), start=1)
+            if r["id"] in self.roles
+        }
+        if not positions:
+            return
+        try:
+            await self.guild.edit_role_positions(positions, reason="Server clone")
+            self.log(f"  ↕️  Ordered {len(positions)} roles")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ⚠️  Could not order roles: {e}")
+
+    async def delete_channel(self, channel):
+        try:
+            await channel.delete(reason="Clearing for server clone")
+            self.log(f"  🗑️  Deleted existing channel: {channel.name}")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ⚠️  Could not delete channel {channel.name}: {e}")
+
+    async def create_category(self, source_cat: Dict):
         try:
-            # Clone permission overwrites
-            overwrites = {}
-            for target, perms in source_cat.overwrites.items():
-                if isinstance(target, discord.Role):
-                    if target.id in role_map:
-                        new_role = target_guild.get_role(role_map[target.id])
-                        overwrites[new_role] = perms
-                    elif target.name == "@everyone":
-                        overwrites[target_guild.default_role] = perms
-            
-            new_category = await target_guild.create_category(
-                name=source_cat.name,
-                overwrites=overwrites,
-                position=source_cat.position,
+            new_category = await self.guild.create_category(
+                name=source_cat["name"],
+                overwrites=self.map_overwrites(source_cat["overwrites"]),
                 reason="Server clone"
             )
-            category_map[source_cat.id] = new_category.id
-            print(f"  ✅ Created category: {source_cat.name}")
+            self.categories[source_cat["id"]] = new_category
+            self.record("category", source_cat["id"], new_category)
+            self.channel_positions[new_category.id] = source_cat["position"]
+            self.log(f"  ✅ Created category: {source_cat['name']}")
         except Exception as e:
-            print(f"  ❌ Failed to create category {source_cat.name}: {e}")
-    
-    print(f"✅ Cloned {len(category_map)} categories")
-
-
-async def clone_channels(source_guild: discord.Guild, target_guild: discord.Guild):
-    """Clone all channels from source to target."""
-    print(f"\n💬 Cloning channels...")
-    
-    # Delete existing channels (except those with bots)
-    for channel in target_guild.channels:
-        if not isinstance(channel, discord.CategoryChannel):
-            try:
-                await channel.delete(reason="Clearing for server clone")
-                print(f"  🗑️  Deleted existing channel: {channel.name}")
-            except Exception as e:
-                print(f"  ⚠️  Could not delete channel {channel.name}: {e}")
-    
-    # Get all channels sorted by position
-    source_channels = sorted(
-        [c for c in source_guild.channels if not isinstance(c, discord.CategoryChannel)],
-        key=lambda c: c.position
-    )
-    
-    for source_channel in source_channels:
+            self.failures += 1
+            self.log(f"  ❌ Failed to create category {source_cat['name']}: {e}")
+
+    async def create_channel(self, source_channel: Dict):
         try:
-            # Clone permission overwrites
-            overwrites = {}
-            for target, perms in source_channel.overwrites.items():
-                if isinstance(target, discord.Role):
-                    if target.id in role_map:
-                        new_role = target_guild.get_role(role_map[target.id])
-                        overwrites[new_role] = perms
-                    elif target.name == "@everyone":
-                        overwrites[target_guild.default_role] = perms
-            
-            # Get parent category if exists
-            category = None
-            if source_channel.category_id and source_channel.category_id in category_map:
-                category = target_guild.get_channel(category_map[source_channel.category_id])
-            
-            # Create channel based on type
-            if isinstance(source_channel, discord.TextChannel):
-                new_channel = await target_guild.create_text_channel(
-                    name=source_channel.name,
-                    topic=source_channel.topic,
-                    position=source_channel.position,
-                    nsfw=source_channel.nsfw,
-                    slowmode_delay=source_channel.slowmode_delay,
-                    category=category,
-                    overwrites=overwrites,
-                    reason="Server clone"
-                )
-                print(f"  ✅ Created text channel: #{source_channel.name}")
-            
-            elif isinstance(source_channel, discord.VoiceChannel):
-                new_channel = await target_guild.create_voice_channel(
-                    name=source_channel.name,
-                    bitrate=source_channel.bitrate,
-                    user_limit=source_channel.user_limit,
-                    position=source_channel.position,
-                    category=category,
-                    overwrites=overwrites,
-                    reason="Server clone"
-                )
-                print(f"  ✅ Created voice channel: 🔊 {source_channel.name}")
-            
-            elif isinstance(source_channel, discord.ForumChannel):
-                new_channel = await target_guild.create_forum_channel(
-                    name=source_channel.name,
-                    topic=source_channel.topic,
-                    position=source_channel.position,
-                    nsfw=source_channel.nsfw,
-                    category=category,
-                    overwrites=overwrites,
-                    reason="Server clone"
-                )
-                print(f"  ✅ Created forum channel: 📋 {source_channel.name}")
-            
+            kind = source_channel["type"]
+            # create_text_channel, create_voice_channel or create_forum_channel;
+            # position is applied in bulk afterwards
+            new_channel = await getattr(self.guild, f"create_{kind}_channel")(
+                name=source_channel["name"],
+                category=self.categories.get(source_channel["category_id"]),
+                overwrites=self.map_overwrites(source_channel["overwrites"]),
+                reason="Server clone",
+                **channel_settings(source_channel, self.guild)
+            )
+            self.channels[source_channel["id"]] = new_channel
+            self.record("channel", source_channel["id"], new_channel)
+            self.channel_positions[new_channel.id] = source_channel["position"]
+            icon = {"text": "#", "voice": "🔊 ", "forum": "📋 "}[kind]
+            self.log(f"  ✅ Created {kind} channel: {icon}{source_channel['name']}")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ❌ Failed to create channel {source_channel['name']}: {e}")
+
+    async def update_channel(self, step: SyncStep):
+        try:
+            settings = channel_settings(step.source, self.guild)
+            changes = {field: settings[field] for field in step.changes if field in settings}
+            if "overwrites" in step.changes:
+                overwrites = self.map_overwrites(step.source["overwrites"])
+                # Member overwrites are never cloned, keep the target's own
+                overwrites.update({t: p for t, p in step.target.overwrites.items() if not isinstance(t, discord.Role)})
+                changes["overwrites"] = overwrites
+            if "category" in step.changes:
+                changes["category"] = self.categories.get(step.source["category_id"])
+            await step.target.edit(**changes, reason="Server sync")
+            self.log(f"  ✏️  Updated {step.kind} {step.name}: {', '.join(step.changes)}")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ❌ Failed to update {step.kind} {step.name}: {e}")
+
+    async def apply_channel_positions(self):
+        """Set every cloned category and channel's position in one bulk request."""
+        if not self.channel_positions:
+            return
+        payload = [{"id": channel_id, "position": position} for channel_id, position in self.channel_positions.items()]
+        try:
+            # discord.py only exposes the bulk endpoint through its HTTP client
+            await self.guild._state.http.bulk_channel_update(self.guild.id, payload, reason="Server clone")
+            self.log(f"  ↕️  Ordered {len(payload)} categories and channels")
+        except Exception as e:
+            self.failures += 1
+            self.log(f"  ⚠️  Could not order channels: {e}")
+
+    # Full clone
+
+    async def clone(self, resume: bool = False):
+        """Wipe the target and recreate everything: roles -> categories -> channels -> positions.
+
+        With resume, steps and objects the journal already has are skipped.
+        """
+        done = self.open_journal(resume)
+        if done is None:
+            return
+        self.log(f"\n📋 Cloning roles to '{self.guild.name}'...")
+        self.match_managed_roles()
+        if "roles_cleared" not in done:
+            # Clear existing roles in target (except @everyone, managed roles and the bot's roles)
+            bot_role_ids = self.protected_role_ids()
+            await self.run_concurrently(
+                lambda role=role: self.delete_role(role)
+                for role in self.guild.roles
+                if not role.is_default() and role.id not in bot_role_ids and not role.managed
+            )
+            self.complete_step("roles_cleared")
+        # Highest first, so the most important roles exist soonest
+        await self.run_concurrently(
+            lambda r=r: self.create_role(r)
+            for r in sorted(self.source_roles, key=lambda r: r["position"], reverse=True)
+            if r["id"] not in self.roles
+        )
+        # Creates finish in any order, so set the hierarchy in one call
+        await self.apply_role_positions()
+        self.log(f"✅ Cloned {self.role_count()} roles")
+
+        self.log("\n📁 Cloning categories...")
+        await self.run_concurrently(
+            lambda c=c: self.create_category(c) for c in self.snapshot["categories"] if c["id"] not in self.categories
+        )
+        self.log(f"✅ Cloned {len(self.categories)} categories")
+
+        self.log("\n💬 Cloning channels...")
+        if "channels_cleared" not in done:
+            await self.run_concurrently(
+                lambda c=c: self.delete_channel(c)
+                for c in self.guild.channels
+                if not isinstance(c, discord.CategoryChannel)
+            )
+            self.complete_step("channels_cleared")
+        await self.run_concurrently(
+            lambda c=c: self.create_channel(c) for c in self.snapshot["channels"] if c["id"] not in self.channels
+        )
+        self.log(f"✅ Cloned {len(self.channels)} channels")
+
+        await self.apply_channel_positions()
+        if self.failures:
+            self.log(f"\n⚠️  {self.failures} operations failed; run again with --resume to carry on from here")
+        elif self.journal:
+            self.journal.finish(self.guild.id)
+
+    # Sync
+
+    def overwrites_differ(self, source: Dict, target) -> bool:
+        if any(
+            role_id != self.source_default_role["id"] and role_id not in self.roles
+            for role_id, _, _ in source["overwrites"]
+        ):
+            return True  # refers to a role that is still to be created
+        desired = {role.id: perms for role, perms in self.map_overwrites(source["overwrites"]).items()}
+        current = {role.id: perms for role, perms in target.overwrites.items() if isinstance(role, discord.Role)}
+        return desired != current
+
+    def plan(self) -> SyncPlan:
+        """Match source and target objects by name, type and parent and diff them.
+
+        Matched objects are recorded in the ID maps so overwrites resolve to
+        existing roles and channels land in existing categories.
+        """
+        plan = SyncPlan()
+        self.match_managed_roles()
+
+        # Roles, matched by name; @everyone always pairs with @everyone
+        bot_role_ids = self.protected_role_ids()
+        target_roles = [r for r in self.guild.roles if not r.is_default() and r.id not in bot_role_ids and not r.managed]
+        role_pairs, to_create, to_delete = pair_by_key(
+            self.source_roles, target_roles, key=lambda r: r["name"], target_key=lambda r: r.name
+        )
+        for source, target in role_pairs:
+            self.roles[source["id"]] = target
+        for source, target in role_pairs + [(self.source_default_role, self.guild.default_role)]:
+            changes = changed_fields(role_settings(source), target)
+            if changes:
+                plan.roles.append(SyncStep("update", "role", source["name"], source, target, changes))
+        plan.roles += [SyncStep("create", "role", r["name"], r, None, []) for r in to_create]
+        plan.roles += [SyncStep("delete", "role", r.name, None, r, []) for r in to_delete]
+        current_order = [t.id for _, t in sorted(role_pairs, key=lambda pair: pair[1].position)]
+        desired_order = [t.id for _, t in sorted(role_pairs, key=lambda pair: pair[0]["position"])]
+        plan.reorder_roles = bool(to_create) or current_order != desired_order
+
+        # Categories, matched by name
+        category_pairs, cats_to_create, cats_to_delete = pair_by_key(
+            self.snapshot["categories"], self.guild.categories, key=lambda c: c["name"], target_key=lambda c: c.name
+        )
+        for source, target in category_pairs:
+            self.categories[source["id"]] = target
+            if self.overwrites_differ(source, target):
+                plan.channels.append(SyncStep("update", "category", source["name"], source, target, ["overwrites"]))
+        plan.channels += [SyncStep("create", "category", c["name"], c, None, []) for c in cats_to_create]
+
+        # Channels, matched by kind, name and (already matched) parent category
+        def source_key(channel):
+            category_id = channel["category_id"]
+            if category_id is None:
+                parent = None
+            elif category_id in self.categories:
+                parent = self.categories[category_id].id
             else:
-                print(f"  ⚠️  Skipping unknown channel type: {source_channel.name}")
-                continue
-            
-            channel_map[source_channel.id] = new_channel.id
-        
+                parent = f"new:{category_id}"  # category still to be created, matches nothing
+            return channel["type"], channel["name"], parent
+
+        def target_key(channel):
+            return channel_kind(channel), channel.name, channel.category_id
+
+        # Kinds snapshots do not cover (e.g. stage channels) are left alone
+        target_channels = [c for c in self.guild.channels if channel_kind(c) not in ("category", None)]
+        channel_pairs, unmatched, leftovers = pair_by_key(
+            self.snapshot["channels"], target_channels, source_key, target_key
+        )
+        # A channel that only moved category is edited, not recreated
+        moved, unmatched, leftovers = pair_by_key(
+            unmatched, leftovers, key=lambda c: (c["type"], c["name"]), target_key=lambda c: (channel_kind(c), c.name)
+        )
+        for (source, target), was_moved in [(pair, False) for pair in channel_pairs] + [(pair, True) for pair in moved]:
+            self.channels[source["id"]] = target
+            changes = changed_fields(channel_settings(source, self.guild), target)
+            if self.overwrites_differ(source, target):
+                changes.append("overwrites")
+            if was_moved:
+                changes.append("category")
+            if changes:
+                plan.channels.append(SyncStep("update", source["type"], source["name"], source, target, changes))
+        plan.channels += [SyncStep("create", c["type"], c["name"], c, None, []) for c in unmatched]
+        plan.channels += [SyncStep("delete", channel_kind(c), c.name, None, c, []) for c in leftovers]
+        plan.channels += [SyncStep("delete", "category", c.name, None, c, []) for c in cats_to_delete]
+
+        # Positions: only what differs, created objects are added as they are made
+        for source, target in category_pairs + channel_pairs + moved:
+            if source["position"] != target.position:
+                self.channel_positions[target.id] = source["position"]
+        return plan
+
+    def print_plan(self, plan: SyncPlan):
+        self.log(
+            f"\n📝 Sync plan for '{self.guild.name}': {plan.count('create')} to create, "
+            f"{plan.count('update')} to update, {plan.count('delete')} to delete"
+        )
+        for step in plan.steps():
+            detail = f": {', '.join(step.changes)}" if step.changes else ""
+            self.log(f"  {SYNC_SYMBOLS[step.action]} {step.kind} {step.name}{detail}")
+        if plan.reorder_roles:
+            self.log("  ↕️  role order")
+        if self.channel_positions:
+            self.log(f"  ↕️  {len(self.channel_positions)} channel positions")
+
+    async def apply(self, plan: SyncPlan):
+        """Apply a plan; roles go first so channel overwrites can refer to them."""
+        def steps(group: List[SyncStep], action: str, categories: Optional[bool] = None) -> List[SyncStep]:
+            return [
+                s for s in group
+                if s.action == action and (categories is None or (s.kind == "category") == categories)
+            ]
+
+        self.log("\n📋 Syncing roles...")
+        await self.run_concurrently(lambda s=s: self.delete_role(s.target) for s in steps(plan.roles, "delete"))
+        await self.run_concurrently(lambda s=s: self.create_role(s.source) for s in steps(plan.roles, "create"))
+        await self.run_concurrently(lambda s=s: self.update_role(s) for s in steps(plan.roles, "update"))
+        if plan.reorder_roles:
+            await self.apply_role_positions()
+
+        self.log("\n💬 Syncing categories and channels...")
+        for categories in (True, False):
+            create = self.create_category if categories else self.create_channel
+            await self.run_concurrently(lambda s=s: create(s.source) for s in steps(plan.channels, "create", categories))
+            await self.run_concurrently(lambda s=s: self.update_channel(s) for s in steps(plan.channels, "update", categories))
+        # Delete last, once surviving channels have left categories that are going away
+        await self.run_concurrently(lambda s=s: self.delete_channel(s.target) for s in steps(plan.channels, "delete", False))
+        await self.run_concurrently(lambda s=s: self.delete_channel(s.target) for s in steps(plan.channels, "delete", True))
+
+        await self.apply_channel_positions()
+
+    async def sync(self, dry_run: bool = False):
+        """Bring the target in line with the snapshot, touching only what differs."""
+        plan = self.plan()
+        self.print_plan(plan)
+        if dry_run:
+            self.log("\n🧪 Dry run, nothing was changed")
+            return
+        if not plan.steps() and not plan.reorder_roles and not self.channel_positions:
+            self.log("\n✅ Target is already in sync")
+            return
+        await self.apply(plan)
+
+    async def run(self, sync: bool = False, dry_run: bool = False, resume: bool = False):
+        if sync:
+            await self.sync(dry_run=dry_run)
+        else:
+            await self.clone(resume=resume)
+
+    def print_summary(self):
+        self.log(f"\n📊 Summary for '{self.guild.name}':")
+        self.log(f"   Roles: {self.role_count()}")
+        self.log(f"   Categories: {len(self.categories)}")
+        self.log(f"   Channels: {len(self.channels)}")
+
+
+async def restore(snapshot: Dict, target_guilds: List[discord.Guild], sync: bool = False, dry_run: bool = False,
+                  resume: bool = False, journal: Optional[CloneJournal] = None) -> List[CloneJob]:
+    """Apply one snapshot to several guilds at once, one independent job each.
+
+    Full clones record their progress in the journal (sync needs none: a
+    re-run plans only what is still missing).
+    """
+    multiple = len(target_guilds) > 1
+    jobs = [
+        CloneJob(snapshot, guild, label=f"[{guild.name}] " if multiple else "", journal=None if sync else journal)
+        for guild in target_guilds
+    ]
+
+    async def run(job: CloneJob):
+        try:
+            await job.run(sync=sync, dry_run=dry_run, resume=resume)
+            job.print_summary()
         except Exception as e:
-            print(f"  ❌ Failed to create channel {source_channel.name}: {e}")
-    
-    print(f"✅ Cloned {len(channel_map)} channels")
-
-
-async def clone_server(source_guild_id: int, target_guild_id: int):
-    """Main cloning function."""
-    source_guild = bot.get_guild(source_guild_id)
-    target_guild = bot.get_guild(target_guild_id)
-    
-    if not source_guild:
-        print(f"❌ Error: Bot is not in source server (ID: {source_guild_id})")
-        return
-    
-    if not target_guild:
-        print(f"❌ Error: Bot is not in target server (ID: {target_guild_id})")
+            job.log(f"\n❌ Error during cloning: {e}")
+            import traceback
+            traceback.print_exc()
+
+    await asyncio.gather(*(run(job) for job in jobs))
+    return jobs
+
+
+# --- Commands ---
+
+def get_guilds(guild_ids: List[int], role: str) -> Optional[List[discord.Guild]]:
+    guilds = []
+    for guild_id in guild_ids:
+        guild = bot.get_guild(guild_id)
+        if not guild:
+            print(f"❌ Error: Bot is not in {role} server (ID: {guild_id})")
+            return None
+        guilds.append(guild)
+    return guilds
+
+
+async def run_jobs(snapshot: Dict, targets: List[discord.Guild], sync: bool, dry_run: bool, resume: bool):
+    journal = CloneJournal()
+    started = time.monotonic()
+    try:
+        await restore(snapshot, targets, sync=sync, dry_run=dry_run, resume=resume, journal=journal)
+    finally:
+        journal.close()
+    print(f"\n✅ Finished in {time.monotonic() - started:.1f}s")
+
+
+async def clone_server(source_guild_id: int, target_guild_id: int, sync: bool = False, dry_run: bool = False,
+                       resume: bool = False):
+    """Main cloning function; with sync, only the differences are applied."""
+    sources = get_guilds([source_guild_id], "source")
+    targets = get_guilds([target_guild_id], "target")
+    if not sources or not targets:
         return
-    
-    print(f"\n🚀 Starting server clone...")
+    source_guild, target_guild = sources[0], targets[0]
+
+    print(f"\n🚀 Starting server {'sync' if sync else 'clone'}...")
     print(f"   Source: {source_guild.name} (ID: {source_guild.id})")
     print(f"   Target: {target_guild.name} (ID: {target_guild.id})")
-    
+
+    await run_jobs(take_snapshot(source_guild), [target_guild], sync, dry_run, resume)
+
+
+async def snapshot_server(source_guild_id: int, path: str):
+    sources = get_guilds([source_guild_id], "source")
+    if not sources:
+        return
+    snapshot = take_snapshot(sources[0])
+    write_snapshot(snapshot, path)
+    print(
+        f"\n📸 Saved snapshot of '{sources[0].name}' to {path}: {len(snapshot['roles'])} roles, "
+        f"{len(snapshot['categories'])} categories, {len(snapshot['channels'])} channels"
+    )
+
+
+async def restore_server(path: str, target_guild_ids: List[int], sync: bool = False, dry_run: bool = False,
+                         resume: bool = False):
     try:
-        # Clone in order: roles -> categories -> channels
-        await clone_roles(source_guild, target_guild)
-        await clone_categories(source_guild, target_guild)
-        await clone_channels(source_guild, target_guild)
-        
-        print(f"\n✅ ✅ ✅ Server clone completed successfully! ✅ ✅ ✅")
-        print(f"\n📊 Summary:")
-        print(f"   Roles: {len(role_map)}")
-        print(f"   Categories: {len(category_map)}")
-        print(f"   Channels: {len(channel_map)}")
-    
-    except Exception as e:
-        print(f"\n❌ Error during cloning: {e}")
-        import traceback
-        traceback.print_exc()
+        snapshot = read_snapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: Could not read snapshot: {e}")
+        return
+    targets = get_guilds(target_guild_ids, "target")
+    if not targets:
+        return
+    print(f"\n🚀 Restoring '{snapshot['guild']['name']}' ({snapshot['created_at']}) to {len(targets)} server(s)...")
+    await run_jobs(snapshot, targets, sync, dry_run, resume)
 
 
 @bot.event
 async def on_ready():
     """Called when bot is ready."""
     print(f"\n🤖 Bot connected as {bot.user}")
-    
-    if len(sys.argv) != 3:
-        print("\n❌ Usage: python clone_server.py <source_guild_id> <target_guild_id>")
-        await bot.close()
-        return
-    
-    try:
-        source_id = int(sys.argv[1])
-        target_id = int(sys.argv[2])
-    except ValueError:
-        print("\n❌ Error: Guild IDs must be integers")
-        await bot.close()
-        return
-    
-    await clone_server(source_id, target_id)
+
+    if options.command == "snapshot":
+        await snapshot_server(options.source_guild_id, options.file)
+    else:
+        job_options = dict(sync=options.sync, dry_run=options.dry_run, resume=options.resume)
+        if options.command == "restore":
+            await restore_server(options.file, options.target_guild_ids, **job_options)
+        else:
+            await clone_server(options.source_guild_id, options.target_guild_id, **job_options)
     await bot.close()
 
 
+def parse_args(argv=None) -> argparse.Namespace:
+    argv = sys.argv[1:] if argv is None else argv
+    # `clone` is the default command, so `clone_server.py <source> <target>` keeps working
+    if argv and argv[0] not in ("clone", "snapshot", "restore", "-h", "--help"):
+        argv = ["clone"] + argv
+
+    parser = argparse.ArgumentParser(description="Clone or sync a Discord server's roles, categories and channels")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    def add_job_flags(command):
+        command.add_argument("--sync", action="store_true",
+                             help="match existing roles and channels and apply only the differences")
+        command.add_argument("--dry-run", action="store_true",
+                             help="with --sync, print the plan without changing anything")
+        command.add_argument("--resume", action="store_true",
+                             help="continue an interrupted clone from its journal instead of starting over")
+
+    clone = subcommands.add_parser("clone", help="copy a live server into another one")
+    clone.add_argument("source_guild_id", type=int)
+    clone.add_argument("target_guild_id", type=int)
+    add_job_flags(clone)
+
+    snapshot = subcommands.add_parser("snapshot", help="save a server's structure to a file")
+    snapshot.add_argument("source_guild_id", type=int)
+    snapshot.add_argument("file")
+
+    restore_command = subcommands.add_parser("restore", help="apply a snapshot file to one or more servers")
+    restore_command.add_argument("file")
+    restore_command.add_argument("target_guild_ids", type=int, nargs="+")
+    add_job_flags(restore_command)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "dry_run", False) and not args.sync:
+        parser.error("--dry-run requires --sync")
+    if getattr(args, "resume", False) and args.sync:
+        parser.error("--resume is for full clones; an interrupted --sync just needs to be run again")
+    return args
+
+
 def main():
     """Entry point."""
+    global options
+    options = parse_args()
     token = os.getenv("DISCORD_BOT_TOKEN")
-    
+
     if not token:
         print("❌ Error: DISCORD_BOT_TOKEN environment variable not set")
         print("\nSet it using:")
         print("  Windows: set DISCORD_BOT_TOKEN=your_token_here")
         print("  Linux/Mac: export DISCORD_BOT_TOKEN=your_token_here")
         sys.exit(1)
-    
-    if len(sys.argv) != 3:
-        print("\n❌ Usage: python clone_server.py <source_guild_id> <target_guild_id>")
-        print("\nExample:")
-        print("  python clone_server.py 123456789 987654321")
-        sys.exit(1)
-    
+
     bot.run(token)
 
 
@@ -0,0 +1,402 @@
+"""
+Gravilo database admin: versioned migrations and a pgvector benchmark.
+
+`documents_pg` is created by the "Gravilo Admin DB Setup" workflow without
+any indexes, so every similarity search in Gravilo Core and every
+per-server delete in Gravilo Ingest Discord scans the whole table. The
+migrations here add the indexes those queries need:
+
+    1. Expression indexes on the metadata the workflows filter by
+       (source + server_id, file_id, content_hash, message_ids) and on
+       document_rows(dataset_id)
+    2. An HNSW index on embedding (cosine, like the PGVector node)
+
+Indexes are built CONCURRENTLY so ingestion and chat keep working while
+they build. Run against a direct connection, not a transaction pooler.
+
+Usage:
+    python db_admin.py status
+    python db_admin.py migrate [--to VERSION] [--dry-run]
+    python db_admin.py benchmark --rows 20000 --hnsw 16:64 --ivfflat 100 --json bench.json
+
+The benchmark never touches documents_pg: it builds a scratch schema with
+synthetic clustered vectors, then reports search latency and recall@k for
+each index setting, and delete latency before and after the metadata
+indexes. Point it at a local Postgres with pgvector.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+MIGRATIONS_TABLE = "gravilo_migrations"
+BENCH_SCHEMA = "gravilo_bench"
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    # Run one at a time outside a transaction (CREATE INDEX CONCURRENTLY
+    # refuses to run inside one), so every statement must be idempotent
+    statements: List[str]
+
+
+MIGRATIONS = [
+    Migration(1, "metadata and dataset indexes", [
+        # Discord deletes and hash checks filter on source + server_id; the
+        # leading source column also serves source-only filters
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_pg_source_server_id_idx "
+        "ON documents_pg ((metadata->>'source'), (metadata->>'server_id'))",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_pg_file_id_idx "
+        "ON documents_pg ((metadata->>'file_id'))",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_pg_content_hash_idx "
+        "ON documents_pg ((metadata->>'content_hash'))",
+        # `metadata->'message_ids' ?| array[...]` when edits replace documents
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_pg_message_ids_idx "
+        "ON documents_pg USING gin ((metadata->'message_ids'))",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS document_rows_dataset_id_idx "
+        "ON document_rows (dataset_id)",
+        # The planner only has statistics for expression indexes after ANALYZE
+        "ANALYZE documents_pg",
+        "ANALYZE document_rows",
+    ]),
+    Migration(2, "hnsw index on embedding", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_pg_embedding_hnsw_idx "
+        "ON documents_pg USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)",
+    ]),
+]
+
+
+# --- Migrations ---
+
+async def applied_versions(conn) -> Dict[int, str]:
+    await conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )"""
+    )
+    rows = await conn.fetch(f"SELECT version, applied_at FROM {MIGRATIONS_TABLE}")
+    return {row["version"]: row["applied_at"].isoformat() for row in rows}
+
+
+def pending_migrations(applied, target: Optional[int] = None) -> List[Migration]:
+    return [
+        m for m in sorted(MIGRATIONS, key=lambda m: m.version)
+        if m.version not in applied and (target is None or m.version <= target)
+    ]
+
+
+async def drop_invalid_indexes(conn):
+    """Drop indexes a failed CONCURRENTLY build left behind, so IF NOT EXISTS rebuilds them."""
+    rows = await conn.fetch(
+        """SELECT i.relname FROM pg_index x
+           JOIN pg_class i ON i.oid = x.indexrelid
+           JOIN pg_class t ON t.oid = x.indrelid
+           WHERE NOT x.indisvalid AND t.relname IN ('documents_pg', 'document_rows')
+             AND t.relnamespace = ANY (current_schemas(false)::regnamespace[])"""
+    )
+    for row in rows:
+        print(f"  Dropping invalid index {row['relname']} from an interrupted build")
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["relname"]}"')
+
+
+async def apply_migration(conn, migration: Migration, record: bool = True):
+    for statement in migration.statements:
+        started = time.perf_counter()
+        await conn.execute(statement)
+        print(f"    {time.perf_counter() - started:7.2f}s  {statement.split(' ON ')[0]}")
+    if record:
+        await conn.execute(
+            f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES ($1, $2) ON CONFLICT DO NOTHING",
+            migration.version, migration.name,
+        )
+
+
+async def status(conn):
+    applied = await applied_versions(conn)
+    for m in MIGRATIONS:
+        state = f"applied {applied[m.version]}" if m.version in applied else "pending"
+        print(f"  {m.version:>3}  {m.name:<32} {state}")
+
+
+async def migrate(conn, target: Optional[int] = None, dry_run: bool = False):
+    pending = pending_migrations(await applied_versions(conn), target)
+    if not pending:
+        print("Database is up to date.")
+        return
+    if dry_run:
+        for m in pending:
+            print(f"-- {m.version}: {m.name}")
+            print(";\n".join(m.statements) + ";\n")
+        return
+    await drop_invalid_indexes(conn)
+    for m in pending:
+        print(f"Applying {m.version}: {m.name}")
+        await apply_migration(conn, m)
+    print(f"Applied {len(pending)} migration(s).")
+
+
+# --- Benchmark ---
+
+def parse_pairs(values: List[str]) -> List[Tuple[int, int]]:
+    """'16:64' -> (16, 64), for --hnsw m:ef_construction."""
+    return [tuple(int(part) for part in value.split(":")) for value in values]  # type: ignore[misc]
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def create_bench_schema(conn, rows: int, dim: int, clusters: int, queries: int, servers: int,
+                              noise: float):
+    """Same tables as the DB Setup workflow, filled with clustered vectors.
+
+    Real embeddings cluster by topic; uniform random vectors would make
+    every ANN index look worse than it is.
+    """
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    await conn.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    await conn.execute(f"SET search_path = {BENCH_SCHEMA}, public")
+    await conn.execute(
+        f"""CREATE TABLE documents_pg (
+            id bigserial PRIMARY KEY, text text, metadata jsonb, embedding vector({dim})
+        );
+        CREATE TABLE document_metadata (id TEXT PRIMARY KEY, title TEXT);
+        CREATE TABLE document_rows (
+            id SERIAL PRIMARY KEY, dataset_id TEXT REFERENCES document_metadata(id), row_data JSONB
+        );
+        CREATE TABLE centroids AS
+            SELECT c, array_agg(random() * 2 - 1 ORDER BY d) AS v
+            FROM generate_series(0, {clusters - 1}) c, generate_series(1, {dim}) d GROUP BY c;
+        CREATE TABLE queries (id int PRIMARY KEY, embedding vector({dim}))"""
+    )
+    noisy = f"(SELECT array_agg(v[d] + (random() * 2 - 1) * {noise} ORDER BY d) FROM generate_series(1, {dim}) d)::vector"
+    # One in five documents is a Drive file, the rest are Discord windows
+    await conn.execute(
+        f"""INSERT INTO documents_pg (text, metadata, embedding)
+            SELECT 'synthetic document ' || i,
+                   CASE WHEN i % 5 = 0
+                        THEN jsonb_build_object('source', 'drive', 'file_id', 'file-' || (i % 500))
+                        ELSE jsonb_build_object(
+                            'source', 'discord', 'server_id', (i % {servers})::text,
+                            'content_hash', md5(i::text), 'message_ids', jsonb_build_array(i::text))
+                   END,
+                   {noisy}
+            FROM generate_series(1, {rows}) i JOIN centroids ON c = i % {clusters}"""
+    )
+    await conn.execute(
+        f"""INSERT INTO queries (id, embedding)
+            SELECT i, {noisy} FROM generate_series(1, {queries}) i JOIN centroids ON c = (i * 7) % {clusters};
+        INSERT INTO document_metadata (id) SELECT 'dataset-' || i FROM generate_series(0, 199) i;
+        INSERT INTO document_rows (dataset_id, row_data)
+            SELECT 'dataset-' || (i % 200), jsonb_build_object('row', i) FROM generate_series(1, {rows}) i;
+        ANALYZE"""
+    )
+
+
+SEARCH_SQL = "SELECT id FROM documents_pg ORDER BY embedding <=> $1::vector LIMIT $2"
+
+DELETES = {
+    "delete_discord_server": (
+        "DELETE FROM documents_pg WHERE metadata->>'source' = 'discord' AND metadata->>'server_id' = $1",
+        lambda i: str(i),
+    ),
+    "delete_file": ("DELETE FROM documents_pg WHERE metadata->>'file_id' = $1", lambda i: f"file-{i * 5}"),
+    "delete_dataset_rows": ("DELETE FROM document_rows WHERE dataset_id = $1", lambda i: f"dataset-{i}"),
+}
+
+
+async def time_search(conn, vectors: List[str], k: int) -> Tuple[List[List[int]], List[float]]:
+    results, latencies = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        rows = await conn.fetch(SEARCH_SQL, vector, k)
+        latencies.append(time.perf_counter() - started)
+        results.append([row["id"] for row in rows])
+    return results, latencies
+
+
+async def time_deletes(conn, samples: int) -> Dict[str, float]:
+    """Median latency of each workflow delete, rolled back so every sample sees the same data."""
+    report = {}
+    for name, (sql, param) in DELETES.items():
+        latencies = []
+        for i in range(samples):
+            tx = conn.transaction()
+            await tx.start()
+            started = time.perf_counter()
+            await conn.execute(sql, param(i))
+            latencies.append(time.perf_counter() - started)
+            await tx.rollback()
+        report[f"{name}_p50_ms"] = round(percentile(latencies, 0.5) * 1000, 2)
+    return report
+
+
+def recall(found: List[List[int]], exact: List[List[int]]) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, exact))
+    return hits / max(1, sum(len(e) for e in exact))
+
+
+async def time_index(conn, label: str, create_sql: str, setting: str, values: List[int], vectors: List[str],
+                     exact: List[List[int]], k: int) -> List[Dict]:
+    """Build one ANN index, search at each query-time setting, then drop it."""
+    started = time.perf_counter()
+    await conn.execute(create_sql)
+    build_s = time.perf_counter() - started
+    size = await conn.fetchval("SELECT pg_relation_size('bench_embedding_idx')")
+    rows = []
+    for value in values:
+        await conn.execute(f"SET {setting} = {value}")
+        found, latencies = await time_search(conn, vectors, k)
+        rows.append({
+            "index": label,
+            setting: value,
+            "build_s": round(build_s, 2),
+            "size_mb": round(size / 2**20, 1),
+            "recall": round(recall(found, exact), 4),
+            "search_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "search_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        })
+        print(f"  {label:<34} {f'{setting}={value}':<20} recall {rows[-1]['recall']:.3f}  "
+              f"p50 {rows[-1]['search_p50_ms']:>7} ms  p95 {rows[-1]['search_p95_ms']:>7} ms")
+    await conn.execute("DROP INDEX bench_embedding_idx")
+    await conn.execute(f"RESET {setting}")
+    return rows
+
+
+async def benchmark(conn, rows=20000, dim=1536, clusters=50, queries=50, k=25, servers=20, noise=0.3,
+                    hnsw=((16, 64),), ef_search=(40, 100), ivfflat=(100,), probes=(1, 10),
+                    delete_samples=10, keep=False) -> Dict[str, object]:
+    print(f"Loading {rows} synthetic {dim}-d vectors into schema {BENCH_SCHEMA}...")
+    started = time.perf_counter()
+    await create_bench_schema(conn, rows, dim, clusters, queries, servers, noise)
+    print(f"  loaded in {time.perf_counter() - started:.1f}s")
+    try:
+        vectors = [r["v"] for r in await conn.fetch("SELECT embedding::text AS v FROM queries ORDER BY id")]
+
+        # Without an index the search is an exact scan: the ground truth for recall
+        exact, latencies = await time_search(conn, vectors, k)
+        searches = [{
+            "index": "none (sequential scan)",
+            "recall": 1.0,
+            "search_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "search_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        }]
+        print(f"  {'none (sequential scan)':<34} {'':<20} recall 1.000  "
+              f"p50 {searches[0]['search_p50_ms']:>7} ms  p95 {searches[0]['search_p95_ms']:>7} ms")
+
+        deletes_before = await time_deletes(conn, delete_samples)
+        await apply_migration(conn, MIGRATIONS[0], record=False)
+        deletes_after = await time_deletes(conn, delete_samples)
+
+        for m, ef_construction in hnsw:
+            searches += await time_index(
+                conn, f"hnsw m={m} ef_construction={ef_construction}",
+                f"CREATE INDEX bench_embedding_idx ON documents_pg USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {m}, ef_construction = {ef_construction})",
+                "hnsw.ef_search", list(ef_search), vectors, exact, k,
+            )
+        for lists in ivfflat:
+            searches += await time_index(
+                conn, f"ivfflat lists={lists}",
+                f"CREATE INDEX bench_embedding_idx ON documents_pg USING ivfflat (embedding vector_cosine_ops) "
+                f"WITH (lists = {lists})",
+                "ivfflat.probes", list(probes), vectors, exact, k,
+            )
+    finally:
+        if not keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+
+    return {
+        "rows": rows, "dim": dim, "queries": queries, "k": k,
+        "searches": searches,
+        "deletes_without_indexes": deletes_before,
+        "deletes_with_indexes": deletes_after,
+    }
+
+
+def print_deletes(before: Dict[str, float], after: Dict[str, float]):
+    print("\nDelete latency (p50, rolled back):")
+    for key in before:
+        print(f"  {key[:-7]:<24} {before[key]:>8} ms -> {after[key]:>8} ms")
+
+
+# --- CLI ---
+
+async def run(args):
+    if not args.dsn:
+        print("Error: set DATABASE_URL or pass --dsn")
+        sys.exit(1)
+    settings = {"statement_timeout": "0"}
+    if args.maintenance_work_mem:
+        settings["maintenance_work_mem"] = args.maintenance_work_mem
+    conn = await asyncpg.connect(args.dsn, server_settings=settings)
+    try:
+        if args.command == "status":
+            await status(conn)
+        elif args.command == "migrate":
+            await migrate(conn, target=args.to, dry_run=args.dry_run)
+        else:
+            results = await benchmark(
+                conn, rows=args.rows, dim=args.dim, clusters=args.clusters, queries=args.queries, k=args.k,
+                servers=args.servers, noise=args.noise, hnsw=parse_pairs(args.hnsw), ef_search=args.ef_search,
+                ivfflat=args.ivfflat, probes=args.probes, delete_samples=args.delete_samples, keep=args.keep,
+            )
+            print_deletes(results["deletes_without_indexes"], results["deletes_with_indexes"])  # type: ignore[arg-type]
+            if args.json:
+                with open(args.json, "w", encoding="utf-8") as f:
+                    json.dump(results, f, indent=2)
+    finally:
+        await conn.close()
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gravilo database migrations and pgvector benchmark")
+    parser.add_argument("--dsn", default=DATABASE_URL, help="Postgres URL (default: $DATABASE_URL)")
+    parser.add_argument("--maintenance-work-mem", help="e.g. 1GB; index builds are much faster when they fit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="list migrations and whether they are applied")
+
+    migrate_command = commands.add_parser("migrate", help="apply pending migrations")
+    migrate_command.add_argument("--to", type=int, help="stop after this version")
+    migrate_command.add_argument("--dry-run", action="store_true", help="print the SQL instead of running it")
+
+    bench = commands.add_parser("benchmark", help="compare index settings on synthetic data in a scratch schema")
+    bench.add_argument("--rows", type=int, default=20000)
+    bench.add_argument("--dim", type=int, default=1536, help="embedding size (documents_pg uses 1536)")
+    bench.add_argument("--clusters", type=int, default=50, help="topics the synthetic vectors cluster around")
+    bench.add_argument("--noise", type=float, default=0.3, help="spread of vectors around their cluster")
+    bench.add_argument("--queries", type=int, default=50)
+    bench.add_argument("--k", type=int, default=25, help="results per search (Gravilo Core uses topK 25)")
+    bench.add_argument("--servers", type=int, default=20, help="distinct Discord server_ids")
+    bench.add_argument("--hnsw", nargs="*", default=["16:64"], metavar="M:EF_CONSTRUCTION")
+    bench.add_argument("--ef-search", type=int_list, default=[40, 100])
+    bench.add_argument("--ivfflat", type=int, nargs="*", default=[100], metavar="LISTS")
+    bench.add_argument("--probes", type=int_list, default=[1, 10])
+    bench.add_argument("--delete-samples", type=int, default=10)
+    bench.add_argument("--keep", action="store_true", help=f"keep the {BENCH_SCHEMA} schema afterwards")
+    bench.add_argument("--json", help="write results to this file")
+
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,67 @@
 import discord
-import requests
+import aiohttp
 import os
 import asyncio
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import struct
+import time
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
 
 # Configuration
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 # New Webhook for Ingestion (Create this in n8n: Gravilo_Ingest_Discord)
-N8N_INGEST_WEBHOOK_URL = os.getenv('N8N_INGEST_WEBHOOK_URL') 
-DAYS_TO_INDEX = 30  # How far back to go?
-BATCH_SIZE = 50     # Messages per n8n request
+N8N_INGEST_WEBHOOK_URL = os.getenv('N8N_INGEST_WEBHOOK_URL')
+# Optional: bridge endpoint that drops cached answers once a guild is re-indexed
+BRIDGE_CACHE_INVALIDATE_URL = os.getenv('BRIDGE_CACHE_INVALIDATE_URL')
+DISCORD_BOT_SYNC_SECRET = os.getenv('DISCORD_BOT_SYNC_SECRET')
+# Last indexed message per channel, so runs only fetch new messages
+CHECKPOINT_DB = os.getenv('INDEXER_CHECKPOINT_DB', 'indexer_state.db')
+DAYS_TO_INDEX = 30  # How far back to go on a first or full run?
+# Channels/threads crawled at once across all guilds. discord.py queues each
+# request on its own per-route rate-limit bucket (and the global limit), so
+# this only bounds how many history cursors are open at a time.
+CRAWL_CONCURRENCY = int(os.getenv('INDEXER_CRAWL_CONCURRENCY', '8'))
+# Conversation windows: consecutive messages (reply chains, bursts without a
+# long gap) are embedded together as one document instead of one per message.
+WINDOW_GAP_MINUTES = float(os.getenv('INDEXER_WINDOW_GAP_MINUTES', '10'))
+WINDOW_MAX_CHARS = int(os.getenv('INDEXER_WINDOW_MAX_CHARS', '1800'))
+WINDOW_MAX_MESSAGES = int(os.getenv('INDEXER_WINDOW_MAX_MESSAGES', '25'))
+WINDOW_MAX_OPEN = 4  # Interleaved conversations tracked per channel
+# Messages this short are dropped when they (nearly) repeat one seen before
+SHORT_MESSAGE_CHARS = int(os.getenv('INDEXER_SHORT_MESSAGE_CHARS', '40'))
+NEAR_DUPLICATE_BITS = 3  # Max simhash distance still counted as a duplicate
+
+# Ingest pipeline: history fetching fills a bounded queue that senders drain.
+# Batches are sized in (uncompressed) JSON bytes; the target grows while the
+# webhook answers within INGEST_TARGET_LATENCY_SECONDS and shrinks when it doesn't.
+INGEST_SENDERS = int(os.getenv('INGEST_SENDERS', '4'))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '2000'))  # documents
+INGEST_BATCH_BYTES = int(os.getenv('INGEST_BATCH_BYTES', '131072'))
+INGEST_MIN_BATCH_BYTES = int(os.getenv('INGEST_MIN_BATCH_BYTES', '16384'))
+INGEST_MAX_BATCH_BYTES = int(os.getenv('INGEST_MAX_BATCH_BYTES', '2097152'))
+INGEST_TARGET_LATENCY_SECONDS = float(os.getenv('INGEST_TARGET_LATENCY_SECONDS', '5'))
+INGEST_LINGER_SECONDS = float(os.getenv('INGEST_LINGER_SECONDS', '0.5'))
+INGEST_RETRIES = int(os.getenv('INGEST_RETRIES', '5'))
+INGEST_BACKOFF_SECONDS = float(os.getenv('INGEST_BACKOFF_SECONDS', '1'))
+INGEST_TIMEOUT_SECONDS = float(os.getenv('INGEST_TIMEOUT_SECONDS', '120'))
+INGEST_GZIP = os.getenv('INGEST_GZIP', '1').lower() not in ('0', 'false', 'no')
+# Every batch is written to this spool before delivery, so a crash or an n8n
+# outage never costs a re-crawl. Delivery resumes from the committed offset.
+# Delivered segments are removed at the end of a run unless they hold a guild's
+# last run, which `replay --from/--to` can re-send.
+INGEST_SPOOL_DIR = os.getenv('INGEST_SPOOL_DIR', 'ingest_spool')
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv('INGEST_SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+# How long the end of a run waits for the webhook before leaving the rest in the spool
+INGEST_DRAIN_TIMEOUT_SECONDS = float(os.getenv('INGEST_DRAIN_TIMEOUT_SECONDS', '600'))
+INGEST_REDELIVER_MAX_SECONDS = 60  # Back-off cap while the webhook stays down
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -18,87 +70,1006 @@ intents.guild_messages = True
 
 client = discord.Client(intents=intents)
 
-async def process_channel(channel):
-    print(f"Indexing channel: #{channel.name} ({channel.id})")
-    cutoff_date = datetime.utcnow() - timedelta(days=DAYS_TO_INDEX)
-    
-    messages_batch = []
+# Set from the command line: --full re-reads the whole window and prunes vectors of gone messages in it
+FULL_REBUILD = False
+
+class CheckpointStore:
+    """SQLite record of the newest message indexed in each channel."""
+
+    def __init__(self, path=CHECKPOINT_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS channel_checkpoints (
+                channel_id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def get(self, channel_id):
+        row = self.conn.execute(
+            "SELECT last_message_id FROM channel_checkpoints WHERE channel_id = ?",
+            (channel_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, guild_id, channel_id, message_id):
+        self.conn.execute(
+            """INSERT INTO channel_checkpoints (channel_id, guild_id, last_message_id, updated_at)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(channel_id) DO UPDATE SET
+                   last_message_id = MAX(last_message_id, excluded.last_message_id),
+                   updated_at = excluded.updated_at""",
+            (channel_id, guild_id, message_id, datetime.utcnow().isoformat()),
+        )
+        self.conn.commit()
+
+    def clear_guild(self, guild_id):
+        self.conn.execute("DELETE FROM channel_checkpoints WHERE guild_id = ?", (guild_id,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class ChannelCursor:
+    """Moves a channel's checkpoint forward as its queued messages are delivered.
+
+    Batches can finish out of order, so the checkpoint only advances past a
+    message once it and everything read before it were accepted. After a batch
+    fails for good the cursor stops moving and the crawl of that channel ends;
+    the next run picks up from the last contiguous delivered message.
+    """
+
+    def __init__(self, store, guild_id, channel_id):
+        self.store = store
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.pending = deque()  # [message_id, delivered] in history order
+        self.failed = False
+
+    def track(self, message_id):
+        entry = [message_id, False]
+        self.pending.append(entry)
+        return entry
+
+    def skip(self, message_id):
+        self.pending.append([message_id, True])
+        self._advance()
+
+    def delivered(self, entry):
+        entry[1] = True
+        self._advance()
+
+    def fail(self):
+        self.failed = True
+
+    def _advance(self):
+        last = None
+        while self.pending and self.pending[0][1]:
+            last = self.pending.popleft()[0]
+        if last is not None and not self.failed:
+            self.store.set(self.guild_id, self.channel_id, last)
+
+class IngestSpool:
+    """Append-only, segmented, gzip-compressed log of ingest payloads.
+
+    Each record is one webhook payload, framed as (offset, length) followed by
+    its gzip bytes, and fsynced before the crawl checkpoint moves past it.
+    Segments roll over at INGEST_SPOOL_SEGMENT_BYTES and are named after their
+    first offset. The ``committed`` file holds the offset up to which every
+    record has been delivered. ``runs.json`` holds, per guild, the run id and
+    offset range of its last delivered run: the only batches an explicit
+    replay may re-send, since older ones would revert later edits. A torn
+    record at the end of the last segment (from a crash mid-write) is
+    truncated on open.
+    """
+
+    HEADER = struct.Struct(">QI")
+
+    def __init__(self, directory=INGEST_SPOOL_DIR, segment_bytes=INGEST_SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index = {}  # offset -> (segment path, byte position)
+        self.next_offset = 0
+        self._file = None
+        self._last_segment = None
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("segment-") and name.endswith(".spool"):
+                self._scan(os.path.join(directory, name))
+        self.committed = self._read_marker()
+        self.runs = self._read_runs()
+
+    @property
+    def marker_path(self):
+        return os.path.join(self.directory, "committed")
+
+    @property
+    def runs_path(self):
+        return os.path.join(self.directory, "runs.json")
+
+    def _read_runs(self):
+        try:
+            with open(self.runs_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _read_marker(self):
+        try:
+            with open(self.marker_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return -1
+
+    def _scan(self, path):
+        size = os.path.getsize(path)
+        position = 0
+        with open(path, "r+b") as f:
+            while position + self.HEADER.size <= size:
+                f.seek(position)
+                offset, length = self.HEADER.unpack(f.read(self.HEADER.size))
+                if position + self.HEADER.size + length > size:
+                    break
+                self.index[offset] = (path, position)
+                self.next_offset = offset + 1
+                position += self.HEADER.size + length
+            if position < size:
+                print(f"  -> Spool: dropping torn record at the end of {path}")
+                f.truncate(position)
+        self._last_segment = path
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        path = self._last_segment
+        if path is None or os.path.getsize(path) >= self.segment_bytes:
+            path = os.path.join(self.directory, f"segment-{self.next_offset:012d}.spool")
+        self._file = open(path, "ab")
+        self._last_segment = path
+
+    def append(self, payload):
+        """Durably append one payload and return its offset. Blocking."""
+        data = gzip.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self._open_segment()
+        offset = self.next_offset
+        position = self._file.tell()
+        self._file.write(self.HEADER.pack(offset, len(data)) + data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.index[offset] = (self._file.name, position)
+        self.next_offset = offset + 1
+        return offset
+
+    def read(self, offset):
+        path, position = self.index[offset]
+        with open(path, "rb") as f:
+            f.seek(position)
+            _, length = self.HEADER.unpack(f.read(self.HEADER.size))
+            return json.loads(gzip.decompress(f.read(length)))
+
+    def offsets(self, start=0, end=None):
+        return [o for o in sorted(self.index) if o >= start and (end is None or o <= end)]
+
+    def note_delivered(self, offset, server_id, run_id):
+        """Track the offset range of each guild's newest delivered run."""
+        run = self.runs.get(server_id)
+        if run is None or (run["run_id"] != run_id and offset > run["last"]):
+            self.runs[server_id] = {"run_id": run_id, "first": offset, "last": offset}
+        elif run["run_id"] == run_id:
+            run["first"] = min(run["first"], offset)
+            run["last"] = max(run["last"], offset)
+
+    def is_latest_run(self, payload):
+        run = self.runs.get(payload.get("server_id"))
+        return run is not None and run["run_id"] == payload.get("run_id")
+
+    def commit(self, offset):
+        if offset <= self.committed:
+            return
+        for path, data in ((self.runs_path, json.dumps(self.runs)), (self.marker_path, str(offset))):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.committed = offset
+
+    def compact(self):
+        """Delete segments that are fully delivered and hold no guild's last run.
+
+        The segment being written to is always kept. Returns how many were removed.
+        """
+        ranges = {}  # segment path -> (first offset, last offset)
+        for offset, (path, _) in self.index.items():
+            low, high = ranges.get(path, (offset, offset))
+            ranges[path] = (min(low, offset), max(high, offset))
+        removed = 0
+        for path, (low, high) in ranges.items():
+            if path == self._last_segment or high > self.committed:
+                continue
+            if any(run["first"] <= high and low <= run["last"] for run in self.runs.values()):
+                continue
+            os.remove(path)
+            for offset in range(low, high + 1):
+                self.index.pop(offset, None)
+            removed += 1
+        return removed
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class IngestPipeline:
+    """Bounded document queue, batched into the spool and delivered from there.
+
+    Crawlers put documents on the queue; the batcher groups them per guild
+    and appends each batch to the spool, which is when the crawl checkpoint
+    may advance. A dispatcher reads undelivered records from the spool and
+    async senders post them. A record that cannot be delivered is retried
+    with back-off until it is accepted or the run ends; anything still
+    undelivered is sent first on the next run (or with ``replay --pending``).
+    """
+
+    def __init__(self, url=None, senders=INGEST_SENDERS, queue_size=INGEST_QUEUE_SIZE,
+                 batch_bytes=INGEST_BATCH_BYTES, run_id=None, spool=None):
+        self.url = url if url is not None else N8N_INGEST_WEBHOOK_URL
+        # Without a webhook a run only reports its batches: nothing is spooled,
+        # delivered or committed and no checkpoint moves
+        self.dry_run = not self.url
+        # Tags every vector this run stores or finds unchanged (see prune_guild)
+        self.run_id = run_id or uuid.uuid4().hex
+        self.senders = senders
+        self.spool = spool or IngestSpool()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._ready = asyncio.Queue(maxsize=senders)  # spool records waiting for a sender
+        self._appended = asyncio.Event()
+        # Offsets below this are spooled and booked; the dispatcher stops here
+        self._visible = self.spool.next_offset
+        self.batch_bytes = batch_bytes
+        self.session = None
+        self._tasks = []
+        self._delivering = False
+        self._pending = {}  # server_id -> documents queued but not yet spooled
+        self._undelivered = {}  # server_id -> records spooled this run but not yet settled
+        self._record_server = {}  # offset -> server_id for records spooled this run
+        self._done = set()  # delivered offsets above the committed marker
+        self._given_up = set()  # rejected offsets; they hold the marker back until delivered
+        self._committed = self.spool.committed  # may run ahead of the marker file
+        self._settled = asyncio.Condition()
+        self.latency_ewma = None
+        self.spooled = 0
+        self.batches = 0
+        self.documents = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.retries = 0
+        self.failed = 0
+        self.rejected = 0
+        self.rejected_servers = set()
+
+    async def start(self, deliver=True):
+        connector = aiohttp.TCPConnector(limit=self.senders + 2, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self._tasks = [asyncio.create_task(self._batcher())]
+        self._delivering = deliver and not self.dry_run
+        if self.dry_run:
+            print("[Dry Run] N8N_INGEST_WEBHOOK_URL not set; checkpoints and the spool are left alone")
+        elif deliver:
+            backlog = self.spool.next_offset - self.spool.committed - 1
+            if backlog:
+                print(f"Spool: {backlog} undelivered batches from an earlier run; sending those first")
+            self._tasks.append(asyncio.create_task(self._dispatcher()))
+            self._tasks += [asyncio.create_task(self._sender()) for _ in range(self.senders)]
+
+    async def put(self, doc, cursor, entries, mode="upsert"):
+        """Queue one document covering the cursor entries of its messages.
+
+        Waits while the queue is full.
+        """
+        server_id = doc["metadata"]["server_id"]
+        doc["metadata"]["index_run"] = self.run_id
+        item = {
+            "doc": doc,
+            "size": len(json.dumps(doc, ensure_ascii=False).encode("utf-8")),
+            "server_id": server_id,
+            "mode": mode,
+            "cursor": cursor,
+            "entries": entries,
+        }
+        self._pending[server_id] = self._pending.get(server_id, 0) + 1
+        await self.queue.put(item)
+
+    def _outstanding(self, server_id=None):
+        if server_id is not None:
+            return self._pending.get(server_id, 0) + self._undelivered.get(server_id, 0)
+        unsettled = self.spool.next_offset - self._committed - 1 - len(self._done) - len(self._given_up)
+        return sum(self._pending.values()) + unsettled
+
+    async def drain(self, server_id=None, timeout=None):
+        """Wait until everything queued (for one guild, or at all) is delivered.
+
+        Returns False if that did not happen within timeout seconds.
+        """
+        async with self._settled:
+            try:
+                await asyncio.wait_for(
+                    self._settled.wait_for(lambda: self._outstanding(server_id) == 0), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def close(self, timeout=INGEST_DRAIN_TIMEOUT_SECONDS):
+        if self._delivering and not await self.drain(timeout=timeout):
+            left = self.spool.next_offset - self.spool.committed - 1
+            print(f"Spool: {left} batches not delivered yet; they go out on the next run "
+                  f"or with `python indexer.py replay --pending`")
+        elif self._given_up:
+            print(f"Spool: {len(self._given_up)} rejected batches stay in the spool; they are sent "
+                  f"again on the next run or with `python indexer.py replay --pending`")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.session:
+            await self.session.close()
+        if not self.dry_run:
+            removed = self.spool.compact()
+            if removed:
+                print(f"Spool: removed {removed} fully delivered segments")
+        self.spool.close()
+
+    async def send_now(self, payload):
+        """Post one payload outside the spool (e.g. a prune). Returns True on success."""
+        if not self.url:
+            print(f"  [Dry Run] Batch of {len(payload['messages'])} ready (N8N_INGEST_WEBHOOK_URL not set)")
+            return True
+        return await self._post_with_retries(payload) == "ok"
+
+    async def _batcher(self):
+        """Group queued documents per guild into batches of about batch_bytes.
+
+        A guild's partial batch is spooled once it has waited INGEST_LINGER_SECONDS.
+        """
+        buffers = {}  # (server_id, mode) -> {"items", "size", "deadline"}
+        while True:
+            timeout = None
+            if buffers:
+                next_deadline = min(buf["deadline"] for buf in buffers.values())
+                timeout = max(0.0, next_deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is not None:
+                key = (item["server_id"], item["mode"])
+                buf = buffers.setdefault(key, {
+                    "items": [], "size": 0, "deadline": time.monotonic() + INGEST_LINGER_SECONDS})
+                buf["items"].append(item)
+                buf["size"] += item["size"]
+                if buf["size"] >= self.batch_bytes:
+                    del buffers[key]
+                    await self._spool_batch(buf["items"])
+
+            now = time.monotonic()
+            for key in [k for k, buf in buffers.items() if buf["deadline"] <= now]:
+                await self._spool_batch(buffers.pop(key)["items"])
+
+    async def _spool_batch(self, batch):
+        server_id = batch[0]["server_id"]
+        if self.dry_run:
+            print(f"  [Dry Run] Batch of {len(batch)} ready (N8N_INGEST_WEBHOOK_URL not set)")
+            async with self._settled:
+                self._pending[server_id] -= len(batch)
+                self._settled.notify_all()
+            return
+        payload = {
+            "server_id": server_id,
+            "mode": batch[0]["mode"],
+            "run_id": self.run_id,
+            "messages": [item["doc"] for item in batch],
+        }
+        try:
+            offset = await asyncio.to_thread(self.spool.append, payload)
+        except Exception as e:
+            print(f"  -> Error writing batch to the spool: {e}")
+            offset = None
+        if offset is not None:
+            self.spooled += 1
+            self._record_server[offset] = server_id
+            self._undelivered[server_id] = self._undelivered.get(server_id, 0) + 1
+            self._visible = offset + 1
+            self._appended.set()
+
+        ok = offset is not None
+        for item in batch:
+            if ok:
+                for entry in item["entries"]:
+                    item["cursor"].delivered(entry)
+            else:
+                item["cursor"].fail()
+        async with self._settled:
+            for item in batch:
+                self._pending[server_id] -= 1
+            self._settled.notify_all()
+
+    async def _dispatcher(self):
+        """Feed spool records after the committed offset to the senders, in order."""
+        offset = self.spool.committed + 1
+        while True:
+            while offset >= self._visible:
+                self._appended.clear()
+                if offset < self._visible:
+                    break
+                await self._appended.wait()
+            if offset in self.spool.index:
+                await self._ready.put((offset, self.spool.read(offset)))
+            offset += 1
+
+    async def _sender(self):
+        while True:
+            offset, payload = await self._ready.get()
+            delivered = False
+            try:
+                delivered = await self.deliver(payload)
+            except Exception as e:
+                print(f"  -> Error sending batch {offset}: {e}")
+            if delivered:
+                self.spool.note_delivered(offset, payload.get("server_id"), payload.get("run_id"))
+            await self._settle(offset, delivered)
+
+    async def deliver(self, payload):
+        """Post a spooled payload until the webhook accepts or rejects it.
+
+        Returns True if it was accepted.
+        """
+        if not self.url:
+            print(f"  [Dry Run] Batch of {len(payload['messages'])} ready (N8N_INGEST_WEBHOOK_URL not set)")
+            return False
+        attempt = 0
+        while True:
+            outcome = await self._post_with_retries(payload)
+            if outcome == "ok":
+                return True
+            if outcome == "rejected":
+                # Retrying will not help; it stays in the spool for a later replay
+                self.rejected += 1
+                self.rejected_servers.add(payload.get("server_id"))
+                return False
+            attempt += 1
+            await asyncio.sleep(min(INGEST_REDELIVER_MAX_SECONDS, INGEST_BACKOFF_SECONDS * 2 ** attempt))
+
+    async def _settle(self, offset, delivered):
+        """Book a record as handled for this run.
+
+        Only delivered records move the committed offset, so a rejected one
+        (and everything after it) is sent again later and compaction never
+        removes it.
+        """
+        if delivered:
+            self._done.add(offset)
+        else:
+            self._given_up.add(offset)
+        advanced = False
+        while self._committed + 1 in self._done:
+            self._committed += 1
+            self._done.discard(self._committed)
+            advanced = True
+        if advanced:
+            self.spool.commit(self._committed)
+        async with self._settled:
+            server_id = self._record_server.pop(offset, None)
+            if server_id is not None:
+                self._undelivered[server_id] -= 1
+            self._settled.notify_all()
+
+    def _tune(self, latency, size):
+        """Adjust the batch target towards INGEST_TARGET_LATENCY_SECONDS."""
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = 0.7 * self.latency_ewma + 0.3 * latency
+        if self.latency_ewma > INGEST_TARGET_LATENCY_SECONDS:
+            self.batch_bytes = max(INGEST_MIN_BATCH_BYTES, int(self.batch_bytes * 0.5))
+        elif self.latency_ewma < INGEST_TARGET_LATENCY_SECONDS / 2 and size >= self.batch_bytes * 0.8:
+            # Only grow when batches are actually reaching the target
+            self.batch_bytes = min(INGEST_MAX_BATCH_BYTES, int(self.batch_bytes * 1.5))
+
+    async def _post_with_retries(self, payload):
+        raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        body = raw
+        if INGEST_GZIP:
+            body = gzip.compress(raw)
+            headers["Content-Encoding"] = "gzip"
+        timeout = aiohttp.ClientTimeout(total=INGEST_TIMEOUT_SECONDS)
+
+        for attempt in range(INGEST_RETRIES + 1):
+            retry_after = None
+            start = time.monotonic()
+            try:
+                async with self.session.post(self.url, data=body, headers=headers, timeout=timeout) as response:
+                    text = await response.text()
+                    if response.status == 200:
+                        self._tune(time.monotonic() - start, len(raw))
+                        self.batches += 1
+                        self.documents += len(payload["messages"])
+                        self.raw_bytes += len(raw)
+                        self.sent_bytes += len(body)
+                        return "ok"
+                    print(f"  -> Failed to send batch: {response.status} {text[:200]}")
+                    if response.status != 429 and response.status < 500:
+                        return "rejected"  # Not worth retrying
+                    if response.status == 429:
+                        try:
+                            retry_after = float(response.headers.get("Retry-After", ""))
+                        except ValueError:
+                            pass
+                    else:
+                        # Probably overloaded; smaller batches for everyone
+                        self.batch_bytes = max(INGEST_MIN_BATCH_BYTES, self.batch_bytes // 2)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"  -> Error sending batch: {e!r}")
+
+            if attempt < INGEST_RETRIES:
+                self.retries += 1
+                delay = retry_after or random.uniform(0, INGEST_BACKOFF_SECONDS * 2 ** attempt)
+                await asyncio.sleep(delay)
+
+        self.failed += 1
+        return "failed"
+
+    def summary(self):
+        ratio = f", {self.sent_bytes / self.raw_bytes:.0%} after gzip" if INGEST_GZIP and self.raw_bytes else ""
+        return (f"Ingest: {self.spooled} batches spooled; {self.documents} documents delivered in "
+                f"{self.batches} batches ({self.raw_bytes / 1024:.0f} KiB{ratio}), {self.retries} retries, "
+                f"{self.failed} failed attempts, {self.rejected} rejected, "
+                f"final batch target {self.batch_bytes // 1024} KiB")
+
+class GuildProgress:
+    """Channel-level progress and ETA for one guild's crawl."""
+
+    def __init__(self, guild_name, total_channels):
+        self.guild_name = guild_name
+        self.total = total_channels
+        self.done = 0
+        self.messages = 0
+        self.started = time.monotonic()
+
+    def eta_seconds(self):
+        if not self.done:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.done * (self.total - self.done)
+
+    def channel_done(self, count):
+        self.done += 1
+        self.messages += count
+        eta = self.eta_seconds()
+        eta_text = f"ETA {format_duration(eta)}" if eta is not None else "ETA ?"
+        print(f"[{self.guild_name}] {self.done}/{self.total} channels, "
+              f"{self.messages} messages, {eta_text}")
+
+    def finish(self):
+        elapsed = time.monotonic() - self.started
+        print(f"[{self.guild_name}] Done: {self.messages} messages from "
+              f"{self.total} channels in {format_duration(elapsed)}")
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+def normalize_text(text):
+    """Lowercased words only, for duplicate detection."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def simhash(text):
+    """64-bit simhash over character trigrams."""
+    weights = [0] * 64
+    grams = [text[i:i + 3] for i in range(max(1, len(text) - 2))]
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+class Deduplicator:
+    """Drops short messages that exactly or nearly repeat one already seen in a channel.
+
+    Each channel gets its own instance and reads its history oldest first, so
+    the same copy survives on every run and window hashes stay stable.
+
+    Near duplicates are found with simhash. The 64 bits are split into
+    NEAR_DUPLICATE_BITS + 1 bands, so any two hashes within that distance share
+    at least one band exactly and only those candidates need comparing.
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.bands = [dict() for _ in range(NEAR_DUPLICATE_BITS + 1)]
+        self.band_bits = 64 // len(self.bands)
+        self.dropped = 0
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (i * self.band_bits)) & mask for i in range(len(self.bands))]
+
+    def is_duplicate(self, content):
+        text = normalize_text(content)
+        if len(text) > SHORT_MESSAGE_CHARS:
+            return False
+        digest = hashlib.sha1(text.encode("utf-8")).digest()
+        if digest in self.exact:
+            self.dropped += 1
+            return True
+
+        value = simhash(text)
+        keys = self._band_keys(value)
+        for band, key in zip(self.bands, keys):
+            for other in band.get(key, ()):
+                if bin(value ^ other).count("1") <= NEAR_DUPLICATE_BITS:
+                    self.dropped += 1
+                    return True
+
+        self.exact.add(digest)
+        for band, key in zip(self.bands, keys):
+            band.setdefault(key, []).append(value)
+        return False
+
+def line_length(message):
+    # "author: content\n" as rendered by build_document
+    return len(message.author.name) + len(message.content) + 3
+
+class ConversationWindow:
+    def __init__(self):
+        self.messages = []
+        self.entries = []  # Cursor entries, delivered together with the document
+        self.ids = set()
+        self.chars = 0
+
+    @property
+    def last_at(self):
+        return self.messages[-1].created_at
+
+    def add(self, message, entry):
+        self.messages.append(message)
+        self.entries.append(entry)
+        self.ids.add(message.id)
+        self.chars += line_length(message)
+
+    def has_room(self, message):
+        return (len(self.messages) < WINDOW_MAX_MESSAGES
+                and self.chars + line_length(message) <= WINDOW_MAX_CHARS)
+
+class ConversationWindower:
+    """Groups one channel's messages (read oldest first) into conversation windows.
+
+    A reply joins the window holding the message it answers. Other messages
+    join the most recently active window. A window closes after
+    WINDOW_GAP_MINUTES of silence or once it is full.
+    """
+
+    def __init__(self):
+        self.open = []  # Least recently active first
+
+    def add(self, message, entry):
+        """Add a message; returns the windows that closed because of it."""
+        gap = timedelta(minutes=WINDOW_GAP_MINUTES)
+        closed = [w for w in self.open if message.created_at - w.last_at > gap]
+        self.open = [w for w in self.open if w not in closed]
+
+        reference = getattr(message, "reference", None)
+        reply_to = getattr(reference, "message_id", None)
+        if reply_to is not None:
+            # A reply to something outside the open windows starts its own conversation
+            target = next((w for w in self.open if reply_to in w.ids), None)
+        else:
+            target = self.open[-1] if self.open else None
+
+        if target is not None and not target.has_room(message):
+            self.open.remove(target)
+            closed.append(target)
+            target = None
+        if target is None:
+            if len(self.open) >= WINDOW_MAX_OPEN:
+                closed.append(self.open.pop(0))
+            target = ConversationWindow()
+        else:
+            self.open.remove(target)
+        target.add(message, entry)
+        self.open.append(target)
+        return closed
+
+    def flush(self):
+        closed, self.open = self.open, []
+        return closed
+
+def message_url(message):
+    # https://discord.com/channels/{guild_id}/{channel_id}/{message_id}
+    return f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
+
+def content_hash(content, message_ids):
+    """Identifies a document's exact text and sources; the workflow skips known hashes."""
+    digest = hashlib.sha256(content.encode("utf-8"))
+    digest.update(",".join(message_ids).encode("ascii"))
+    return digest.hexdigest()
+
+def build_document(messages, channel):
+    """One ingest document for a conversation window (or a single message)."""
+    first, last = messages[0], messages[-1]
+    lines = [[str(m.id), f"{m.author.name}: {m.content}"] for m in messages]
+    if len(messages) == 1:
+        content = first.content
+    else:
+        content = "\n".join(line for _, line in lines)
+
+    metadata = {
+        "source": "discord",
+        "author": first.author.name,
+        "author_id": str(first.author.id),
+        "authors": sorted({m.author.name for m in messages}),
+        "channel": channel.name,
+        "channel_id": str(channel.id),
+        "server_id": str(first.guild.id),
+        "message_id": str(first.id),
+        "message_ids": [str(m.id) for m in messages],
+        "timestamp": first.created_at.isoformat(),
+        "end_timestamp": last.created_at.isoformat(),
+        "url": message_url(first),
+        "urls": [message_url(m) for m in messages],
+    }
+    if len(messages) > 1:
+        # Lets the ingest workflow rebuild the window when the bridge reports
+        # that one of its messages was edited or deleted
+        metadata["lines"] = lines
+    # Threads and forum posts keep a pointer to the channel they live in
+    parent = getattr(channel, "parent", None)
+    if isinstance(channel, discord.Thread) and parent is not None:
+        metadata["parent_channel"] = parent.name
+        metadata["parent_channel_id"] = str(parent.id)
+
+    metadata["content_hash"] = content_hash(content, metadata["message_ids"])
+
+    return {"content": content, "metadata": metadata}
+
+async def process_channel(channel, store, pipeline, since, mode="upsert"):
+    """Queue one channel or thread for ingest.
+
+    Channels without a checkpoint (or all of them on a rebuild) are read from
+    ``since``. Returns the number of messages queued and the channel's cursor,
+    which is marked failed if the crawl or one of its batches did not go through.
+    """
+    last_id = None if mode == "rebuild" else store.get(channel.id)
+    if last_id:
+        print(f"Indexing channel: #{channel.name} ({channel.id}) after message {last_id}")
+        after = discord.Object(id=last_id)
+    else:
+        print(f"Indexing channel: #{channel.name} ({channel.id}) last {DAYS_TO_INDEX} days")
+        after = since
+
+    cursor = ChannelCursor(store, channel.guild.id, channel.id)
+    windower = ConversationWindower()
+    dedup = Deduplicator()
     count = 0
+    documents = 0
+
+    async def ship(windows):
+        nonlocal documents
+        for window in windows:
+            await pipeline.put(build_document(window.messages, channel), cursor, window.entries, mode=mode)
+            documents += 1
 
     try:
-        async for message in channel.history(limit=None, after=cutoff_date):
-            if message.author.bot:
-                continue # Skip bots
-            
-            if not message.content.strip():
-                continue # Skip empty messages (e.g. just images without text)
-
-            # Construct Discord Message URL
-            # https://discord.com/channels/{guild_id}/{channel_id}/{message_id}
-            message_url = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
-
-            msg_data = {
-                "content": message.content,
-                "metadata": {
-                    "source": "discord",
-                    "author": message.author.name,
-                    "author_id": str(message.author.id),
-                    "channel": channel.name,
-                    "channel_id": str(channel.id),
-                    "server_id": str(message.guild.id),
-                    "timestamp": message.created_at.isoformat(),
-                    "url": message_url
-                }
-            }
-            
-            messages_batch.append(msg_data)
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            if cursor.failed:
+                print(f"  -> Stopping #{channel.name}; will resume from checkpoint next run")
+                return count, cursor
+
+            if message.author.bot or not message.content.strip() or dedup.is_duplicate(message.content):
+                # Skip bots, empty messages (e.g. just images without text) and
+                # repeated one-liners, but still move the checkpoint past them
+                cursor.skip(message.id)
+                continue
+
+            await ship(windower.add(message, cursor.track(message.id)))
             count += 1
 
-            if len(messages_batch) >= BATCH_SIZE:
-                await send_batch(messages_batch)
-                messages_batch = []
-        
-        # Send remaining
-        if messages_batch:
-            await send_batch(messages_batch)
-            
-        print(f"  -> Indexed {count} messages from #{channel.name}")
+        await ship(windower.flush())
+        dropped = f", dropped {dedup.dropped} duplicate short messages" if dedup.dropped else ""
+        print(f"  -> Queued {count} new messages from #{channel.name} as {documents} documents{dropped}")
 
     except Exception as e:
         print(f"  -> Error indexing #{channel.name}: {e}")
+        cursor.fail()
+    return count, cursor
 
-async def send_batch(batch):
-    if not N8N_INGEST_WEBHOOK_URL:
-        print("  [Dry Run] Batch ready (N8N_INGEST_WEBHOOK_URL not set)")
-        return
+def can_read(channel, member):
+    perms = channel.permissions_for(member)
+    return perms.read_messages and perms.read_message_history
+
+async def collect_channels(guild):
+    """Text channels plus active and recently archived threads/forum posts.
 
+    Returns the channels and whether every thread list could be read.
+    """
+    complete = True
+    me = guild.me
+    cutoff = discord.utils.utcnow() - timedelta(days=DAYS_TO_INDEX)
+    channels = [c for c in guild.text_channels if can_read(c, me)]
+
+    threads = {}
     try:
-        # Extract server_id from first message in batch
-        server_id = batch[0]["metadata"]["server_id"] if batch else None
-        payload = {"server_id": server_id, "messages": batch}
-        
-        response = requests.post(N8N_INGEST_WEBHOOK_URL, json=payload, timeout=30)
-        if response.status_code != 200:
-            print(f"  -> Failed to send batch: {response.status_code} {response.text}")
+        for thread in await guild.active_threads():
+            threads[thread.id] = thread
+    except discord.HTTPException as e:
+        print(f"  -> Could not list active threads in {guild.name}: {e}")
+        complete = False
+
+    for parent in list(guild.text_channels) + list(guild.forums):
+        if not can_read(parent, me):
+            continue
+        try:
+            # Newest archive first; older ones cannot hold messages in the window
+            async for thread in parent.archived_threads(limit=None):
+                if thread.archive_timestamp < cutoff:
+                    break
+                threads[thread.id] = thread
+        except discord.HTTPException as e:
+            print(f"  -> Could not list archived threads in #{parent.name}: {e}")
+            complete = False
+
+    channels.extend(t for t in threads.values() if can_read(t, me))
+    return channels, complete
+
+async def crawl_guild(guild, store, pipeline, semaphore, mode="upsert"):
+    print(f"Processing Server: {guild.name}")
+    if mode == "rebuild" and not pipeline.dry_run:
+        store.clear_guild(guild.id)
+
+    # One cutoff for the whole guild, so prune_guild knows exactly what was read
+    started = discord.utils.utcnow()
+    since = started - timedelta(days=DAYS_TO_INDEX)
+    channels, complete = await collect_channels(guild)
+    progress = GuildProgress(guild.name, len(channels))
+    cursors = []
+
+    async def crawl(channel):
+        async with semaphore:
+            count, cursor = await process_channel(channel, store, pipeline, since, mode=mode)
+        cursors.append(cursor)
+        progress.channel_done(count)
+
+    await asyncio.gather(*(crawl(channel) for channel in channels))
+    progress.finish()
+    delivered = await pipeline.drain(str(guild.id), timeout=INGEST_DRAIN_TIMEOUT_SECONDS)
+
+    if mode == "rebuild":
+        if not (complete and delivered) or any(cursor.failed for cursor in cursors) \
+                or str(guild.id) in pipeline.rejected_servers:
+            print(f"[{guild.name}] Crawl or delivery incomplete; keeping vectors that were not seen this run")
+        else:
+            await prune_guild(pipeline, guild, since, started)
+    await invalidate_bridge_cache(pipeline.session, guild)
+
+async def prune_guild(pipeline, guild, since, started):
+    """After a complete rebuild, delete the guild's vectors this run did not see.
+
+    Unchanged documents were tagged with the run id when the workflow found
+    their hash, so what is left belongs to deleted or edited messages. Only
+    documents starting at or after ``since`` are candidates: older history
+    was not crawled and is kept, as are documents the bridge ingested live
+    after the crawl ``started``, which the crawl could not have seen.
+    """
+    payload = {"server_id": str(guild.id), "mode": "rebuild", "run_id": pipeline.run_id,
+               "prune": True, "since": since.isoformat(), "started_at": started.isoformat(),
+               "messages": []}
+    if await pipeline.send_now(payload):
+        print(f"[{guild.name}] Pruned vectors of messages that are gone")
+    else:
+        print(f"[{guild.name}] Could not prune stale vectors; they will be removed on the next rebuild")
+
+async def invalidate_bridge_cache(session, guild):
+    if not BRIDGE_CACHE_INVALIDATE_URL:
+        return
+    try:
+        url = f"{BRIDGE_CACHE_INVALIDATE_URL.rstrip('/')}/{guild.id}"
+        headers = {"x-bot-secret": DISCORD_BOT_SYNC_SECRET or ""}
+        async with session.post(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            if response.status != 200:
+                print(f"  -> Failed to invalidate bridge cache: {response.status} {await response.text()}")
     except Exception as e:
-        print(f"  -> Error sending batch: {e}")
+        print(f"  -> Error invalidating bridge cache: {e}")
 
 @client.event
 async def on_ready():
     print(f'Indexer logged in as {client.user}')
-    print(f'Starting index of last {DAYS_TO_INDEX} days...')
-    
-    for guild in client.guilds:
-        print(f"Processing Server: {guild.name}")
-        for channel in guild.text_channels:
-            if channel.permissions_for(guild.me).read_message_history:
-                await process_channel(channel)
-    
+    mode = "rebuild" if FULL_REBUILD else "upsert"
+    if FULL_REBUILD:
+        print(f'Starting FULL rebuild of the last {DAYS_TO_INDEX} days...')
+    else:
+        print('Starting incremental index from saved checkpoints...')
+
+    store = CheckpointStore()
+    pipeline = IngestPipeline()
+    await pipeline.start()
+    # Shared by every guild, so small servers don't wait behind large ones
+    semaphore = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    try:
+        await asyncio.gather(*(crawl_guild(guild, store, pipeline, semaphore, mode=mode) for guild in client.guilds))
+    finally:
+        await pipeline.close()
+        store.close()
+    print(pipeline.summary())
+
     print("Indexing complete. Shutting down.")
     await client.close()
 
+async def replay(start=None, end=None, server_id=None, pending=False, spool=None):
+    """Re-send spooled batches without touching the Discord API.
+
+    With pending=True, delivers what is left after the committed offset and
+    advances it. Otherwise re-sends the delivered offsets start..end (e.g. to
+    refill a wiped vector table) and leaves the committed offset alone. Only
+    batches from each guild's last delivered run are re-sent: older ones
+    would delete the vectors of messages edited since and store stale text.
+    """
+    spool = spool or IngestSpool()
+    print(f"Spool {spool.directory}: offsets {min(spool.index, default=0)}-{spool.next_offset - 1}, "
+          f"committed up to {spool.committed}")
+    pipeline = IngestPipeline(spool=spool)
+
+    if pending:
+        await pipeline.start()
+    else:
+        await pipeline.start(deliver=False)
+        semaphore = asyncio.Semaphore(pipeline.senders)
+        end = spool.committed if end is None else min(end, spool.committed)
+        refused = 0
+
+        async def resend(offset):
+            nonlocal refused
+            async with semaphore:
+                payload = spool.read(offset)
+                if server_id is not None and payload.get("server_id") != server_id:
+                    return
+                if not spool.is_latest_run(payload):
+                    refused += 1
+                    return
+                await pipeline.deliver(payload)
+
+        await asyncio.gather(*(resend(offset) for offset in spool.offsets(start or 0, end)))
+        if refused:
+            print(f"Spool: skipped {refused} batches older than their guild's last delivered run")
+
+    await pipeline.close()
+    print(pipeline.summary())
+
 if __name__ == "__main__":
-    if not DISCORD_TOKEN:
+    parser = argparse.ArgumentParser(description="Index Discord history into the Gravilo knowledge base")
+    parser.add_argument("command", nargs="?", choices=["index", "replay"], default="index",
+                        help="index Discord (default) or replay batches from the ingest spool")
+    parser.add_argument("--full", action="store_true",
+                        help=f"re-read the last {DAYS_TO_INDEX} days and delete vectors of messages in that window that are gone")
+    parser.add_argument("--from", dest="start", type=int, help="replay: first spool offset")
+    parser.add_argument("--to", dest="end", type=int, help="replay: last spool offset (default: last delivered)")
+    parser.add_argument("--server-id", help="replay: only batches for this guild")
+    parser.add_argument("--pending", action="store_true",
+                        help="replay: deliver batches after the committed offset and advance it")
+    args = parser.parse_args()
+    FULL_REBUILD = args.full
+    if args.command == "replay" and args.pending == (args.start is not None or args.end is not None):
+        parser.error("replay needs either --pending or an explicit --from/--to range")
+
+    if args.command == "replay":
+        asyncio.run(replay(args.start, args.end, args.server_id, args.pending))
+    elif not DISCORD_TOKEN:
         print("Error: DISCORD_TOKEN not set.")
     else:
         client.run(DISCORD_TOKEN)
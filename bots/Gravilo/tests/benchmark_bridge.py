@@ -0,0 +1,302 @@
+"""
+Offline load test for bridge.py
+
+Drives bridge.on_message with a synthetic message stream against a local
+stand-in n8n webhook and usage endpoint (127.0.0.1 only, no Discord, no
+network). Reports throughput, reply latency percentiles and event-loop
+blocking time.
+
+Usage:
+    python tests/benchmark_bridge.py --rate 200 --duration 10 --guilds 20
+    python tests/benchmark_bridge.py --json results.json --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+# Keep bridge state files out of the working tree
+os.environ.setdefault("USAGE_SPOOL_PATH", "")
+os.environ.setdefault("GUILD_SYNC_STATE_PATH", "")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bridge  # noqa: E402
+
+QUESTIONS = [
+    "How do I use the file search in Antigravity?",
+    "What is the best way to structure an n8n workflow?",
+    "Can someone explain how agents pick their tools?",
+    "Why does my deploy fail with a DNS error?",
+    "Where do I set the webhook URL for the bridge?",
+]
+
+
+class FakeN8n:
+    """Stand-in for the n8n webhook and the Supabase usage endpoint."""
+
+    def __init__(self, latency_ms=200.0, jitter=0.5, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.webhook_calls = 0
+        self.usage_calls = 0
+        self.usage_messages = 0
+
+    async def webhook(self, request: web.Request) -> web.Response:
+        self.webhook_calls += 1
+        payload = await request.json()
+        # Log-normal latency around the configured median
+        delay = self.latency_ms / 1000 * self.rng.lognormvariate(0, self.jitter)
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            return web.Response(status=500, text="Internal Server Error")
+        return web.Response(text=f"Answer for: {payload['content'][:40]}")
+
+    async def usage(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.usage_calls += 1
+        self.usage_messages += int(payload["messages"])
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/webhook", self.webhook)
+        app.router.add_post("/usage", self.usage)
+        return app
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.bot = False
+
+    def __str__(self):
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+
+
+class FakeChannel:
+    """Per-message view of a channel that records when the bridge replies."""
+
+    def __init__(self, channel_id: int, on_send):
+        self.id = channel_id
+        self.name = f"channel{channel_id}"
+        self._on_send = on_send
+
+    async def send(self, content):
+        self._on_send()
+        return FakeSentMessage()
+
+    def typing(self):
+        return _NullTyping()
+
+
+class FakeSentMessage:
+    async def edit(self, content=None):
+        return self
+
+
+class _NullTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, channel, guild):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.reference = None
+        self.mentions: List[FakeUser] = []
+        self.role_mentions: List[object] = []
+        self.mention_everyone = False
+        self.created_at = datetime.now(timezone.utc)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def _watch_loop(interval: float, samples: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.monotonic() - start - interval))
+
+
+PATCHED_GLOBALS = (
+    "N8N_WEBHOOK_URL", "SERVER_USAGE_INCREMENT_URL", "DISCORD_BOT_SYNC_SECRET",
+    "scheduler", "answer_cache", "usage_aggregator", "metrics", "n8n_breaker", "n8n_events",
+)
+
+
+async def run_benchmark(**kwargs) -> Dict[str, object]:
+    """Run one load test and return a flat dict of results.
+
+    Bridge globals replaced for the run are restored afterwards.
+    """
+    saved = {name: getattr(bridge, name) for name in PATCHED_GLOBALS}
+    try:
+        return await _run_benchmark(**kwargs)
+    finally:
+        for name, value in saved.items():
+            setattr(bridge, name, value)
+
+
+async def _run_benchmark(rate=100.0, duration=5.0, guilds=10, channels=3, latency_ms=200.0,
+                         jitter=0.5, error_rate=0.0, repeat_ratio=0.0, seed=0) -> Dict[str, object]:
+    rng = random.Random(seed)
+    fake = FakeN8n(latency_ms=latency_ms, jitter=jitter, error_rate=error_rate, seed=seed)
+
+    async with TestServer(fake.app(), host="127.0.0.1") as server:
+        bridge.N8N_WEBHOOK_URL = str(server.make_url("/webhook"))
+        bridge.SERVER_USAGE_INCREMENT_URL = str(server.make_url("/usage"))
+        bridge.DISCORD_BOT_SYNC_SECRET = "benchmark"
+        bridge.scheduler = bridge.DispatchScheduler()
+        bridge.answer_cache = bridge.AnswerCache()
+        bridge.usage_aggregator = bridge.UsageAggregator(flush_interval=1.0, spool_path="")
+        bridge.metrics = bridge.Metrics()
+        bridge.n8n_breaker = bridge.CircuitBreaker()
+        bridge.n8n_events = Counter()  # So n8n_retries counts this run only
+        bridge.usage_aggregator.start()
+
+        sent_at: Dict[int, float] = {}
+        replied: Dict[int, float] = {}
+
+        def recorder(message_id):
+            def on_send():
+                replied.setdefault(message_id, time.monotonic())
+            return on_send
+
+        guild_objs = [FakeGuild(1000 + g) for g in range(guilds)]
+        targets = [(guild, guild.id * 100 + c) for guild in guild_objs for c in range(channels)]
+
+        lag_samples: List[float] = []
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(_watch_loop(0.01, lag_samples, stop))
+
+        tasks = []
+        total = int(rate * duration)
+        start = time.monotonic()
+        for i in range(total):
+            target = start + i / rate
+            delay = target - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            guild, channel_id = rng.choice(targets)
+            if repeat_ratio and rng.random() < repeat_ratio:
+                content = QUESTIONS[0]
+            else:
+                content = f"{rng.choice(QUESTIONS)} (#{i})"
+            channel = FakeChannel(channel_id, recorder(i))
+            message = FakeMessage(i, content, FakeUser(rng.randint(1, 500)), channel, guild)
+            sent_at[i] = time.monotonic()
+            # discord.py runs each event handler in its own task
+            tasks.append(asyncio.create_task(bridge.on_message(message)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+        await bridge.usage_aggregator.close()
+        stop.set()
+        await watcher
+        await bridge.close_http_session()
+
+    latencies = [replied[i] - sent_at[i] for i in replied]
+    return {
+        "messages": total,
+        "replied": len(replied),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(len(replied) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lag_samples, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lag_samples, default=0.0) * 1000, 2),
+        "loop_blocked_ms": round(sum(s for s in lag_samples if s > 0.005) * 1000, 2),
+        "n8n_calls": fake.webhook_calls,
+        "usage_calls": fake.usage_calls,
+        "usage_messages": fake.usage_messages,
+        "shed": sum(bridge.scheduler.shed.values()),
+        "n8n_retries": bridge.n8n_events["retries"],
+        "cache_hits": bridge.answer_cache.hits,
+    }
+
+
+def compare(results: Dict[str, object], baseline: Dict[str, object]) -> List[str]:
+    lines = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            change = (value - base) / base * 100
+            lines.append(f"  {key:<20} {value:>12} (baseline {base}, {change:+.1f}%)")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline load test for bridge.py")
+    parser.add_argument("--rate", type=float, default=100.0, help="messages per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of traffic")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--channels", type=int, default=3, help="channels per guild")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median fake n8n latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="log-normal sigma of n8n latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of n8n 500s")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="fraction of repeated questions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--verbose", action="store_true", help="keep the bridge's INFO logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        bridge.logger.setLevel(logging.WARNING)
+        logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    results = asyncio.run(run_benchmark(
+        rate=args.rate, duration=args.duration, guilds=args.guilds, channels=args.channels,
+        latency_ms=args.latency_ms, jitter=args.jitter, error_rate=args.error_rate,
+        repeat_ratio=args.repeat_ratio, seed=args.seed,
+    ))
+
+    print("Bridge benchmark results:")
+    for key, value in results.items():
+        print(f"  {key:<20} {value}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print("\nCompared to baseline:")
+            print("\n".join(compare(results, json.load(f))))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
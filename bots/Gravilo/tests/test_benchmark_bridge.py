@@ -0,0 +1,34 @@
+import os
+import sys
+from collections import Counter
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import benchmark_bridge
+
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke():
+    """A short offline run answers every message and keeps the event loop responsive."""
+    results = await benchmark_bridge.run_benchmark(
+        rate=100, duration=0.5, guilds=3, channels=2, latency_ms=20, jitter=0.2
+    )
+
+    assert results["replied"] == results["messages"] == 50
+    assert results["usage_messages"] == results["replied"]
+    assert results["n8n_calls"] + results["cache_hits"] == results["messages"]
+    assert results["loop_lag_max_ms"] < 250
+
+
+@pytest.mark.asyncio
+async def test_benchmark_counts_retries_per_run():
+    # Retries left over from earlier traffic in the same process
+    with patch.object(benchmark_bridge.bridge, "n8n_events", Counter(retries=7)):
+        results = await benchmark_bridge.run_benchmark(
+            rate=100, duration=0.2, guilds=1, channels=1, latency_ms=5, jitter=0.0
+        )
+        assert benchmark_bridge.bridge.n8n_events["retries"] == 7
+
+    assert results["n8n_retries"] == 0
@@ -1,16 +1,29 @@
+import asyncio
 import pytest
 import discord
 import os
 import sys
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch, AsyncMock
 
 # Add the parent directory to sys.path to import bridge
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Keep the usage spool and sync state out of the working tree during tests
+os.environ["USAGE_SPOOL_PATH"] = ""
+os.environ["GUILD_SYNC_STATE_PATH"] = ""
+
 # Mock client.run to prevent the bot from starting during import
 with patch('discord.Client.run'):
     import bridge
 
+@pytest.fixture(autouse=True)
+def fresh_n8n_breaker():
+    """Give every test a closed breaker and instant retries."""
+    with patch.object(bridge, "n8n_breaker", bridge.CircuitBreaker()), \
+            patch('bridge._retry_delay', return_value=0):
+        yield
+
 @pytest.fixture
 def mock_client():
     # Patch the client object in the bridge module
@@ -33,21 +46,21 @@ def mock_message():
     return message
 
 @pytest.mark.asyncio
-async def test_on_ready(capsys):
+async def test_on_ready(caplog):
     """Test the on_ready event."""
     # Mock environment variable
     with patch.dict(os.environ, {"N8N_WEBHOOK_URL": "http://test-url"}):
         bridge.N8N_WEBHOOK_URL = "http://test-url" # Update global var
-        await bridge.on_ready()
-        captured = capsys.readouterr()
-        assert "Logged in as" in captured.out
+        with caplog.at_level("INFO", logger="bridge"):
+            await bridge.on_ready()
+        assert "Logged in as" in caplog.text
 
 @pytest.mark.asyncio
 async def test_on_message_ignore_bot(mock_message):
     """Test that messages from bots are ignored."""
     mock_message.author.bot = True
     
-    with patch('requests.post') as mock_post:
+    with patch('bridge.post_json', new_callable=AsyncMock) as mock_post:
         await bridge.on_message(mock_message)
         mock_post.assert_not_called()
 
@@ -64,11 +77,7 @@ async def test_on_message_trigger_mention(mock_client, mock_message):
     bridge.N8N_WEBHOOK_URL = "http://test-url"
     
     # Mock N8N response
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.text = "Hello from N8N"
-    
-    with patch('requests.post', return_value=mock_response) as mock_post:
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "Hello from N8N")) as mock_post:
         await bridge.on_message(mock_message)
         
         # Verify N8N was called
@@ -76,3 +85,586 @@ async def test_on_message_trigger_mention(mock_client, mock_message):
         
         # Verify reply was sent
         mock_message.channel.send.assert_called_with("Hello from N8N")
+
+@pytest.mark.asyncio
+async def test_on_message_n8n_error_does_not_reply(mock_message):
+    """Non-200 responses from n8n are logged, not sent to the channel."""
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(502, "Bad Gateway")):
+        await bridge.on_message(mock_message)
+
+    mock_message.channel.send.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_http_session_is_shared():
+    """All outbound calls reuse one pooled aiohttp session."""
+    first = await bridge.get_http_session()
+    second = await bridge.get_http_session()
+    try:
+        assert first is second
+        assert first.connector.limit == bridge.HTTP_POOL_SIZE
+    finally:
+        await bridge.close_http_session()
+
+@pytest.mark.asyncio
+async def test_usage_aggregator_coalesces_counts():
+    """Many answered messages become one amount=N call per guild."""
+    aggregator = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path="")
+    for _ in range(5):
+        aggregator.add(987654321)
+    aggregator.add(42)
+
+    with patch('bridge.increment_usage', new_callable=AsyncMock, return_value=bridge.USAGE_ACCEPTED) as mock_inc:
+        await aggregator.flush()
+
+    calls = sorted(c.args for c in mock_inc.call_args_list)
+    assert calls == [("42", 1), ("987654321", 5)]
+    assert aggregator.pending_total == 0
+
+@pytest.mark.asyncio
+async def test_usage_aggregator_spools_failed_flush(tmp_path):
+    """Counts that fail to flush are kept and survive a restart via the spool."""
+    spool = str(tmp_path / "usage_spool.json")
+    aggregator = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path=spool)
+    aggregator.add(7, amount=3)
+    assert not os.path.exists(spool)  # add() leaves the disk to the journal writer
+
+    with patch('bridge.increment_usage', new_callable=AsyncMock, return_value=bridge.USAGE_RETRY):
+        await aggregator.flush()
+    assert aggregator.pending["7"] == 3
+
+    restored = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path=spool)
+    assert restored.pending["7"] == 3
+
+@pytest.mark.asyncio
+async def test_usage_aggregator_journals_counts_between_flushes(tmp_path):
+    """Counts survive a crash before the next flush, and a flush compacts the journal."""
+    spool = str(tmp_path / "usage_spool.json")
+    aggregator = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path=spool)
+    for _ in range(3):
+        aggregator.add(7)
+    aggregator.add(8, amount=2)
+    await aggregator._journal_task
+    with open(spool, "a", encoding="utf-8") as f:
+        f.write("7 10")  # A crash halfway through a write
+
+    crashed = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path=spool)
+    assert dict(crashed.pending) == {"7": 3, "8": 2}
+
+    crashed.add(9)
+    with patch('bridge.increment_usage', new_callable=AsyncMock,
+               side_effect=lambda gid, amount: bridge.USAGE_RETRY if gid == "8" else bridge.USAGE_ACCEPTED):
+        await crashed.close()
+    with open(spool, encoding="utf-8") as f:
+        assert f.read() == "8 2\n"
+
+@pytest.mark.asyncio
+async def test_usage_aggregator_reads_a_json_spool(tmp_path):
+    spool = tmp_path / "usage_spool.json"
+    spool.write_text('{"7": 4}', encoding="utf-8")
+    assert bridge.UsageAggregator(spool_path=str(spool)).pending["7"] == 4
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, kept", [(400, 0), (404, 0), (429, 2), (503, 2)])
+async def test_usage_aggregator_drops_rejected_counts(status, kept):
+    """4xx responses are not retried; rate limits and server errors are."""
+    aggregator = bridge.UsageAggregator(flush_interval=60, max_pending=1000, spool_path="")
+    aggregator.add(7, amount=2)
+
+    with patch.object(bridge, "SERVER_USAGE_INCREMENT_URL", "http://usage"), \
+            patch.object(bridge, "DISCORD_BOT_SYNC_SECRET", "secret"), \
+            patch('bridge.post_json', new_callable=AsyncMock, return_value=(status, "")):
+        await aggregator.flush()
+    assert aggregator.pending_total == kept
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content", ["👍", "🎉 🎉", "<:pepe:123456789012345678>", "ok"])
+async def test_prefilter_drops_noise(mock_message, content):
+    """Emoji-only and very short messages never reach n8n."""
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    mock_message.content = content
+
+    with patch('bridge.post_json', new_callable=AsyncMock) as mock_post:
+        await bridge.on_message(mock_message)
+        mock_post.assert_not_called()
+
+def test_prefilter_forwards_short_question(mock_message):
+    """A short question is forwarded even though it is below the minimum length."""
+    mock_message.content = "why?"
+    forward, rule = bridge.prefilter(mock_message)
+    assert forward
+    assert rule == "rule_question"
+
+def test_prefilter_deny_channel_counts_drop(mock_message):
+    """Denied channels are dropped and counted per rule."""
+    before = bridge.prefilter_drops["rule_channel_lists"]
+    with patch.object(bridge, "PREFILTER_DENY_CHANNELS", {str(mock_message.channel.id)}):
+        forward, rule = bridge.prefilter(mock_message)
+    assert not forward
+    assert bridge.prefilter_drops["rule_channel_lists"] == before + 1
+
+@pytest.mark.asyncio
+async def test_scheduler_caps_guild_concurrency_and_is_fair():
+    """A flooded guild cannot take every slot away from a quiet one."""
+    sched = bridge.DispatchScheduler(max_concurrency=3, guild_concurrency=2,
+                                     guild_queue=50, channel_queue=50)
+    gate = asyncio.Event()
+    started = []
+
+    def job(name):
+        async def run():
+            started.append(name)
+            await gate.wait()
+        return run
+
+    futures = [sched.submit("big", "c1", job(f"big-{i}")) for i in range(10)]
+    futures.append(sched.submit("small", "c2", job("small-0")))
+    await asyncio.sleep(0)
+
+    assert sched.active == 3
+    assert "small-0" in started
+    assert sum(name.startswith("big") for name in started) == 2
+
+    gate.set()
+    assert all(await asyncio.gather(*futures))
+    assert sched.stats()["queued"] == 0
+
+@pytest.mark.asyncio
+async def test_scheduler_sheds_oldest_when_channel_full():
+    sched = bridge.DispatchScheduler(max_concurrency=1, guild_concurrency=1,
+                                     guild_queue=50, channel_queue=2)
+    gate = asyncio.Event()
+
+    async def run():
+        await gate.wait()
+
+    running = sched.submit("g", "c", run)
+    await asyncio.sleep(0)
+    queued = [sched.submit("g", "c", run) for _ in range(3)]
+
+    assert await queued[0] is False
+    assert sched.shed["drop_oldest"] == 1
+    gate.set()
+    assert await running and await queued[1] and await queued[2]
+
+@pytest.mark.asyncio
+async def test_on_message_replies_busy_when_shedding(mock_client, mock_message):
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    mock_client.user.mentioned_in.return_value = True
+    busy = bridge.DispatchScheduler(channel_queue=0, shed_policy="busy")
+
+    with patch.object(bridge, "scheduler", busy), \
+            patch('bridge.post_json', new_callable=AsyncMock) as mock_post:
+        await bridge.on_message(mock_message)
+        await bridge.on_message(mock_message)
+
+    mock_post.assert_not_called()
+    # One notice per channel per interval, however many messages are rejected
+    mock_message.channel.send.assert_called_once_with(bridge.SCHEDULER_BUSY_MESSAGE)
+
+@pytest.mark.asyncio
+async def test_on_message_sheds_unaddressed_messages_silently(mock_client, mock_message):
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    mock_client.user.mentioned_in.return_value = False
+    mock_message.content = "How do I use the file search?"
+    busy = bridge.DispatchScheduler(channel_queue=0, shed_policy="busy")
+
+    with patch.object(bridge, "scheduler", busy), \
+            patch('bridge.post_json', new_callable=AsyncMock) as mock_post:
+        await bridge.on_message(mock_message)
+
+    mock_post.assert_not_called()
+    mock_message.channel.send.assert_not_called()
+
+def test_normalize_content_strips_case_punctuation_and_mentions():
+    assert bridge.normalize_content("<@!123> How do I   use File-Search??") == "how do i use file search"
+
+@pytest.mark.asyncio
+async def test_answer_cache_hit_skips_n8n(mock_message):
+    """A repeated question is answered from the cache without an n8n call."""
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    mock_message.content = "How do I use the file search?"
+    cache = bridge.AnswerCache(max_entries=10, max_bytes=10_000, ttl=60)
+
+    with patch.object(bridge, "answer_cache", cache), \
+            patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "Use @file")) as mock_post:
+        await bridge.on_message(mock_message)
+        mock_message.content = "how do i use the FILE SEARCH"
+        await bridge.on_message(mock_message)
+
+    mock_post.assert_called_once()
+    assert mock_message.channel.send.call_count == 2
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_answer_cache_bounds_and_invalidation():
+    cache = bridge.AnswerCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.put(1, "first question here", "a")
+    cache.put(1, "second question here", "b")
+    cache.put(2, "third question here", "c")
+
+    assert len(cache) == 2
+    assert cache.get(1, "first question here") is None
+    assert cache.invalidate_guild(1) == 1
+    assert cache.get(2, "third question here") == "c"
+
+@pytest.mark.asyncio
+async def test_cache_invalidate_endpoint_requires_secret():
+    from aiohttp.test_utils import TestClient, TestServer
+
+    cache = bridge.AnswerCache(max_entries=10, max_bytes=10_000, ttl=60)
+    cache.put(5, "a cached question", "answer")
+    with patch.object(bridge, "answer_cache", cache), \
+            patch.object(bridge, "DISCORD_BOT_SYNC_SECRET", "s3cret"):
+        async with TestClient(TestServer(bridge.build_http_app())) as http:
+            denied = await http.post("/cache/invalidate/5")
+            allowed = await http.post("/cache/invalidate/5", headers={"x-bot-secret": "s3cret"})
+            body = await allowed.json()
+
+    assert denied.status == 401
+    assert body["invalidated"] == 1
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_cache_invalidate_fans_out_to_other_workers():
+    """An invalidation sent to one launcher worker reaches every worker's cache."""
+    import socket
+    from aiohttp.test_utils import TestClient, TestServer
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead_port = sock.getsockname()[1]
+
+    cache = bridge.AnswerCache(max_entries=10, max_bytes=10_000, ttl=60)
+    cache.put(5, "a cached question", "answer")
+    with patch.object(bridge, "answer_cache", cache), \
+            patch.object(bridge, "DISCORD_BOT_SYNC_SECRET", "s3cret"):
+        async with TestServer(bridge.build_http_app(), host="127.0.0.1") as peer:
+            with patch.object(bridge, "BRIDGE_PEER_PORTS", [peer.port]):
+                async with TestClient(TestServer(bridge.build_http_app())) as http:
+                    ok = await http.post("/cache/invalidate/5", headers={"x-bot-secret": "s3cret"})
+                    ok_body = await ok.json()
+            with patch.object(bridge, "BRIDGE_PEER_PORTS", [peer.port, dead_port]):
+                async with TestClient(TestServer(bridge.build_http_app())) as http:
+                    failed = await http.post("/cache/invalidate/5", headers={"x-bot-secret": "s3cret"})
+                    failed_body = await failed.json()
+        await bridge.close_http_session()
+
+    assert ok.status == 200
+    assert ok_body["invalidated"] == 1 and ok_body["workers"] == 2
+    assert failed.status == 502
+    assert failed_body["failed_ports"] == [dead_port]
+
+@pytest.mark.asyncio
+async def test_guild_sync_skips_unchanged_guilds():
+    """Reconnects only re-sync guilds whose name/icon/owner changed."""
+    guild = MagicMock()
+    guild.id = 555
+    guild.name = "Antigravity"
+    guild.owner_id = 1
+    guild.icon = None
+    guild.icon_url = None
+
+    with patch.dict(bridge.guild_sync_state, clear=True), \
+            patch('bridge.guild_sync_request', new_callable=AsyncMock, return_value=True) as mock_sync:
+        await bridge.backfill_guilds([guild])
+        await bridge.backfill_guilds([guild])
+        guild.name = "Antigravity HQ"
+        await bridge.backfill_guilds([guild])
+
+    assert mock_sync.call_count == 2
+
+def test_split_message_respects_discord_limit():
+    text = ("word " * 300 + "\n") * 3
+    parts = bridge.split_message(text)
+    assert len(parts) > 1
+    assert all(len(p) <= bridge.DISCORD_MESSAGE_LIMIT for p in parts)
+    assert " ".join(" ".join(parts).split()) == " ".join(text.split())
+
+@pytest.mark.asyncio
+async def test_streaming_reply_posts_first_chunk_then_edits():
+    channel = AsyncMock(spec=discord.TextChannel)
+    sent = AsyncMock()
+    channel.send.return_value = sent
+    reply = bridge.StreamingReply(channel, edit_interval=0)
+
+    await reply.feed("Compiling")
+    await reply.feed("... done")
+    answer = await reply.finish()
+
+    channel.send.assert_called_once_with("Compiling")
+    sent.edit.assert_called_with(content="Compiling... done")
+    assert answer == "Compiling... done"
+
+@pytest.mark.asyncio
+async def test_stream_n8n_reads_json_lines():
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def handler(request):
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        await resp.write(b'{"type":"begin"}\n{"type":"item","content":"In the pipe, "}\n')
+        await resp.write(b'{"type":"item","content":"five by five."}\n{"type":"end"}\n')
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/hook", handler)
+    async with TestServer(app) as server:
+        url = str(server.make_url("/hook"))
+        chunks = [c async for c in bridge.stream_n8n(url, {"content": "hi"})]
+    await bridge.close_http_session()
+
+    assert "".join(chunks) == "In the pipe, five by five."
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_stage_latency():
+    from aiohttp.test_utils import TestClient, TestServer
+
+    bridge.metrics.observe("n8n", 0.2)
+    with bridge.metrics.track_request("usage") as result:
+        result["status"] = 200
+
+    async with TestClient(TestServer(bridge.build_http_app())) as http:
+        resp = await http.get("/metrics")
+        text = await resp.text()
+
+    assert resp.status == 200
+    assert 'gravilo_stage_latency_seconds_bucket{stage="n8n",le="0.25"}' in text
+    assert 'gravilo_http_requests_total{stage="usage",status="200"}' in text
+    assert "gravilo_event_loop_lag_seconds" in text
+
+@pytest.mark.asyncio
+async def test_call_n8n_retries_transient_errors():
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    responses = [(503, "restarting"), (502, "bad gateway"), (200, "Back online")]
+
+    with patch('bridge.post_json', new_callable=AsyncMock, side_effect=responses) as mock_post:
+        assert await bridge.call_n8n({"content": "hi"}) == "Back online"
+
+    assert mock_post.call_count == 3
+    assert bridge.n8n_breaker.state == bridge.CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_call_n8n_does_not_retry_client_errors():
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(404, "no such webhook")) as mock_post:
+        with pytest.raises(bridge.N8nStatusError):
+            await bridge.call_n8n({"content": "hi"})
+
+    mock_post.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast_with_friendly_reply(mock_client, mock_message):
+    """While n8n is down, addressed messages get an apology without an n8n call."""
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    mock_client.user.mentioned_in.return_value = True
+    breaker = bridge.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+
+    with patch.object(bridge, "n8n_breaker", breaker), \
+            patch('bridge.post_json', new_callable=AsyncMock) as mock_post:
+        await bridge.on_message(mock_message)
+
+    mock_post.assert_not_called()
+    mock_message.channel.send.assert_called_with(bridge.N8N_UNAVAILABLE_MESSAGE)
+
+def test_circuit_breaker_half_open_allows_one_trial():
+    breaker = bridge.CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == bridge.CircuitBreaker.OPEN
+
+    assert breaker.allow()
+    assert breaker.state == bridge.CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == bridge.CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_hedged_request_uses_secondary_when_primary_is_slow():
+    bridge.N8N_WEBHOOK_URL = "http://primary"
+
+    async def fake_post(url, payload, **kwargs):
+        if url == "http://primary":
+            await asyncio.sleep(1)
+            return 200, "primary"
+        return 200, "secondary"
+
+    with patch.object(bridge, "N8N_WEBHOOK_URL_SECONDARY", "http://secondary"), \
+            patch('bridge._hedge_delay', return_value=0.01), \
+            patch('bridge.post_json', side_effect=fake_post):
+        assert await bridge.call_n8n({"content": "hi"}) == "secondary"
+
+def test_parse_shard_ids():
+    assert bridge.parse_shard_ids("0-2,5") == [0, 1, 2, 5]
+    assert bridge.parse_shard_ids("") is None
+
+def test_shard_ranges_cover_every_shard_once():
+    ranges = bridge.shard_ranges(10, 3)
+    assert ranges == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert bridge.shard_ranges(2, 8) == [[0], [1]]
+
+def test_worker_env_isolates_port_and_state_files():
+    with patch.object(bridge, "BRIDGE_HTTP_PORT", 8080), \
+            patch.object(bridge, "USAGE_SPOOL_PATH", "usage_spool.json"):
+        env = bridge.worker_env(2, [4, 5], 8, workers=3)
+    assert env["SHARD_IDS"] == "4,5"
+    assert env["BRIDGE_PEER_PORTS"] == "8080,8081"
+    assert env["SHARD_COUNT"] == "8"
+    assert env["BRIDGE_HTTP_PORT"] == "8082"
+    assert env["USAGE_SPOOL_PATH"] == "usage_spool.w2.json"
+
+def test_shard_health_reports_unconnected_client():
+    health = bridge.shard_health()
+    assert health["0"]["latency"] is None
+
+def _fragment(message_id, content):
+    fragment = AsyncMock(spec=discord.Message)
+    fragment.id = message_id
+    fragment.content = content
+    fragment.author.bot = False
+    fragment.author.id = 111222
+    fragment.author.name = "TestUser"
+    fragment.channel = AsyncMock(spec=discord.TextChannel)
+    fragment.channel.id = 123456789
+    fragment.channel.name = "general"
+    fragment.guild.id = 987654321
+    fragment.reference = None
+    fragment.mentions = []
+    fragment.mention_everyone = False
+    return fragment
+
+@pytest.mark.asyncio
+async def test_coalescing_merges_quick_fragments_into_one_dispatch():
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    fragments = [
+        _fragment(1, "hey so I'm using the file search"),
+        _fragment(2, "and it keeps timing out"),
+        _fragment(3, "any idea why?"),
+    ]
+
+    with patch.object(bridge, "COALESCE_WINDOW_SECONDS", 0.05), \
+            patch.object(bridge, "coalescer", bridge.MessageCoalescer(window=0.05)), \
+            patch.object(bridge, "answer_cache", bridge.AnswerCache()), \
+            patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "Check the timeout")) as mock_post:
+        await asyncio.gather(*(bridge.on_message(f) for f in fragments))
+
+    mock_post.assert_called_once()
+    payload = mock_post.call_args.args[1]
+    assert payload["message_ids"] == ["1", "2", "3"]
+    assert payload["content"].splitlines()[-1] == "any idea why?"
+    fragments[-1].channel.send.assert_called_once_with("Check the timeout")
+
+@pytest.mark.asyncio
+async def test_coalescer_releases_buffer_at_max_messages():
+    coalescer = bridge.MessageCoalescer(window=10, max_messages=2)
+    first = asyncio.ensure_future(coalescer.collect(_fragment(1, "one")))
+    await asyncio.sleep(0)
+    released = await coalescer.collect(_fragment(2, "two"))
+
+    assert [m.id for m in released] == [1, 2]
+    first.cancel()
+
+def test_parse_quota_reads_quota_response():
+    assert bridge.parse_quota('{"message_limit": 3000, "messages_used": 12}') == (3000, 12)
+    assert bridge.parse_quota('{"server": {"message_limit": 50, "message_count": 7}}') == (50, 7)
+    assert bridge.parse_quota('{"ok": true}') is None
+    assert bridge.parse_quota("Synced") is None
+
+@pytest.mark.asyncio
+async def test_over_quota_guild_never_reaches_n8n(mock_message):
+    bridge.N8N_WEBHOOK_URL = "http://test-url"
+    quota = bridge.QuotaCache()
+
+    with patch.object(bridge, "quota_cache", quota), \
+            patch.object(bridge, "QUOTA_ENFORCEMENT", True), \
+            patch.object(bridge, "answer_cache", bridge.AnswerCache()), \
+            patch.object(bridge, "usage_aggregator", bridge.UsageAggregator(spool_path="")), \
+            patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "Answer")) as mock_post:
+        quota.update(987654321, '{"message_limit": 2, "messages_used": 1}')
+        await bridge.on_message(mock_message)
+        await bridge.on_message(mock_message)
+
+    mock_post.assert_called_once()
+    assert quota.over_quota() == ["987654321"]
+    assert quota.rejected["987654321"] == 1
+
+@pytest.mark.asyncio
+async def test_quota_refresh_reads_quota_endpoint_not_guild_sync():
+    quota = bridge.QuotaCache()
+    quota.record(42)
+
+    with patch.object(bridge, "SERVER_QUOTA_URL", "http://quota"), \
+            patch('bridge.guild_sync', new_callable=AsyncMock) as mock_sync, \
+            patch('bridge.post_json', new_callable=AsyncMock,
+                  return_value=(200, '{"message_limit": 10, "messages_used": 4}')) as mock_post:
+        await quota.refresh()
+
+    mock_sync.assert_not_called()
+    assert mock_post.call_args.args[:2] == ("http://quota", {"discord_guild_id": "42"})
+    assert quota.limits["42"] == 10
+
+@pytest.mark.asyncio
+async def test_live_ingest_keeps_latest_edit_and_deletes(mock_message):
+    """Edits to one message collapse to the latest text; deletes win over upserts."""
+    ingest = bridge.LiveIngest(url="http://ingest", flush_interval=60, max_events=1000)
+    mock_message.created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    mock_message.id = 1
+    ingest.upsert(mock_message)
+    mock_message.content = "Hello Gravilo (edited)"
+    ingest.upsert(mock_message)
+    mock_message.id = 2
+    ingest.upsert(mock_message)
+    ingest.delete(987654321, [2, 3])
+
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "")) as mock_post:
+        await ingest.flush()
+
+    payload = mock_post.call_args.args[1]
+    assert payload["mode"] == "live"
+    assert [doc["content"] for doc in payload["messages"]] == ["Hello Gravilo (edited)"]
+    assert payload["messages"][0]["metadata"]["message_ids"] == ["1"]
+    assert datetime.fromisoformat(payload["messages"][0]["metadata"]["ingested_at"]).tzinfo is not None
+    assert sorted(payload["deleted_ids"]) == ["2", "3"]
+    assert ingest.pending_total == 0
+
+@pytest.mark.asyncio
+async def test_live_ingest_retries_failed_batch():
+    ingest = bridge.LiveIngest(url="http://ingest", flush_interval=60, max_events=1000)
+    ingest.delete(987654321, [5])
+
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(503, "busy")):
+        await ingest.flush()
+    assert ingest.pending_total == 1
+
+    with patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "")):
+        await ingest.flush()
+    assert ingest.pending_total == 0
+
+@pytest.mark.asyncio
+async def test_live_ingest_invalidates_cached_answers_after_edits(mock_message):
+    """Edits and deletes drop the guild's cached answers once the ingest is accepted."""
+    ingest = bridge.LiveIngest(url="http://ingest", flush_interval=60, max_events=1000)
+    cache = bridge.AnswerCache(max_entries=10, max_bytes=10_000, ttl=60)
+    cache.put(987654321, "How do I use the file search?", "Use the search tab.")
+    mock_message.created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    mock_message.id = 1
+
+    with patch.object(bridge, "answer_cache", cache):
+        ingest.upsert(mock_message)
+        with patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "")):
+            await ingest.flush()
+        assert cache.get(987654321, "How do I use the file search?") is not None
+
+        ingest.upsert(mock_message, edited=True)
+        with patch('bridge.post_json', new_callable=AsyncMock, return_value=(503, "busy")):
+            await ingest.flush()
+        assert cache.get(987654321, "How do I use the file search?") is not None
+
+        with patch('bridge.post_json', new_callable=AsyncMock, return_value=(200, "")):
+            await ingest.flush()
+        assert cache.get(987654321, "How do I use the file search?") is None
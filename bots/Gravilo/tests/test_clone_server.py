@@ -0,0 +1,293 @@
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clone_server  # noqa: E402
+
+_ids = itertools.count(1000)
+
+
+# Fakes subclass the discord.py types so isinstance checks hold, but keep
+# their state in plain attributes and record every API call on the guild.
+
+class FakeRole(discord.Role):
+    guild = permissions = colour = None
+
+    def __init__(self, guild, name, position, default=False, managed=False, permissions=0):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.position = position
+        self._default = default
+        self._managed = managed
+        self.permissions = discord.Permissions(permissions)
+        self.colour = discord.Colour.default()
+        self.hoist = False
+        self.mentionable = False
+
+    @property
+    def managed(self):
+        return self._managed
+
+    def is_default(self):
+        return self._default
+
+    async def delete(self, reason=None):
+        self.guild.calls.append(("delete_role", self.name))
+        self.guild.roles.remove(self)
+
+    async def edit(self, reason=None, **changes):
+        self.guild.calls.append(("edit_role", self.name, tuple(sorted(changes))))
+        for field, value in changes.items():
+            setattr(self, field, value)
+
+    def __hash__(self):
+        return self.id
+
+
+def _fake_channel(base):
+    class FakeChannel(base):
+        guild = category = category_id = overwrites = topic = nsfw = None
+        slowmode_delay = bitrate = user_limit = None
+
+        def __init__(self, guild, name, position=0, category=None, overwrites=None, topic=None, nsfw=False,
+                     slowmode_delay=0, bitrate=64000, user_limit=0):
+            self.id = next(_ids)
+            self.guild = guild
+            self.name = name
+            self.position = position
+            self.category = category
+            self.category_id = category.id if category else None
+            self.overwrites = dict(overwrites or {})
+            self.topic = topic
+            self.nsfw = nsfw
+            self.slowmode_delay = slowmode_delay
+            self.bitrate = bitrate
+            self.user_limit = user_limit
+
+        async def delete(self, reason=None):
+            self.guild.calls.append(("delete_channel", self.name))
+            self.guild._channels.remove(self)
+
+        async def edit(self, reason=None, **changes):
+            self.guild.calls.append(("edit_channel", self.name, tuple(sorted(changes))))
+            for field, value in changes.items():
+                setattr(self, field, value)
+                if field == "category":
+                    self.category_id = value.id if value else None
+
+        def __hash__(self):
+            return self.id
+
+    return FakeChannel
+
+
+FakeCategory = _fake_channel(discord.CategoryChannel)
+FakeText = _fake_channel(discord.TextChannel)
+FakeVoice = _fake_channel(discord.VoiceChannel)
+FakeStage = _fake_channel(discord.StageChannel)
+
+
+class FakeGuild:
+    bitrate_limit = 96000.0
+
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+        self.calls = []
+        self.failing = set()
+        self._channels = []
+        self.default_role = FakeRole(self, "@everyone", 0, default=True)
+        bot_role = FakeRole(self, "Gravilo", 50, managed=True)
+        self.roles = [self.default_role, bot_role]
+        self.me = SimpleNamespace(roles=[self.default_role, bot_role])
+        self._state = SimpleNamespace(http=SimpleNamespace(bulk_channel_update=self._bulk_channel_update))
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @property
+    def categories(self):
+        return [c for c in self._channels if isinstance(c, discord.CategoryChannel)]
+
+    def get_role(self, role_id):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    def get_channel(self, channel_id):
+        return next((c for c in self._channels if c.id == channel_id), None)
+
+    def add_role(self, name, position, permissions=0):
+        role = FakeRole(self, name, position, permissions=permissions)
+        self.roles.append(role)
+        return role
+
+    def add_channel(self, cls, name, **kwargs):
+        channel = cls(self, name, **kwargs)
+        self._channels.append(channel)
+        return channel
+
+    async def create_role(self, name, permissions, color, hoist, mentionable, reason=None):
+        self.calls.append(("create_role", name))
+        return self.add_role(name, 1, permissions=permissions.value)
+
+    async def edit_role_positions(self, positions, reason=None):
+        self.calls.append(("edit_role_positions", len(positions)))
+        for role, position in positions.items():
+            role.position = position
+
+    async def create_category(self, name, overwrites=None, reason=None):
+        self.calls.append(("create_channel", name))
+        return self.add_channel(FakeCategory, name, overwrites=overwrites)
+
+    async def create_text_channel(self, name, reason=None, **kwargs):
+        self.calls.append(("create_channel", name))
+        if name in self.failing:
+            raise discord.HTTPException(SimpleNamespace(status=429, reason="Too Many Requests"), "rate limited")
+        return self.add_channel(FakeText, name, **kwargs)
+
+    async def create_voice_channel(self, name, reason=None, **kwargs):
+        self.calls.append(("create_channel", name))
+        return self.add_channel(FakeVoice, name, **kwargs)
+
+    async def _bulk_channel_update(self, guild_id, payload, reason=None):
+        self.calls.append(("bulk_channel_update", len(payload)))
+        by_id = {c.id: c for c in self._channels}
+        for entry in payload:
+            by_id[entry["id"]].position = entry["position"]
+
+
+def structure(guild):
+    """Comparable view of a guild: names instead of IDs."""
+    def overwrites(channel):
+        return sorted((role.name, perms.pair()[0].value, perms.pair()[1].value) for role, perms in channel.overwrites.items())
+
+    return {
+        "roles": sorted((r.name, r.position, r.permissions.value) for r in guild.roles if not r.managed),
+        "channels": sorted(
+            (c.name, c.position, c.category.name if c.category else None, c.topic, overwrites(c))
+            for c in guild.channels
+        ),
+    }
+
+
+@pytest.fixture
+def source_guild():
+    guild = FakeGuild("Production")
+    mods = guild.add_role("Mods", 3, permissions=8)
+    guild.add_role("Members", 2, permissions=1024)
+    guild.add_role("New", 1)
+    info = guild.add_channel(FakeCategory, "Info", position=0)
+    talk = guild.add_channel(FakeCategory, "Talk", position=1,
+                             overwrites={guild.default_role: discord.PermissionOverwrite(view_channel=False)})
+    guild.add_channel(FakeText, "rules", position=0, category=info, topic="Read me")
+    guild.add_channel(FakeText, "general", position=1, category=talk, slowmode_delay=5,
+                      overwrites={mods: discord.PermissionOverwrite(manage_messages=True)})
+    guild.add_channel(FakeVoice, "Lounge", position=2, category=talk, bitrate=64000)
+    return guild
+
+
+def test_snapshot_round_trips_through_a_gzipped_file(source_guild, tmp_path):
+    snapshot = clone_server.take_snapshot(source_guild)
+    path = str(tmp_path / "production.json.gz")
+    clone_server.write_snapshot(snapshot, path)
+
+    assert clone_server.read_snapshot(path) == snapshot
+    assert [c["type"] for c in snapshot["channels"]] == ["text", "text", "voice"]
+
+    snapshot["version"] = 99
+    clone_server.write_snapshot(snapshot, path)
+    with pytest.raises(ValueError):
+        clone_server.read_snapshot(path)
+
+
+@pytest.mark.asyncio
+async def test_restore_to_many_guilds_keeps_separate_id_maps(source_guild):
+    snapshot = clone_server.take_snapshot(source_guild)
+    targets = [FakeGuild("Staging"), FakeGuild("Template")]
+    targets[0].add_channel(FakeText, "old-junk")
+
+    jobs = await clone_server.restore(snapshot, targets)
+
+    for target, job in zip(targets, jobs):
+        assert structure(target) == structure(source_guild)
+        assert {role.guild for role in job.roles.values()} == {target}
+        # Hierarchy and channel order each go out in a single bulk call
+        assert sum(1 for call in target.calls if call[0] in ("edit_role_positions", "bulk_channel_update")) == 2
+    assert ("delete_channel", "old-junk") in targets[0].calls
+
+
+@pytest.mark.asyncio
+async def test_sync_applies_only_the_differences(source_guild):
+    snapshot = clone_server.take_snapshot(source_guild)
+    target = FakeGuild("Staging")
+    await clone_server.restore(snapshot, [target])
+
+    # Already in sync: no API calls at all
+    target.calls.clear()
+    await clone_server.CloneJob(snapshot, target).sync()
+    assert target.calls == []
+
+    general = next(c for c in target.channels if c.name == "general")
+    general.topic = "drifted"
+    lounge = next(c for c in target.channels if c.name == "Lounge")
+    lounge.category, lounge.category_id = None, None
+    target.add_role("Stale", 1)
+    target.calls.clear()
+
+    await clone_server.CloneJob(snapshot, target).sync(dry_run=True)
+    assert target.calls == []
+
+    await clone_server.CloneJob(snapshot, target).sync()
+    assert sorted(target.calls) == [
+        ("delete_role", "Stale"),
+        ("edit_channel", "Lounge", ("category",)),
+        ("edit_channel", "general", ("topic",)),
+    ]
+    assert structure(target) == structure(source_guild)
+
+
+@pytest.mark.asyncio
+async def test_sync_leaves_channel_kinds_it_cannot_clone_alone(source_guild):
+    source_guild.add_channel(FakeStage, "Town Hall", position=3)
+    snapshot = clone_server.take_snapshot(source_guild)
+    target = FakeGuild("Staging")
+    await clone_server.restore(snapshot, [target])
+    stage = target.add_channel(FakeStage, "Town Hall", position=3)
+    target.calls.clear()
+
+    await clone_server.CloneJob(snapshot, target).sync()
+    assert target.calls == []
+    assert stage in target.channels
+
+
+@pytest.mark.asyncio
+async def test_resume_only_redoes_unfinished_operations(source_guild, tmp_path):
+    snapshot = clone_server.take_snapshot(source_guild)
+    target = FakeGuild("Staging")
+    target.failing.add("general")
+    journal = clone_server.CloneJournal(str(tmp_path / "journal.db"))
+
+    await clone_server.restore(snapshot, [target], journal=journal)
+    assert target.get_channel(next(iter(journal.ids(target.id, "channel").values()))) is not None
+    assert "general" not in [c.name for c in target.channels]
+
+    # A new process: fresh job, same journal
+    target.failing.clear()
+    target.calls.clear()
+    await clone_server.restore(snapshot, [target], resume=True, journal=journal)
+    assert [call for call in target.calls if not call[0].endswith("positions") and call[0] != "bulk_channel_update"] == [
+        ("create_channel", "general"),
+    ]
+    assert structure(target) == structure(source_guild)
+
+    # Finished jobs are not run again
+    target.calls.clear()
+    await clone_server.restore(snapshot, [target], resume=True, journal=journal)
+    assert target.calls == []
+    journal.close()
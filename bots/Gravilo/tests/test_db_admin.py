@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db_admin  # noqa: E402
+
+# A throwaway Postgres with pgvector, e.g. postgresql://postgres@localhost:5432/postgres
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def test_pending_migrations_skips_applied_and_stops_at_target():
+    versions = [m.version for m in db_admin.MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+    assert db_admin.pending_migrations({}) == db_admin.MIGRATIONS
+    assert [m.version for m in db_admin.pending_migrations({1: "done"})] == versions[1:]
+    assert [m.version for m in db_admin.pending_migrations({}, target=1)] == [1]
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_migrate_and_benchmark_against_postgres():
+    conn = await asyncpg.connect(TEST_DATABASE_URL)
+    try:
+        # Tiny benchmark: also leaves DB Setup-shaped tables to migrate
+        results = await db_admin.benchmark(
+            conn, rows=500, dim=8, clusters=5, queries=5, k=5, hnsw=[(8, 32)], ef_search=[40],
+            ivfflat=[5], probes=[5], delete_samples=2, keep=True,
+        )
+        assert [s["recall"] for s in results["searches"]][0] == 1.0
+        assert all(0 < s["recall"] <= 1 for s in results["searches"])
+        assert set(results["deletes_with_indexes"]) == set(results["deletes_without_indexes"])
+
+        await conn.execute(f"DROP INDEX IF EXISTS {db_admin.BENCH_SCHEMA}.documents_pg_file_id_idx")
+        await db_admin.migrate(conn)
+        indexes = {
+            row["indexname"] for row in await conn.fetch(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = $1", db_admin.BENCH_SCHEMA
+            )
+        }
+        assert {"documents_pg_file_id_idx", "documents_pg_embedding_hnsw_idx"} <= indexes
+        assert db_admin.pending_migrations(await db_admin.applied_versions(conn)) == []
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {db_admin.BENCH_SCHEMA} CASCADE")
+        await conn.close()
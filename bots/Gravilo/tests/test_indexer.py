@@ -0,0 +1,478 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import indexer  # noqa: E402
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+GUILD = SimpleNamespace(id=42, name="Antigravity")
+CHANNEL = SimpleNamespace(id=7, name="general", guild=GUILD)
+
+
+def make_message(message_id, content, minute=0, author="alice", reply_to=None):
+    return SimpleNamespace(
+        id=message_id,
+        content=content,
+        created_at=START + timedelta(minutes=minute),
+        author=SimpleNamespace(name=author, id=hash(author) % 1000, bot=False),
+        reference=SimpleNamespace(message_id=reply_to) if reply_to else None,
+        guild=GUILD,
+        channel=CHANNEL,
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = indexer.CheckpointStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def test_checkpoint_store_only_moves_forward(store):
+    assert store.get(7) is None
+    store.set(42, 7, 100)
+    store.set(42, 7, 90)  # A late, older write never moves it back
+    assert store.get(7) == 100
+
+    store.set(43, 8, 5)
+    store.clear_guild(42)
+    assert store.get(7) is None
+    assert store.get(8) == 5
+
+
+@pytest.mark.parametrize("seconds, text", [(42, "42s"), (125, "2m05s"), (7384, "2h03m")])
+def test_format_duration(seconds, text):
+    assert indexer.format_duration(seconds) == text
+
+
+@pytest.mark.asyncio
+async def test_crawl_keeps_to_the_shared_concurrency_limit(store):
+    running = peak = 0
+
+    async def process(*args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await indexer.asyncio.sleep(0.01)
+        running -= 1
+        return 1, SimpleNamespace(failed=False)
+
+    pipeline = MagicMock()
+    pipeline.drain = AsyncMock(return_value=True)
+    channels = [SimpleNamespace(id=i, name=f"c{i}") for i in range(5)]
+    with patch("indexer.collect_channels", new_callable=AsyncMock, return_value=(channels, True)), \
+            patch("indexer.process_channel", side_effect=process) as processed, \
+            patch("indexer.invalidate_bridge_cache", new_callable=AsyncMock):
+        await indexer.crawl_guild(GUILD, store, pipeline, indexer.asyncio.Semaphore(2))
+
+    assert processed.call_count == 5
+    assert peak == 2
+
+
+def test_channel_cursor_advances_over_contiguous_deliveries(store):
+    cursor = indexer.ChannelCursor(store, 42, 7)
+    first, second, third = cursor.track(1), cursor.track(2), cursor.track(3)
+    cursor.skip(4)
+
+    cursor.delivered(second)
+    assert store.get(7) is None  # 1 is still outstanding
+    cursor.delivered(first)
+    assert store.get(7) == 2
+    cursor.delivered(third)
+    assert store.get(7) == 4  # The skipped message rides along
+
+
+def test_channel_cursor_stops_after_a_failure(store):
+    cursor = indexer.ChannelCursor(store, 42, 7)
+    first, second = cursor.track(1), cursor.track(2)
+    cursor.delivered(first)
+    cursor.fail()
+    cursor.delivered(second)
+    assert store.get(7) == 1
+
+
+def test_windower_groups_bursts_and_follows_replies():
+    windower = indexer.ConversationWindower()
+    closed = []
+    messages = [
+        make_message(1, "how do I index threads?", minute=0),
+        make_message(2, "unrelated announcement", minute=1, author="bob"),
+        make_message(3, "use --full once", minute=2, author="carol", reply_to=1),
+        make_message(4, "much later", minute=30),
+    ]
+    for message in messages:
+        closed += windower.add(message, message.id)
+    closed += windower.flush()
+
+    assert [[m.id for m in w.messages] for w in closed] == [[1, 2, 3], [4]]
+    assert closed[0].entries == [1, 2, 3]
+
+
+def test_windower_starts_a_new_window_when_full():
+    windower = indexer.ConversationWindower()
+    closed = []
+    with patch.object(indexer, "WINDOW_MAX_MESSAGES", 2):
+        for i in range(5):
+            closed += windower.add(make_message(i, f"message {i}", minute=i), i)
+    closed += windower.flush()
+    assert [len(w.messages) for w in closed] == [2, 2, 1]
+
+
+def test_reply_to_an_unknown_message_starts_its_own_window():
+    windower = indexer.ConversationWindower()
+    windower.add(make_message(1, "first topic"), 1)
+    windower.add(make_message(2, "answering something older", minute=1, reply_to=99), 2)
+    assert [[m.id for m in w.messages] for w in windower.flush()] == [[1], [2]]
+
+
+def test_simhash_is_close_for_near_duplicates():
+    a = indexer.simhash(indexer.normalize_text("Thanks so much!!"))
+    b = indexer.simhash(indexer.normalize_text("thanks so much"))
+    c = indexer.simhash(indexer.normalize_text("the bridge crashed again"))
+    assert a == b
+    assert bin(a ^ c).count("1") > indexer.NEAR_DUPLICATE_BITS
+
+
+def test_deduplicator_drops_repeated_short_messages_only():
+    dedup = indexer.Deduplicator()
+    assert not dedup.is_duplicate("thanks!")
+    assert dedup.is_duplicate("Thanks")
+    assert not dedup.is_duplicate("the bridge crashed again")
+
+    long_text = "a longer message that explains the same thing in enough words " * 2
+    assert not dedup.is_duplicate(long_text)
+    assert not dedup.is_duplicate(long_text)
+    assert dedup.dropped == 1
+
+
+def test_content_hash_covers_text_and_sources():
+    base = indexer.content_hash("hello", ["1", "2"])
+    assert base == indexer.content_hash("hello", ["1", "2"])
+    assert base != indexer.content_hash("hello!", ["1", "2"])
+    assert base != indexer.content_hash("hello", ["1", "3"])
+
+
+def test_build_document_renders_a_window():
+    messages = [make_message(1, "question?"), make_message(2, "answer", minute=1, author="bob")]
+    doc = indexer.build_document(messages, CHANNEL)
+
+    assert doc["content"] == "alice: question?\nbob: answer"
+    assert doc["metadata"]["message_ids"] == ["1", "2"]
+    assert doc["metadata"]["authors"] == ["alice", "bob"]
+    assert doc["metadata"]["content_hash"] == indexer.content_hash(doc["content"], ["1", "2"])
+    assert doc["metadata"]["lines"] == [["1", "alice: question?"], ["2", "bob: answer"]]
+    assert "lines" not in indexer.build_document(messages[:1], CHANNEL)["metadata"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("complete, cursor_failed, delivered, rejected, pruned", [
+    (True, False, True, False, True),
+    (False, False, True, False, False),  # A thread list could not be read
+    (True, True, True, False, False),  # A channel stopped early
+    (True, False, False, False, False),  # Batches still in the spool
+    (True, False, True, True, False),  # The webhook rejected a batch
+])
+async def test_rebuild_only_prunes_after_a_complete_run(store, complete, cursor_failed, delivered, rejected, pruned):
+    pipeline = MagicMock()
+    pipeline.drain = AsyncMock(return_value=delivered)
+    pipeline.rejected_servers = {"42"} if rejected else set()
+    cursor = SimpleNamespace(failed=cursor_failed)
+
+    with patch("indexer.collect_channels", new_callable=AsyncMock, return_value=([CHANNEL], complete)), \
+            patch("indexer.process_channel", new_callable=AsyncMock, return_value=(3, cursor)) as process, \
+            patch("indexer.prune_guild", new_callable=AsyncMock) as prune, \
+            patch("indexer.invalidate_bridge_cache", new_callable=AsyncMock):
+        await indexer.crawl_guild(GUILD, store, pipeline, indexer.asyncio.Semaphore(2), mode="rebuild")
+
+    assert prune.called == pruned
+    if pruned:
+        since, started = prune.call_args.args[2:]
+        assert since.tzinfo is not None
+        assert started > since
+        assert process.call_args.args[3] == since  # Channels are read from the same cutoff
+
+
+@pytest.mark.asyncio
+async def test_incremental_run_never_prunes(store):
+    pipeline = MagicMock()
+    pipeline.drain = AsyncMock(return_value=True)
+    pipeline.rejected_servers = set()
+
+    with patch("indexer.collect_channels", new_callable=AsyncMock, return_value=([CHANNEL], True)), \
+            patch("indexer.process_channel", new_callable=AsyncMock, return_value=(3, SimpleNamespace(failed=False))), \
+            patch("indexer.prune_guild", new_callable=AsyncMock) as prune, \
+            patch("indexer.invalidate_bridge_cache", new_callable=AsyncMock):
+        await indexer.crawl_guild(GUILD, store, pipeline, indexer.asyncio.Semaphore(2))
+
+    prune.assert_not_called()
+
+
+class FakeHistoryChannel(SimpleNamespace):
+    def history(self, **kwargs):
+        async def messages():
+            for message in self.messages:
+                yield message
+        return messages()
+
+
+class RecordingPipeline:
+    def __init__(self):
+        self.docs = []
+
+    async def put(self, doc, cursor, entries, mode="upsert"):
+        self.docs.append(doc)
+        for entry in entries:
+            cursor.delivered(entry)
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_dropped_per_channel(store):
+    """Each channel keeps its own first copy, whatever order channels are crawled in."""
+    since = START - timedelta(days=1)
+    channels = [
+        FakeHistoryChannel(id=cid, name=f"c{cid}", guild=GUILD, messages=[
+            make_message(cid * 10 + 1, "thanks!", minute=0),
+            make_message(cid * 10 + 2, "Thanks", minute=60),
+        ])
+        for cid in (1, 2)
+    ]
+
+    for order in (channels, channels[::-1]):
+        pipeline = RecordingPipeline()
+        for channel in order:
+            await indexer.process_channel(channel, store, pipeline, since, mode="rebuild")
+        kept = sorted(doc["metadata"]["message_ids"] for doc in pipeline.docs)
+        assert kept == [["11"], ["21"]]
+    assert store.get(1) == 12  # The dropped copy still moves the checkpoint
+
+
+@pytest.mark.asyncio
+async def test_prune_is_limited_to_the_crawled_window():
+    pipeline = MagicMock(run_id="run-1")
+    pipeline.send_now = AsyncMock(return_value=True)
+    await indexer.prune_guild(pipeline, GUILD, START - timedelta(days=1), START)
+
+    payload = pipeline.send_now.call_args.args[0]
+    assert payload["prune"] is True
+    assert payload["since"] == (START - timedelta(days=1)).isoformat()
+    assert payload["started_at"] == START.isoformat()
+
+
+def workflow_query(name):
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "workflows", "Gravilo Ingest Discord.json")
+    with open(path, encoding="utf-8") as f:
+        nodes = {node["name"]: node for node in json.load(f)["nodes"]}
+    return nodes[name]["parameters"]["query"]
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_live_edits_rebuild_windows_instead_of_deleting_them():
+    """Runs the workflow's live-ingest SQL against documents_pg (DB Setup schema)."""
+    asyncpg = pytest.importorskip("asyncpg")
+    window = indexer.build_document(
+        [make_message(1, "question?"), make_message(2, "typo", minute=1, author="bob"),
+         make_message(3, "thanks", minute=2)], CHANNEL)
+    single = indexer.build_document([make_message(4, "standalone")], CHANNEL)
+    server_id = window["metadata"]["server_id"]
+
+    conn = await asyncpg.connect(os.environ["TEST_DATABASE_URL"])
+    try:
+        async with conn.transaction():
+            for doc in (window, single):
+                await conn.execute("INSERT INTO documents_pg (text, metadata) VALUES ($1, $2::jsonb)",
+                                   doc["content"], json.dumps(doc["metadata"]))
+            # The bridge reports an edit of message 2 and a delete of message 4
+            await conn.execute(workflow_query("Delete Replaced Discord Messages"), server_id, "2,4", "", "live")
+            rows = await conn.fetch(workflow_query("Rebuild Edited Windows"), server_id, "live",
+                                    json.dumps({"2": "bob: answer"}), "4")
+            left = await conn.fetch("SELECT 1 FROM documents_pg WHERE metadata->>'server_id' = $1", server_id)
+            raise RuntimeError("roll back")
+    except RuntimeError:
+        pass
+    finally:
+        await conn.close()
+
+    # The standalone message is gone and the window is handed on for re-embedding
+    assert left == []
+    (rebuilt,) = rows
+    metadata = json.loads(rebuilt["metadata"])
+    assert rebuilt["content"] == "alice: question?\nbob: answer\nalice: thanks"
+    assert metadata["message_ids"] == ["1", "2", "3"]
+    assert metadata["content_hash"] == indexer.content_hash(rebuilt["content"], ["1", "2", "3"])
+    assert metadata["index_run"] == "live"  # So a rebuild already under way keeps it
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+@pytest.mark.asyncio
+async def test_prune_keeps_live_documents_ingested_during_the_crawl():
+    asyncpg = pytest.importorskip("asyncpg")
+    seen = indexer.build_document([make_message(1, "seen by the crawl")], CHANNEL)
+    gone = indexer.build_document([make_message(2, "deleted before the crawl")], CHANNEL)
+    early = indexer.build_document([make_message(3, "ingested live before the crawl")], CHANNEL)
+    late = indexer.build_document([make_message(4, "posted during the crawl", minute=30)], CHANNEL)
+    seen["metadata"]["index_run"] = "run-1"
+    gone["metadata"]["index_run"] = "run-0"
+    for doc, ingested in ((early, START), (late, START + timedelta(minutes=30))):
+        doc["metadata"].update(index_run="live", ingested_at=ingested.isoformat())
+    server_id = seen["metadata"]["server_id"]
+
+    conn = await asyncpg.connect(os.environ["TEST_DATABASE_URL"])
+    try:
+        async with conn.transaction():
+            for doc in (seen, gone, early, late):
+                await conn.execute("INSERT INTO documents_pg (text, metadata) VALUES ($1, $2::jsonb)",
+                                   doc["content"], json.dumps(doc["metadata"]))
+            await conn.execute(workflow_query("Delete Missing Discord Messages"), server_id, "run-1",
+                               START - timedelta(days=1), START + timedelta(minutes=10))
+            left = await conn.fetch("SELECT text FROM documents_pg WHERE metadata->>'server_id' = $1 "
+                                    "ORDER BY text", server_id)
+            raise RuntimeError("roll back")
+    except RuntimeError:
+        pass
+    finally:
+        await conn.close()
+
+    assert [row["text"] for row in left] == [late["content"], seen["content"]]
+
+
+def batch(run_id, n, server_id="42"):
+    return {"server_id": server_id, "mode": "upsert", "run_id": run_id,
+            "messages": [{"content": f"message {n} " + os.urandom(64).hex()}]}
+
+
+def test_spool_frames_records_across_segments(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path), segment_bytes=300)
+    payloads = [batch("r1", n) for n in range(6)]
+    assert [spool.append(p) for p in payloads] == list(range(6))
+    spool.close()
+
+    reopened = indexer.IngestSpool(str(tmp_path), segment_bytes=300)
+    assert len({path for path, _ in reopened.index.values()}) > 1
+    assert reopened.offsets() == list(range(6))
+    assert reopened.next_offset == 6
+    assert [reopened.read(o) for o in reopened.offsets(2, 3)] == payloads[2:4]
+
+
+def test_spool_truncates_a_torn_tail(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path))
+    spool.append(batch("r1", 0))
+    spool.append(batch("r1", 1))
+    path = spool._last_segment
+    size = os.path.getsize(path)
+    spool.close()
+    with open(path, "ab") as f:  # A crash after writing half a record
+        f.write(indexer.IngestSpool.HEADER.pack(2, 500) + b"partial")
+
+    reopened = indexer.IngestSpool(str(tmp_path))
+    assert os.path.getsize(path) == size
+    assert reopened.offsets() == [0, 1]
+    assert reopened.append(batch("r1", 2)) == 2
+    assert reopened.read(2)["messages"][0]["content"].startswith("message 2")
+
+
+def test_spool_committed_marker_only_moves_forward(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path))
+    for n in range(3):
+        spool.append(batch("r1", n))
+    spool.note_delivered(0, "42", "r1")
+    spool.note_delivered(1, "42", "r1")
+    spool.commit(1)
+    spool.commit(0)
+    spool.close()
+
+    reopened = indexer.IngestSpool(str(tmp_path))
+    assert reopened.committed == 1
+    assert reopened.runs == {"42": {"run_id": "r1", "first": 0, "last": 1}}
+
+
+def test_spool_compaction_keeps_each_guilds_last_run(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path), segment_bytes=1)  # One record per segment
+    runs = ["r1", "r1", "r2", "r2", "r3"]
+    for offset, run_id in enumerate(runs):
+        spool.append(batch(run_id, offset))
+    for offset, run_id in enumerate(runs[:4]):
+        spool.note_delivered(offset, "42", run_id)
+    spool.commit(3)
+
+    assert spool.compact() == 2
+    assert spool.offsets() == [2, 3, 4]  # r2 may still be replayed; offset 4 is not delivered
+    spool.close()
+    assert indexer.IngestSpool(str(tmp_path)).next_offset == 5
+
+
+@pytest.mark.asyncio
+async def test_replay_pending_delivers_and_commits(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path))
+    for n in range(3):
+        spool.append(batch("r1", n))
+    spool.commit(0)
+
+    with patch.object(indexer, "N8N_INGEST_WEBHOOK_URL", "http://n8n.test/hook"), \
+            patch.object(indexer.IngestPipeline, "deliver", new_callable=AsyncMock, return_value=True) as deliver:
+        await indexer.replay(pending=True, spool=spool)
+
+    assert [c.args[0] for c in deliver.call_args_list] == [spool.read(1), spool.read(2)]
+    assert indexer.IngestSpool(str(tmp_path)).committed == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_range_refuses_batches_older_than_the_last_run(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path))
+    runs = [("r1", "42"), ("r2", "42"), ("r1", "43"), ("r3", "42")]
+    for offset, (run_id, server_id) in enumerate(runs):
+        spool.append(batch(run_id, offset, server_id))
+    for offset, (run_id, server_id) in enumerate(runs[:3]):
+        spool.note_delivered(offset, server_id, run_id)
+    spool.commit(2)  # Offset 3 is still pending
+
+    with patch.object(indexer.IngestPipeline, "deliver", new_callable=AsyncMock, return_value=True) as deliver:
+        await indexer.replay(start=0, spool=spool)
+
+    sent = [(c.args[0]["run_id"], c.args[0]["server_id"]) for c in deliver.call_args_list]
+    assert sorted(sent) == [("r1", "43"), ("r2", "42")]
+    assert indexer.IngestSpool(str(tmp_path)).committed == 2
+
+
+@pytest.mark.asyncio
+async def test_dry_run_moves_no_checkpoint_and_keeps_the_spool(store, tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path / "spool"), segment_bytes=1)
+    for n in range(2):  # Left over from an earlier run
+        spool.append(batch("r1", n))
+    pipeline = indexer.IngestPipeline(url="", spool=spool)
+    await pipeline.start()
+
+    cursor = indexer.ChannelCursor(store, 42, 7)
+    await pipeline.put(indexer.build_document([make_message(1, "hello")], CHANNEL), cursor, [cursor.track(1)])
+    assert await pipeline.drain("42", timeout=5)
+    await pipeline.close()
+
+    assert store.get(7) is None
+    reopened = indexer.IngestSpool(str(tmp_path / "spool"))
+    assert reopened.offsets() == [0, 1]
+    assert reopened.committed == -1
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_is_neither_committed_nor_compacted(tmp_path):
+    spool = indexer.IngestSpool(str(tmp_path), segment_bytes=1)  # One record per segment
+    for n, run_id in enumerate(["r0", "r1", "r2"]):
+        spool.append(batch(run_id, n))
+    pipeline = indexer.IngestPipeline(url="http://n8n.test/hook", spool=spool)
+
+    with patch.object(indexer.IngestPipeline, "deliver", new_callable=AsyncMock,
+                      side_effect=lambda payload: payload["run_id"] != "r1"):
+        await pipeline.start()
+        assert await pipeline.drain(timeout=5)
+        await pipeline.close()
+
+    reopened = indexer.IngestSpool(str(tmp_path))
+    assert reopened.committed == 0
+    assert reopened.offsets() == [1, 2]  # Both are sent again on the next run